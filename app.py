@@ -1,11 +1,23 @@
 import os
+import json
+import time
+import uuid
+import hashlib
 import logging
-from flask import Flask, render_template, request, jsonify, session
+from functools import partial
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, g
 from werkzeug.utils import secure_filename
-from utils.pdf_processor import process_pdf, get_answer_from_pdf
-from openai import RateLimitError
+from werkzeug.exceptions import RequestEntityTooLarge
+from utils.pdf_processor import (
+    process_pdf, get_answer_from_pdf, get_answer_from_pdfs, get_answers_from_pdf, stream_answer_from_pdf,
+    get_document_handles
+)
+from utils.answering import invalidate_answers
+from utils.vector_store import get_vector_store
 from dotenv import load_dotenv
-from utils.chroma_store import ChromaStore
+from utils.jobs import JobManager
+from utils.chunked_uploads import ChunkedUploadStore, UploadError, UPLOAD_PART_SIZE, copy_stream
+from utils import metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -27,26 +39,174 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_CONTENT_LENGTH", 10 * 1024 * 1024))  # Default: 10MB
+MAX_BATCH_QUESTIONS = int(os.environ.get("MAX_BATCH_QUESTIONS", 500))
 
-# Initialize ChromaStore
-chroma_store = ChromaStore()
+# Background ingestion jobs
+ingestion_jobs = JobManager()
 
-# Global variable to store the index
-current_index = None
+# Resumable uploads of files larger than one request; each part must fit in a request
+chunked_uploads = ChunkedUploadStore(
+    os.path.join(UPLOAD_FOLDER, ".chunked"),
+    part_size=min(UPLOAD_PART_SIZE, app.config['MAX_CONTENT_LENGTH'])
+)
 
 # Check if file has an allowed extension
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _document_path(doc_id):
+    """Path of a document in the upload folder; documents stored before hashing keep their file name"""
+    file_name = doc_id if doc_id.lower().endswith('.pdf') else f"{doc_id}.pdf"
+    return os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+
+def _save_upload(file):
+    """
+    Stream an uploaded file to a temporary path in the upload folder, hashing it on the way
+    
+    Raises:
+    UploadError: With status 413 as soon as the file exceeds MAX_CONTENT_LENGTH; nothing is kept
+    
+    Returns:
+    tuple: (temporary path, SHA-256 hex digest)
+    """
+    digest = hashlib.sha256()
+    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f".upload-{uuid.uuid4().hex}.part")
+    try:
+        with open(temp_path, 'wb') as out:
+            size = copy_stream(file.stream, out, app.config['MAX_CONTENT_LENGTH'], digest)
+    except BaseException:
+        # The file may never have been created; keep the original exception
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    logger.info(f"File size: {size} bytes ({size / (1024 * 1024):.2f} MB)")
+    return temp_path, digest.hexdigest()
+
+def _delete_document(doc_id):
+    """Delete a document's embeddings, cached handle and answers, and its stored file"""
+    get_vector_store().delete_file_data(doc_id)
+    get_document_handles().invalidate(doc_id)
+    invalidate_answers(doc_id)
+    file_path = _document_path(doc_id)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+        logger.info(f"Deleted PDF file: {file_path}")
+
+def _point_alias(file_name, doc_id):
+    """Point a file name at a document, deleting the document it replaced if nothing else refers to it"""
+    vector_store = get_vector_store()
+    previous_doc_id = vector_store.add_alias(file_name, doc_id)
+    if previous_doc_id and vector_store.catalog.alias_count(previous_doc_id) == 0:
+        logger.info(f"{file_name} now refers to {doc_id}; deleting unreferenced document {previous_doc_id}")
+        _delete_document(previous_doc_id)
+
+@app.before_request
+def start_request_trace():
+    g.trace = metrics.start_trace()
+    g.trace_started = time.perf_counter()
+
+@app.after_request
+def finish_request_trace(response):
+    """Log the stage timings of the request at debug level, after the body of a streamed response"""
+    spans = g.pop('trace', None)
+    if spans is not None:
+        label = f"{request.method} {request.path} {response.status_code}"
+        started = g.trace_started
+        if response.is_streamed:
+            response.call_on_close(lambda: metrics.finish_trace(spans, label, started))
+        else:
+            metrics.finish_trace(spans, label, started)
+    return response
+
 # Routes
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """Report requests over MAX_CONTENT_LENGTH as JSON, like every other upload error"""
+    limit = app.config['MAX_CONTENT_LENGTH']
+    logger.error(f"Request larger than {limit} bytes rejected")
+    return jsonify({
+        'error': f'File too large. Maximum size is {limit / (1024 * 1024):.1f}MB',
+        'status': 'error'
+    }), 413
+
+@app.errorhandler(UploadError)
+def upload_error(e):
+    logger.error(f"Upload rejected: {str(e)}")
+    return jsonify({'error': str(e), 'status': 'error', **e.details}), e.status
+
+def _accept_upload(filename, temp_path, doc_id):
+    """
+    Store a received file under its doc_id and queue its ingestion, unless its content is already known
+    
+    Parameters:
+    filename (str): Secured file name the document is listed under
+    temp_path (str): Temporary path of the received file in the upload folder
+    doc_id (str): SHA-256 of the file's content
+    
+    Returns:
+    tuple: (response, status code)
+    """
+    filepath = _document_path(doc_id)
+    logger.info(f"File {filename} saved with doc_id {doc_id}")
+    
+    # Store the document in session so questions can be asked once it is ready
+    session['current_doc_id'] = doc_id
+    
+    # Identical content was already ingested: serve it under the new name right away
+    if get_vector_store().embeddings_exist(doc_id):
+        os.remove(temp_path)
+        _point_alias(filename, doc_id)
+        logger.info(f"Duplicate upload of {doc_id} recorded as alias {filename}")
+        return jsonify({
+            'success': True,
+            'message': 'PDF already processed',
+            'doc_id': doc_id,
+            'duplicate': True,
+            'status': 'completed'
+        }), 200
+    
+    # Identical content is being ingested right now: follow that job
+    active_job = ingestion_jobs.find_active(doc_id)
+    if active_job:
+        os.remove(temp_path)
+        _point_alias(filename, doc_id)
+        return jsonify({
+            'success': True,
+            'message': 'PDF already queued for processing',
+            'doc_id': doc_id,
+            'job_id': active_job.id,
+            'status': active_job.status
+        }), 202
+    
+    os.replace(temp_path, filepath)
+    
+    # A new version of a known file name only needs its changed chunks embedded
+    base_doc_id = get_vector_store().resolve_alias(filename)
+    
+    # Process PDF in the background and let the client poll for progress
+    job = ingestion_jobs.submit(
+        filename,
+        filepath,
+        partial(_ingest_pdf, doc_id=doc_id, file_name=filename, base_doc_id=base_doc_id),
+        on_error=_cleanup_failed_upload,
+        doc_id=doc_id
+    )
+    logger.info(f"Queued ingestion job {job.id} for {filepath}")
+    
+    return jsonify({
+        'success': True,
+        'message': 'PDF queued for processing',
+        'doc_id': doc_id,
+        'job_id': job.id,
+        'status': job.status
+    }), 202
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    global current_index
-    
     # Check if the post request has the file part
     if 'pdfFile' not in request.files:
         logger.error("No file part in request")
@@ -64,63 +224,18 @@ def upload_file():
         try:
             logger.info(f"Processing file: {file.filename}")
             
-            # First, validate the file size
-            file_size = len(file.read())
-            file.seek(0)  # Reset file pointer
-            
-            logger.info(f"File size: {file_size} bytes ({file_size / (1024 * 1024):.2f} MB)")
-            
-            if file_size > app.config['MAX_CONTENT_LENGTH']:
-                logger.error(f"File too large: {file_size} bytes ({file_size / (1024 * 1024):.2f} MB)")
-                return jsonify({
-                    'error': f'File too large. Maximum size is {app.config["MAX_CONTENT_LENGTH"] / (1024 * 1024):.1f}MB',
-                    'status': 'error'
-                }), 400
-            
-            # Save the file temporarily
+            # Stream the file to disk, enforcing the size limit and using its SHA-256 as the document identity
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            logger.info(f"File saved to: {filepath}")
-            
-            try:
-                # Process PDF and create index
-                logger.info("Starting PDF processing...")
-                index = process_pdf(filepath)
-                logger.info("PDF processed successfully")
-                
-                # Store the filepath in session and index in global variable
-                session['current_pdf_path'] = filepath
-                print ("index on upload", index)
-                current_index = index
-                logger.info("PDF path and index stored")
-                
-                return jsonify({
-                    'success': True, 
-                    'message': 'PDF processed successfully',
-                    'status': 'completed'
-                })
-            except RateLimitError as e:
-                logger.error(f"Rate limit error: {str(e)}")
-                # Clean up the file if processing fails
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                return jsonify({
-                    'error': 'OpenAI API quota exceeded. Please try again later or check your billing details.',
-                    'status': 'rate_limit'
-                }), 429
-            except Exception as e:
-                logger.error(f"Error processing PDF: {str(e)}")
-                # Clean up the file if processing fails
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                raise e
-                
+            temp_path, doc_id = _save_upload(file)
+            return _accept_upload(filename, temp_path, doc_id)
+        
+        except UploadError:
+            raise
         except Exception as e:
             logger.error(f"Error processing PDF: {str(e)}")
             # Clean up any temporary files
-            if 'filepath' in locals() and os.path.exists(filepath):
-                os.remove(filepath)
+            if 'temp_path' in locals() and os.path.exists(temp_path):
+                os.remove(temp_path)
             return jsonify({
                 'error': f'Error processing PDF: {str(e)}',
                 'status': 'error'
@@ -132,11 +247,149 @@ def upload_file():
             'status': 'error'
         }), 400
 
+@app.route('/uploads', methods=['POST'])
+def create_chunked_upload():
+    """Start a resumable upload: {"file_name": ..., "size": bytes, "sha256": optional hex digest}"""
+    data = request.get_json(silent=True) or {}
+    file_name = data.get('file_name')
+    if not isinstance(file_name, str) or not allowed_file(file_name) or not secure_filename(file_name):
+        logger.error(f"Invalid file type: {file_name}")
+        return jsonify({'error': 'File type not allowed. Please upload a PDF.', 'status': 'error'}), 400
+    upload = chunked_uploads.create(secure_filename(file_name), data.get('size'), data.get('sha256'))
+    return jsonify(upload), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Parts received so far, so an interrupted client sends only the missing ones"""
+    return jsonify(chunked_uploads.status(upload_id))
+
+@app.route('/uploads/<upload_id>/parts/<int:index>', methods=['PUT'])
+def put_upload_part(upload_id, index):
+    """Store one part, sent as the raw request body; X-Part-SHA256 optionally carries its checksum"""
+    status = chunked_uploads.write_part(upload_id, index, request.stream, request.headers.get('X-Part-SHA256'))
+    return jsonify(status)
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Join the parts and ingest the file like a single-request upload"""
+    filename, temp_path, doc_id = chunked_uploads.complete(upload_id, app.config['UPLOAD_FOLDER'])
+    try:
+        return _accept_upload(filename, temp_path, doc_id)
+    except Exception as e:
+        logger.error(f"Error processing PDF: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return jsonify({
+            'error': f'Error processing PDF: {str(e)}',
+            'status': 'error'
+        }), 500
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    chunked_uploads.abort(upload_id)
+    return jsonify({'message': 'Upload aborted'})
+
+def _ingest_pdf(file_path, doc_id, file_name, base_doc_id=None, progress=None):
+    """Ingest a PDF, record its file name alias and resolve its retrieval handle"""
+    stats = process_pdf(file_path, doc_id=doc_id, file_name=file_name, progress=progress, base_doc_id=base_doc_id)
+    _point_alias(file_name, doc_id)
+    get_document_handles().get(doc_id)
+    return stats
+
+def resolve_documents(documents, session_doc_id):
+    """
+    Resolve the retrieval handle for a question, from the request's documents or the session
+    
+    A request may name several PDFs with "documents": ["a.pdf", "b.pdf"], or search
+    every stored PDF with "documents": "all". Without it the PDF in the session is used.
+    Shared by the Flask routes and the async routes in asgi.py.
+    
+    Parameters:
+    documents (list or str): The request's "documents" value, or None
+    session_doc_id (str): doc_id of the PDF selected in the session, or None
+    
+    Returns:
+    tuple: (handle, is_multi_document, None) or (None, None, (error payload, status code))
+    """
+    if documents is None:
+        if not session_doc_id:
+            logger.error("No document in session")
+            return None, None, ({'error': 'No PDF content available. Please upload a PDF first.'}, 400)
+        document = get_document_handles().get(session_doc_id)
+        if not document:
+            logger.error(f"No embeddings stored for {session_doc_id}")
+            return None, None, ({'error': 'PDF is not ready yet. Please wait for processing to finish.'}, 409)
+        return document, False, None
+    
+    if documents == 'all':
+        handle, _ = get_document_handles().get_set()
+        return handle, True, None
+    
+    if not isinstance(documents, list) or not documents or not all(isinstance(name, str) for name in documents):
+        return None, None, ({'error': 'documents must be "all" or a non-empty list of file names'}, 400)
+    
+    doc_ids = {}
+    unknown = []
+    for file_name in documents:
+        doc_id = get_vector_store().resolve_alias(file_name)
+        if doc_id:
+            doc_ids[doc_id] = file_name
+        else:
+            unknown.append(file_name)
+    if unknown:
+        return None, None, ({'error': 'PDFs not found', 'documents': unknown}, 404)
+    
+    handle, missing = get_document_handles().get_set(list(doc_ids))
+    if missing:
+        not_ready = [doc_ids[doc_id] for doc_id in missing]
+        return None, None, ({'error': 'PDFs are not ready yet', 'documents': not_ready}, 409)
+    return handle, True, None
+
+def validate_batch_questions(questions):
+    """Return an error message if a batch of questions is invalid, else None"""
+    if not isinstance(questions, list) or not questions:
+        logger.error("No questions provided")
+        return 'No questions provided'
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return f'At most {MAX_BATCH_QUESTIONS} questions per batch'
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        return 'Every question must be a non-empty string'
+    return None
+
+def _requested_documents(data):
+    """
+    Resolve the retrieval handle for a question in a Flask request
+    
+    Returns:
+    tuple: (handle, is_multi_document, None) or (None, None, error response)
+    """
+    document, multi_document, error = resolve_documents(data.get('documents'), session.get('current_doc_id'))
+    if error:
+        payload, status = error
+        return None, None, (jsonify(payload), status)
+    return document, multi_document, None
+
+def _cleanup_failed_upload(job, error):
+    """Remove the uploaded file of a failed ingestion job"""
+    from openai import RateLimitError
+    if isinstance(error, RateLimitError):
+        job.error = 'OpenAI API quota exceeded. Please try again later or check your billing details.'
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
+        logger.info(f"Removed file of failed job: {job.file_path}")
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/ask', methods=['POST'])
 def ask_question():
-    global current_index
-    
     data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON body'}), 400
     question = data.get('question')
     
     logger.info(f"Received question: {question}")
@@ -145,22 +398,18 @@ def ask_question():
         logger.error("No question provided")
         return jsonify({'error': 'No question provided'}), 400
     
-    # Get the PDF path from session
-    pdf_path = session.get('current_pdf_path')
-    if not pdf_path:
-        logger.error("No PDF path in session")
-        return jsonify({'error': 'No PDF content available. Please upload a PDF first.'}), 400
+    # Get the retrieval handle of the requested PDFs, or of the PDF in the session
+    document, multi_document, error_response = _requested_documents(data)
+    if error_response:
+        return error_response
     
     try:
-        logger.info(f"PDF path from session: {pdf_path}")
-        file_name = os.path.basename(pdf_path)
+        if multi_document:
+            logger.info("Getting answer across PDFs...")
+            return jsonify(get_answer_from_pdfs(question, document))
         
-        current_index = process_pdf(pdf_path)
-        logger.info("Index recreated successfully")
-        
-        # Get answer using the index and file name
         logger.info("Getting answer from PDF...")
-        answer = get_answer_from_pdf(question, current_index, file_name)
+        answer = get_answer_from_pdf(question, document)
         logger.info("Answer generated successfully")
         
         return jsonify({'answer': answer})
@@ -169,10 +418,66 @@ def ask_question():
         logger.error(f"Error getting answer: {str(e)}")
         return jsonify({'error': f'Error getting answer: {str(e)}'}), 500
 
+@app.route('/ask-batch', methods=['POST'])
+def ask_questions_batch():
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON body'}), 400
+    questions = data.get('questions')
+    
+    error = validate_batch_questions(questions)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    logger.info(f"Received batch of {len(questions)} questions")
+    
+    document, _, error_response = _requested_documents(data)
+    if error_response:
+        return error_response
+    
+    try:
+        results = get_answers_from_pdf(questions, document)
+        return jsonify({'results': results})
+        
+    except Exception as e:
+        logger.error(f"Error getting answers: {str(e)}")
+        return jsonify({'error': f'Error getting answers: {str(e)}'}), 500
+
+@app.route('/ask-stream', methods=['POST'])
+def ask_question_stream():
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON body'}), 400
+    question = data.get('question')
+    
+    logger.info(f"Received streaming question: {question}")
+    
+    if not question:
+        logger.error("No question provided")
+        return jsonify({'error': 'No question provided'}), 400
+    
+    document, _, error_response = _requested_documents(data)
+    if error_response:
+        return error_response
+    
+    def generate():
+        try:
+            for event in stream_answer_from_pdf(question, document):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/list-pdfs', methods=['GET'])
 def list_pdfs():
     try:
-        pdfs = chroma_store.list_available_pdfs()
+        pdfs = get_vector_store().list_available_pdfs()
         return jsonify(pdfs)
     except Exception as e:
         logger.error(f"Error listing PDFs: {str(e)}")
@@ -186,26 +491,21 @@ def load_pdf():
             logger.error("No file name provided")
             return jsonify({'error': 'No file name provided'}), 400
         
-        # Check if file exists
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-        if not os.path.exists(file_path):
-            logger.error(f"PDF file not found: {file_path}")
+        # Resolve the file name to the document it refers to
+        doc_id = get_vector_store().resolve_alias(file_name)
+        if not doc_id:
+            logger.error(f"PDF not found: {file_name}")
             return jsonify({'error': 'PDF file not found'}), 404
         
-        # Store file path in session
-        session['current_pdf_path'] = file_path
-        logger.info(f"PDF loaded into session: {file_name}")
+        # Resolve the retrieval handle once; later questions reuse it
+        if not get_document_handles().get(doc_id):
+            logger.error(f"PDF is still being processed: {file_name}")
+            return jsonify({'error': 'PDF is not ready yet. Please wait for processing to finish.'}), 409
         
-        # Process PDF and create index
-        try:
-            logger.info("Processing PDF...")
-            current_index = process_pdf(file_path)
-            logger.info("PDF processed successfully")
-            return jsonify({'message': 'PDF loaded successfully'})
-            
-        except Exception as e:
-            logger.error(f"Error processing PDF: {str(e)}")
-            return jsonify({'error': str(e)}), 500
+        # Store document in session
+        session['current_doc_id'] = doc_id
+        logger.info(f"PDF loaded into session: {file_name} ({doc_id})")
+        return jsonify({'message': 'PDF loaded successfully', 'doc_id': doc_id})
             
     except Exception as e:
         logger.error(f"Error loading PDF: {str(e)}")
@@ -219,25 +519,32 @@ def delete_pdf():
             logger.error("No file name provided")
             return jsonify({'error': 'No file name provided'}), 400
         
-        # Delete from ChromaDB
-        chroma_store.delete_file_data(file_name)
-        logger.info(f"Deleted PDF data from ChromaDB: {file_name}")
-        
-        # Delete the file if it exists
-        file_path = os.path.join('uploads', file_name)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Deleted PDF file: {file_path}")
+        doc_id = get_vector_store().resolve_alias(file_name)
+        if not doc_id:
+            logger.error(f"PDF not found: {file_name}")
+            return jsonify({'error': 'PDF file not found'}), 404
         
-        # Clear session if the deleted file was the current one
-        if session.get('current_pdf_path') == file_path:
-            session.pop('current_pdf_path', None)
-            logger.info("Cleared PDF path from session")
+        # Remove the file name; the document goes once no other name refers to it
+        remaining_aliases = get_vector_store().remove_alias(file_name)
+        logger.info(f"Removed alias {file_name} of {doc_id}")
+        if remaining_aliases == 0:
+            _delete_document(doc_id)
+            logger.info(f"Deleted PDF data from the vector store: {doc_id}")
+            
+            # Clear session if the deleted document was the current one
+            if session.get('current_doc_id') == doc_id:
+                session.pop('current_doc_id', None)
+                logger.info("Cleared document from session")
         
         return jsonify({'message': 'PDF deleted successfully'})
     except Exception as e:
         logger.error(f"Error deleting PDF: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage timings and counters in the Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080, debug=True)
@@ -0,0 +1,159 @@
+# Async entry point: question routes run on the event loop, everything else is served by the Flask app
+import os
+import json
+import time
+import asyncio
+import logging
+from functools import wraps
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from app import app as flask_app, resolve_documents, validate_batch_questions
+from utils.async_answers import get_answer_async, get_answers_async, stream_answer_async
+from utils.model_scheduler import embedding_scheduler, chat_scheduler
+from utils import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WSGI_WORKERS = int(os.environ.get("WSGI_WORKERS", 10))  # Threads serving the mounted Flask routes
+ASYNC_MODEL_MAX_CONCURRENCY = int(os.environ.get("ASYNC_MODEL_MAX_CONCURRENCY", 256))  # Requests in flight per model
+
+# Waiting questions hold no thread here, so the model limits are sized to the connection pool instead
+embedding_scheduler.set_max_concurrency(ASYNC_MODEL_MAX_CONCURRENCY)
+chat_scheduler.set_max_concurrency(ASYNC_MODEL_MAX_CONCURRENCY)
+
+# Flask signs the session cookie; the async routes read it with the same serializer
+_session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+def _session_doc_id(request):
+    """Return the doc_id selected in the Flask session cookie, or None"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie or not _session_serializer:
+        return None
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return _session_serializer.loads(cookie, max_age=max_age).get('current_doc_id')
+    except Exception:
+        logger.warning("Ignoring invalid session cookie")
+        return None
+
+
+def traced(handler):
+    """Log the stage timings of a request at debug level once its response has been sent"""
+    @wraps(handler)
+    async def wrapper(request):
+        spans = metrics.start_trace()
+        started = time.perf_counter()
+        response = await handler(request)
+        if spans is not None:
+            label = f"{request.method} {request.url.path} {response.status_code}"
+            response.background = BackgroundTask(metrics.finish_trace, spans, label, started)
+        return response
+    return wrapper
+
+
+async def _read_request(request):
+    """
+    Parse the JSON body and resolve the documents a question is asked about
+
+    Returns:
+    tuple: (data, handle, is_multi_document, None) or (None, None, None, error response)
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return None, None, None, JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+    if not isinstance(data, dict):
+        return None, None, None, JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    # Catalog lookups are blocking SQLite calls
+    document, multi_document, error = await asyncio.to_thread(
+        resolve_documents, data.get('documents'), _session_doc_id(request)
+    )
+    if error:
+        payload, status = error
+        return None, None, None, JSONResponse(payload, status_code=status)
+    return data, document, multi_document, None
+
+
+@traced
+async def ask_question(request):
+    data, document, multi_document, error_response = await _read_request(request)
+    if error_response:
+        return error_response
+
+    question = data.get('question')
+    logger.info(f"Received question: {question}")
+    if not question:
+        return JSONResponse({'error': 'No question provided'}, status_code=400)
+
+    try:
+        if multi_document:
+            return JSONResponse(await get_answer_async(question, document, with_sources=True))
+        return JSONResponse({'answer': await get_answer_async(question, document)})
+    except Exception as e:
+        logger.error(f"Error getting answer: {str(e)}")
+        return JSONResponse({'error': f'Error getting answer: {str(e)}'}, status_code=500)
+
+
+@traced
+async def ask_questions_batch(request):
+    data, document, _, error_response = await _read_request(request)
+    if error_response:
+        return error_response
+
+    questions = data.get('questions')
+    error = validate_batch_questions(questions)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+
+    logger.info(f"Received batch of {len(questions)} questions")
+    try:
+        return JSONResponse({'results': await get_answers_async(questions, document)})
+    except Exception as e:
+        logger.error(f"Error getting answers: {str(e)}")
+        return JSONResponse({'error': f'Error getting answers: {str(e)}'}, status_code=500)
+
+
+@traced
+async def ask_question_stream(request):
+    data, document, _, error_response = await _read_request(request)
+    if error_response:
+        return error_response
+
+    question = data.get('question')
+    logger.info(f"Received streaming question: {question}")
+    if not question:
+        return JSONResponse({'error': 'No question provided'}, status_code=400)
+
+    async def generate():
+        try:
+            async for event in stream_answer_async(question, document):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+app = Starlette(routes=[
+    Route('/ask', ask_question, methods=['POST']),
+    Route('/ask-batch', ask_questions_batch, methods=['POST']),
+    Route('/ask-stream', ask_question_stream, methods=['POST']),
+    Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_WORKERS))
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,220 @@
+"""
+Load-test /ask under the threaded Flask server and the async ASGI server
+
+Usage:
+    python -m benchmarks.bench_async_ask --concurrency 200 --requests 600 --chat-latency-ms 1000
+
+A fake OpenAI server (benchmarks.fake_openai) answers embeddings and chat
+completions with fixed latency, so the numbers show how many questions one
+process keeps in flight while they wait on the model. The fake server and each
+app mode run in their own processes, the app with temporary storage; results
+are printed as JSON.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import aiohttp
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.sample_pdf import write_sample_pdf
+
+SERVER_COMMANDS = {
+    'wsgi': [sys.executable, "-c", "import sys; from app import app; app.run(port=int(sys.argv[1]), threaded=True)"],
+    'asgi': [sys.executable, "-m", "uvicorn", "asgi:app", "--log-level", "warning", "--port"]
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _thread_count(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return None
+
+
+def _wait_for(url, process, name):
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    process.kill()
+    raise RuntimeError(f"{name} did not start")
+
+
+def _start_fake_openai(args):
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai", "--port", str(port),
+        "--chat-latency-ms", str(args.chat_latency_ms), "--embed-latency-ms", str(args.embed_latency_ms)
+    ], cwd=ROOT, stdout=subprocess.DEVNULL)
+    _wait_for(f"http://127.0.0.1:{port}/", process, "Fake OpenAI server")
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def _start_app(mode, port, work_dir, base_url):
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-benchmark",
+        OPENAI_BASE_URL=base_url,
+        CHROMA_PATH=os.path.join(work_dir, "chroma_db"),
+        NUMPY_STORE_PATH=os.path.join(work_dir, "vector_db"),
+        UPLOAD_FOLDER=os.path.join(work_dir, "uploads"),
+        EMBEDDING_CACHE_PATH=os.path.join(work_dir, "embedding_cache.sqlite3"),
+        ANSWER_CACHE_PATH=os.path.join(work_dir, "answer_cache.sqlite3"),
+        ANSWER_CACHE="false",  # Every question is answered by the model
+        PYTHONPATH=ROOT
+    )
+    process = subprocess.Popen(
+        SERVER_COMMANDS[mode] + [str(port)], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    _wait_for(f"http://127.0.0.1:{port}/list-pdfs", process, f"{mode} server")
+    return process
+
+
+def _upload(client, pdf_path):
+    with open(pdf_path, "rb") as f:
+        response = client.post("/upload", files={'pdfFile': ("benchmark.pdf", f, "application/pdf")})
+    response.raise_for_status()
+    job_id = response.json().get('job_id')
+    while job_id:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job['status'] == "failed":
+            raise RuntimeError(f"Ingestion failed: {job['error']}")
+        if job['status'] == "completed":
+            break
+        time.sleep(0.2)
+
+
+async def _load(base, cookies, total, concurrency, pid):
+    latencies = []
+    errors = 0
+    peak_threads = 0
+    # aiohttp keeps the load generator cheap at hundreds of open connections
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(base, connector=connector, cookies=cookies, timeout=timeout) as client:
+        gate = asyncio.Semaphore(concurrency)
+
+        async def ask(i):
+            nonlocal errors
+            async with gate:
+                start = time.perf_counter()
+                try:
+                    async with client.post("/ask", json={'question': f"What does section {i % 50 + 1} say?"}) as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1  # Connection refused or reset by an overloaded server
+                    return
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+
+        async def sample_threads():
+            nonlocal peak_threads
+            while True:
+                peak_threads = max(peak_threads, _thread_count(pid) or 0)
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample_threads())
+        cpu_start = _cpu_seconds(pid)
+        start = time.perf_counter()
+        await asyncio.gather(*[ask(i) for i in range(total)])
+        elapsed = time.perf_counter() - start
+        cpu_end = _cpu_seconds(pid)
+        sampler.cancel()
+
+    latencies = latencies or [0.0]
+    return {
+        'requests': total,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(total / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1),
+        'peak_server_threads': peak_threads or None,
+        'server_cpu_s': round(cpu_end - cpu_start, 2) if cpu_start is not None else None
+    }
+
+
+def run(mode, args, base_url):
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as work_dir:
+        process = _start_app(mode, port, work_dir, base_url)
+        try:
+            base = f"http://127.0.0.1:{port}"
+            pdf_path = os.path.join(work_dir, "benchmark.pdf")
+            write_sample_pdf(pdf_path, pages=args.pages)
+            with httpx.Client(base_url=base, timeout=300) as client:
+                _upload(client, pdf_path)
+                cookies = dict(client.cookies)
+            result = asyncio.run(_load(base, cookies, args.requests, args.concurrency, process.pid))
+            return dict(mode=mode, **result)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="wsgi,asgi", help="Comma-separated: wsgi, asgi")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--chat-latency-ms", type=float, default=1000)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    fake_openai, base_url = _start_fake_openai(args)
+    try:
+        results = [run(mode, args, base_url) for mode in args.modes.split(",")]
+    finally:
+        fake_openai.terminate()
+
+    print(json.dumps({
+        'benchmark': 'async_ask',
+        'concurrency': args.concurrency,
+        'chat_latency_ms': args.chat_latency_ms,
+        'results': results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Measure cold start: import time of the app and latency of its first requests
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+
+Each run starts a fresh interpreter that imports the app and sends its first
+requests through the Flask test client: listing PDFs (which creates the vector
+store), loading a PDF and asking two questions (the first creates the OpenAI
+client). A sample PDF is ingested once beforehand, and a local fake OpenAI
+server stands in for the API. Medians and maxima over the runs are printed as
+JSON; compare them before and after a change to catch startup regressions.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_openai import start_server
+from benchmarks.sample_pdf import write_sample_pdf
+
+PDF_NAME = "benchmark.pdf"
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def _ingest(pdf_path):
+    """Upload the sample PDF through the app and wait for its ingestion job"""
+    from app import app
+    client = app.test_client()
+    with open(pdf_path, "rb") as f:
+        response = client.post("/upload", data={'pdfFile': (f, PDF_NAME)}, content_type="multipart/form-data")
+    job_id = response.get_json().get('job_id')
+    while job_id:
+        job = client.get(f"/jobs/{job_id}").get_json()
+        if job['status'] == "failed":
+            raise RuntimeError(f"Ingestion failed: {job['error']}")
+        if job['status'] == "completed":
+            break
+        time.sleep(0.1)
+
+
+def _probe(module):
+    """Runs in a fresh interpreter: time the import and the first requests"""
+    import importlib
+    _, import_time = _timed(lambda: importlib.import_module(module))
+    timings = {'import': import_time}
+    if module != "app":
+        return timings
+
+    from app import app
+    client = app.test_client()
+    for name, request in (
+        ('first_list_pdfs', lambda: client.get("/list-pdfs")),
+        ('load_pdf', lambda: client.post("/load-pdf", json={'file_name': PDF_NAME})),
+        ('first_ask', lambda: client.post("/ask", json={'question': "What does section 1 say?"})),
+        ('second_ask', lambda: client.post("/ask", json={'question': "What does section 2 say?"}))
+    ):
+        response, timings[name] = _timed(request)
+        if response.status_code != 200:
+            raise RuntimeError(f"{name} returned {response.status_code}: {response.get_data(as_text=True)}")
+    return timings
+
+
+def _run_probe(module, env):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--probe", module],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['process'] = time.perf_counter() - start  # Including interpreter startup and exit
+    return timings
+
+
+def _summarize(runs):
+    summary = {}
+    for name in runs[0]:
+        samples = [run[name] for run in runs]
+        summary[name] = {
+            'median_ms': round(statistics.median(samples) * 1000, 1),
+            'max_ms': round(max(samples) * 1000, 1)
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--modules", default="app,asgi", help="Comma-separated modules to import")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--ingest", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(_probe(args.probe)))
+        return
+    if args.ingest:
+        _ingest(args.ingest)
+        return
+
+    server, base_url = start_server(chat_latency_ms=0, embed_latency_ms=0, token_delay_ms=0)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            env = dict(
+                os.environ,
+                OPENAI_API_KEY="sk-benchmark",
+                OPENAI_BASE_URL=base_url,
+                CHROMA_PATH=os.path.join(work_dir, "chroma_db"),
+                NUMPY_STORE_PATH=os.path.join(work_dir, "vector_db"),
+                UPLOAD_FOLDER=os.path.join(work_dir, "uploads"),
+                EMBEDDING_CACHE_PATH=os.path.join(work_dir, "embedding_cache.sqlite3"),
+                ANSWER_CACHE_PATH=os.path.join(work_dir, "answer_cache.sqlite3"),
+                PYTHONPATH=ROOT
+            )
+            pdf_path = os.path.join(work_dir, PDF_NAME)
+            write_sample_pdf(pdf_path, pages=args.pages)
+            subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--ingest", pdf_path],
+                           cwd=ROOT, env=env, check=True, capture_output=True)
+
+            results = {}
+            for module in args.modules.split(","):
+                results[module] = _summarize([_run_probe(module, env) for _ in range(args.runs)])
+    finally:
+        server.shutdown()
+
+    print(json.dumps({'benchmark': 'startup', 'runs': args.runs, 'results': results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Offline end-to-end benchmark of ingestion, questions and listing
+
+Usage:
+    python -m benchmarks.bench_suite --docs 20 --pages 10 --output results.json
+
+A corpus of generated PDFs is ingested with process_pdf against a local fake
+OpenAI server (benchmarks.fake_openai) with configurable latency and rate
+limit, so no network access or API key is needed. The suite measures:
+
+- ingestion throughput of process_pdf, in pages/s and chunks/s
+- /list-pdfs latency after each document, as the collection grows
+- /ask latency percentiles with --concurrency questions in flight
+- peak RSS of the app process and of its PDF parsing workers
+
+The app runs in its own process with temporary storage, so its memory is not
+mixed with the benchmark's. Results are written as JSON (to --output, or
+stdout) together with the configuration and environment, so runs can be
+compared across changes.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_openai import start_server
+from benchmarks.sample_pdf import write_sample_pdf
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _latency_summary(samples):
+    samples = samples or [0.0]
+    return {
+        'p50_ms': round(_percentile(samples, 0.50) * 1000, 2),
+        'p95_ms': round(_percentile(samples, 0.95) * 1000, 2),
+        'p99_ms': round(_percentile(samples, 0.99) * 1000, 2),
+        'max_ms': round(max(samples) * 1000, 2)
+    }
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process and of its largest child, in MB (Linux reports KB)"""
+    return {
+        'process': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    }
+
+
+def _ingest(pdf_paths, list_samples):
+    """Ingest the corpus one PDF at a time, timing process_pdf and /list-pdfs after each"""
+    from app import app
+    from utils.pdf_processor import process_pdf
+    from utils.vector_store import get_vector_store
+    from utils.document_catalog import file_sha256
+
+    client = app.test_client()
+    documents = []
+    listing = []
+    for path in pdf_paths:
+        file_name = os.path.basename(path)
+        doc_id = file_sha256(path)
+        start = time.perf_counter()
+        stats = process_pdf(path, doc_id=doc_id, file_name=file_name)
+        elapsed = time.perf_counter() - start
+        get_vector_store().add_alias(file_name, doc_id)
+        documents.append({
+            'file_name': file_name, 'pages': stats['pages'], 'chunks': stats['chunks'], 'seconds': elapsed
+        })
+
+        samples = []
+        for _ in range(list_samples):
+            start = time.perf_counter()
+            response = client.get("/list-pdfs")
+            samples.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"/list-pdfs returned {response.status_code}")
+        listing.append(dict(documents=len(documents), **_latency_summary(samples)))
+
+    def throughput(measured):
+        seconds = sum(document['seconds'] for document in measured)
+        pages = sum(document['pages'] for document in measured)
+        chunks = sum(document['chunks'] for document in measured)
+        return {
+            'documents': len(measured),
+            'pages': pages,
+            'chunks': chunks,
+            'seconds': round(seconds, 3),
+            'pages_per_s': round(pages / seconds, 1),
+            'chunks_per_s': round(chunks / seconds, 1)
+        }
+
+    ingestion = throughput(documents)
+    # The first document also pays for loading the store, the chunker and the parsing workers
+    ingestion['first_document_s'] = round(documents[0]['seconds'], 3)
+    if len(documents) > 1:
+        ingestion['steady_state'] = throughput(documents[1:])
+    ingestion['per_document'] = _latency_summary([document['seconds'] for document in documents])
+    return ingestion, listing, [document['file_name'] for document in documents]
+
+
+def _ask(file_names, total, concurrency):
+    """Send total questions from concurrency threads, each with its own session on one of the PDFs"""
+    from app import app
+
+    latencies = []
+    errors = []
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def worker(index):
+        client = app.test_client()
+        response = client.post("/load-pdf", json={'file_name': file_names[index % len(file_names)]})
+        if response.status_code != 200:
+            raise RuntimeError(f"/load-pdf returned {response.status_code}")
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            response = client.post("/ask", json={'question': f"What does section {i % 50 + 1} say?"})
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return dict(
+        requests=total,
+        concurrency=concurrency,
+        errors=len(errors),
+        elapsed_s=round(elapsed, 2),
+        throughput_rps=round(total / elapsed, 1),
+        **_latency_summary(latencies)
+    )
+
+
+def _run_worker(config):
+    """Runs in the app process: the whole measured workload"""
+    ingestion, listing, file_names = _ingest(config['pdf_paths'], config['list_samples'])
+    memory_after_ingestion = _peak_rss_mb()
+    ask = _ask(file_names, config['ask_requests'], config['concurrency'])
+
+    from utils.model_scheduler import embedding_scheduler, chat_scheduler
+    return {
+        'ingestion': ingestion,
+        'list_pdfs': listing,
+        'ask': ask,
+        'peak_rss_mb': {'after_ingestion': memory_after_ingestion, 'final': _peak_rss_mb()},
+        'scheduler': {'embeddings': embedding_scheduler.stats, 'chat': chat_scheduler.stats}
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20, help="PDFs in the generated corpus")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per PDF")
+    parser.add_argument("--requests", type=int, default=200, help="Questions sent to /ask")
+    parser.add_argument("--concurrency", type=int, default=16, help="Questions in flight")
+    parser.add_argument("--list-samples", type=int, default=20, help="/list-pdfs calls after each document")
+    parser.add_argument("--chat-latency-ms", type=float, default=300)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--rpm", type=float, default=0, help="Fake API requests per minute per endpoint (0: unlimited)")
+    parser.add_argument("--backend", default=os.environ.get("VECTOR_BACKEND", "chroma"), help="chroma or numpy")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker) as f:
+            config = json.load(f)
+        print(json.dumps(_run_worker(config)))
+        return
+
+    server, base_url = start_server(chat_latency_ms=args.chat_latency_ms, embed_latency_ms=args.embed_latency_ms,
+                                    token_delay_ms=0, rpm=args.rpm)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            pdf_dir = os.path.join(work_dir, "corpus")
+            os.makedirs(pdf_dir)
+            pdf_paths = []
+            for i in range(args.docs):
+                path = os.path.join(pdf_dir, f"document-{i:04d}.pdf")
+                write_sample_pdf(path, pages=args.pages, seed=i)
+                pdf_paths.append(path)
+
+            config_path = os.path.join(work_dir, "config.json")
+            with open(config_path, "w") as f:
+                json.dump({
+                    'pdf_paths': pdf_paths,
+                    'list_samples': args.list_samples,
+                    'ask_requests': args.requests,
+                    'concurrency': args.concurrency
+                }, f)
+
+            env = dict(
+                os.environ,
+                OPENAI_API_KEY="sk-benchmark",
+                OPENAI_BASE_URL=base_url,
+                VECTOR_BACKEND=args.backend,
+                CHROMA_PATH=os.path.join(work_dir, "chroma_db"),
+                NUMPY_STORE_PATH=os.path.join(work_dir, "vector_db"),
+                UPLOAD_FOLDER=os.path.join(work_dir, "uploads"),
+                EMBEDDING_CACHE_PATH=os.path.join(work_dir, "embedding_cache.sqlite3"),
+                ANSWER_CACHE_PATH=os.path.join(work_dir, "answer_cache.sqlite3"),
+                ANSWER_CACHE="false",  # Every question is answered by the model
+                PYTHONPATH=ROOT
+            )
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_suite", "--worker", config_path],
+                cwd=ROOT, env=env, capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                sys.stderr.write(completed.stderr[-4000:])
+                raise RuntimeError(f"Benchmark worker failed with exit code {completed.returncode}")
+            results = json.loads(completed.stdout.strip().splitlines()[-1])
+            elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    report = {
+        'benchmark': 'suite',
+        'config': {key: value for key, value in vars(args).items() if key not in ("output", "worker")},
+        'environment': {
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'elapsed_s': round(elapsed, 2),
+        **results,
+        'model_server': {'requests': server.requests, 'rate_limited': server.rate_limited}
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Wrote benchmark results to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare per-document top-k search latency of the vector store backends
+
+Usage:
+    python -m benchmarks.bench_vector_search --docs 20 --chunks 2000 --queries 200
+
+Both backends are filled with the same random unit vectors in temporary
+directories; the Chroma backend is run once per sharding strategy and the
+NumPy backend once per embedding storage mode, with recall@k measured against
+exact float32 search. Results are printed as JSON.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chroma_store import ChromaStore
+from utils.numpy_store import NumpyStore
+
+
+def _unit_vectors(rng, count, dimension):
+    vectors = rng.standard_normal((count, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+def _exact_ids(documents, queries, top_k):
+    """Chunk texts of the exact float32 top-k of every query"""
+    vectors_by_doc = {doc_id: (chunks, vectors) for doc_id, chunks, vectors in documents}
+    expected = []
+    for doc_id, query in queries:
+        chunks, vectors = vectors_by_doc[doc_id]
+        distances = np.sum((vectors - query) ** 2, axis=1)
+        expected.append({chunks[i] for i in np.argsort(distances)[:top_k]})
+    return expected
+
+
+def run(backend_name, store, path, documents, queries, top_k, expected):
+    for doc_id, chunks, vectors in documents:
+        store.store_pdf_data(doc_id=doc_id, chunks=chunks, embeddings=vectors.tolist())
+
+    latencies = []
+    hits = 0
+    for (doc_id, query), relevant in zip(queries, expected):
+        start = time.perf_counter()
+        results = store.get_similar_chunks(query.tolist(), n_results=top_k, doc_id=doc_id, verify_document=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(relevant & {result['document'] for result in results})
+
+    return {
+        'backend': backend_name,
+        'queries': len(latencies),
+        'recall_at_k': round(hits / (len(expected) * top_k), 4),
+        'disk_bytes': _directory_size(path),
+        'p50_ms': round(_percentile(latencies, 0.50), 3),
+        'p95_ms': round(_percentile(latencies, 0.95), 3),
+        'p99_ms': round(_percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks per document")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sharding", default="single,document",
+                        help="Comma-separated Chroma sharding strategies")
+    parser.add_argument("--storage", default="float32,float16,int8",
+                        help="Comma-separated NumPy embedding storage modes")
+    parser.add_argument("--rescore", action="store_true",
+                        help="Also run each compact mode with full-precision rescoring")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    documents = []
+    for d in range(args.docs):
+        chunks = [f"document {d} chunk {i}" for i in range(args.chunks)]
+        documents.append((f"doc-{d}", chunks, _unit_vectors(rng, args.chunks, args.dimension)))
+
+    picker = random.Random(args.seed)
+    query_vectors = _unit_vectors(rng, args.queries, args.dimension)
+    queries = [(picker.choice(documents)[0], query) for query in query_vectors]
+
+    expected = _exact_ids(documents, queries, args.top_k)
+    configurations = []
+    for storage in args.storage.split(","):
+        configurations.append((f"numpy-{storage}", storage, False))
+        if args.rescore and storage != "float32":
+            configurations.append((f"numpy-{storage}-rescore", storage, True))
+
+    results = []
+    for sharding in args.sharding.split(","):
+        with tempfile.TemporaryDirectory() as chroma_dir:
+            store = ChromaStore(path=chroma_dir, sharding=sharding)
+            results.append(run(f"chroma-{sharding}", store, chroma_dir, documents, queries, args.top_k, expected))
+    for name, storage, rescore in configurations:
+        with tempfile.TemporaryDirectory() as numpy_dir:
+            store = NumpyStore(path=numpy_dir, storage=storage, rescore=rescore)
+            results.append(run(name, store, numpy_dir, documents, queries, args.top_k, expected))
+
+    print(json.dumps({
+        'benchmark': 'vector_search',
+        'docs': args.docs,
+        'chunks_per_doc': args.chunks,
+        'dimension': args.dimension,
+        'top_k': args.top_k,
+        'results': results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions endpoints
+
+Usage:
+    python -m benchmarks.fake_openai --port 9100 --chat-latency-ms 800
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1. Embeddings
+are deterministic unit vectors derived from the text, so repeated runs retrieve
+the same chunks; latencies simulate a remote model without any network access.
+With --rpm, each endpoint answers requests over that many per minute with 429
+and a Retry-After header, like the real API's rate limits.
+"""
+import time
+import json
+import uuid
+import base64
+import hashlib
+import argparse
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text, dimension):
+    """Deterministic unit vector for a text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Health check for scripts waiting on the server
+        self._send_json(200, {'object': "list", 'data': []})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        options = self.server.options
+        self.server.count(self.path)
+
+        retry_after = self.server.throttle(self.path)
+        if retry_after:
+            self._send_json(429, {'error': {
+                'message': "Rate limit reached for requests",
+                'type': "requests",
+                'code': "rate_limit_exceeded"
+            }}, headers={'retry-after-ms': str(int(retry_after * 1000)), 'retry-after': str(max(1, round(retry_after)))})
+            return
+
+        if self.path.endswith("/embeddings"):
+            self._embeddings(payload, options)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(payload, options)
+        else:
+            self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+    def _embeddings(self, payload, options):
+        texts = payload.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        time.sleep(options['embed_latency_ms'] / 1000)
+
+        data = []
+        for index, text in enumerate(texts):
+            vector = fake_embedding(text, options['dimension'])
+            if payload.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({'object': "embedding", 'index': index, 'embedding': embedding})
+        tokens = sum(len(text) // 4 for text in texts)
+        self._send_json(200, {
+            'object': "list",
+            'data': data,
+            'model': payload.get("model"),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+    def _chat(self, payload, options):
+        question = payload["messages"][-1]["content"].rsplit("Question:", 1)[-1].strip()
+        words = f"This is a simulated answer to: {question}".split()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        time.sleep(options['chat_latency_ms'] / 1000)
+
+        if not payload.get("stream"):
+            self._send_json(200, {
+                'id': completion_id,
+                'object': "chat.completion",
+                'created': created,
+                'model': payload.get("model"),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': "assistant", 'content': " ".join(words)},
+                    'finish_reason': "stop"
+                }],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(words), 'total_tokens': len(words)}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, word in enumerate(words):
+            chunk = {
+                'id': completion_id,
+                'object': "chat.completion.chunk",
+                'created': created,
+                'model': payload.get("model"),
+                'choices': [{'index': 0, 'delta': {'content': word if i == 0 else f" {word}"}, 'finish_reason': None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(options['token_delay_ms'] / 1000)
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            # Like the real API, a last event without choices reports the tokens used
+            usage = {
+                'id': completion_id,
+                'object': "chat.completion.chunk",
+                'created': created,
+                'model': payload.get("model"),
+                'choices': [],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(words), 'total_tokens': len(words)}
+            }
+            self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, options):
+        super().__init__(address, FakeOpenAIHandler)
+        self.options = options
+        self.requests = {}
+        self.rate_limited = 0
+        self._allowance = {}  # Per-path token buckets of (available, updated)
+        self._lock = threading.Lock()
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def throttle(self, path):
+        """Seconds until path accepts another request under the rpm limit, or 0 after admitting it"""
+        rpm = self.options['rpm']
+        if not rpm:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            burst = max(1, rpm / 60)  # Enforced per second, not per minute, as the real API does
+            available, updated = self._allowance.get(path, (burst, now))
+            available = min(burst, available + (now - updated) * rpm / 60)
+            if available >= 1:
+                self._allowance[path] = (available - 1, now)
+                return 0
+            self._allowance[path] = (available, now)
+            self.rate_limited += 1
+            return (1 - available) * 60 / rpm
+
+
+def start_server(port=0, dimension=1536, chat_latency_ms=500, embed_latency_ms=50, token_delay_ms=5, rpm=0):
+    """
+    Start the fake server on a background thread
+
+    Returns:
+    tuple: (server, base URL ending in /v1)
+    """
+    server = FakeOpenAIServer(("127.0.0.1", port), {
+        'dimension': dimension,
+        'chat_latency_ms': chat_latency_ms,
+        'embed_latency_ms': embed_latency_ms,
+        'token_delay_ms': token_delay_ms,
+        'rpm': rpm
+    })
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--chat-latency-ms", type=float, default=500)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--token-delay-ms", type=float, default=5)
+    parser.add_argument("--rpm", type=float, default=0, help="Requests per minute per endpoint before 429s (0: unlimited)")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, args.dimension, args.chat_latency_ms,
+                                    args.embed_latency_ms, args.token_delay_ms, args.rpm)
+    print(f"Fake OpenAI API listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
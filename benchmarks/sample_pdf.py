@@ -0,0 +1,69 @@
+"""
+Generate text PDFs for benchmarks without any PDF-writing dependency
+
+    from benchmarks.sample_pdf import write_sample_pdf
+    write_sample_pdf("/tmp/sample.pdf", pages=200)
+"""
+import random
+
+_WORDS = (
+    "agreement party notice term termination clause payment invoice delivery warranty liability "
+    "schedule service level availability support renewal confidential information breach remedy "
+    "governing law dispute arbitration amendment assignment subcontractor insurance indemnity audit"
+).split()
+
+
+def sample_pages(count, lines_per_page=40, seed=0):
+    """Return the text of count pages of pseudo-contract prose, deterministic for a seed"""
+    rng = random.Random(seed)
+    pages = []
+    for page in range(count):
+        lines = [f"Section {page + 1}"]
+        for line in range(lines_per_page):
+            words = " ".join(rng.choice(_WORDS) for _ in range(12))
+            lines.append(f"{page + 1}.{line + 1} The {words}.")
+        pages.append("\n".join(lines))
+    return pages
+
+
+def make_pdf(pages):
+    """Build a minimal PDF with one page per text, each line drawn with a standard font"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    for i, text in enumerate(pages):
+        commands = []
+        y = 780
+        for line in text.split("\n"):
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            commands.append(f"BT /F1 9 Tf 40 {y} Td ({escaped}) Tj ET")
+            y -= 12
+        stream = "\n".join(commands)
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+def write_sample_pdf(path, pages=50, seed=0):
+    """Write a generated PDF to path and return the page texts"""
+    texts = sample_pages(pages, seed=seed)
+    with open(path, "wb") as f:
+        f.write(make_pdf(texts))
+    return texts
@@ -0,0 +1,37 @@
+# Gunicorn settings for serving the app from several worker processes:
+#   gunicorn app:app
+# Every worker shares the document catalog, embedding cache and job table (SQLite
+# files on this node) and the signed session cookie. Set CHROMA_HOST so that the
+# workers share one Chroma server, as an embedded Chroma database is not safe to
+# write from several processes, and CATALOG_PATH, which nodes sharing that server
+# must point at the same file. With the numpy backend each worker memory-maps
+# the document files itself; it checks them on every search and reloads or drops
+# a document another worker rewrote or deleted, and drops its cached document
+# handles whenever another worker changes the catalog.
+#
+# Still kept per worker: the model schedulers, which enforce an equal share of
+# EMBED_RPM/TPM and CHAT_RPM/TPM each (MODEL_LIMIT_PROCESSES, set to the number of
+# workers below) and MODEL_MAX_CONCURRENCY each, and the /metrics counters, which
+# describe the worker that answered the scrape.
+import os
+import multiprocessing
+
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Threads keep a worker responsive while its requests wait on OpenAI and while answers stream
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+# Streaming answers and large upload parts can take a while
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+# Let ingestion jobs running in the background of a worker finish on a graceful restart
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 300))
+# Each worker opens its own stores and clients after the fork; sharing SQLite connections across a fork is unsafe
+preload_app = False
+
+# Workers inherit this and split the OpenAI rate limits between them
+os.environ.setdefault("MODEL_LIMIT_PROCESSES", str(workers))
+
+
+def post_fork(server, worker):
+    if workers > 1 and os.environ.get("VECTOR_BACKEND", "chroma") == "chroma" and not os.environ.get("CHROMA_HOST"):
+        server.log.warning("Several workers share an embedded Chroma database; set CHROMA_HOST to a Chroma server")
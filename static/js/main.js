@@ -139,10 +139,6 @@ function uploadPdf() {
         return;
     }
     
-    // Create form data
-    const formData = new FormData();
-    formData.append('pdfFile', file);
-    
     // Show progress bar and reset it
     uploadProgress.classList.remove('d-none');
     progressBar.style.width = '0%';
@@ -155,38 +151,15 @@ function uploadPdf() {
     // Disable upload button
     uploadBtn.disabled = true;
     
-    // Simulate progress (since we can't get actual progress easily)
-    let progress = 0;
-    const progressInterval = setInterval(() => {
-        progress += 5;
-        if (progress > 90) clearInterval(progressInterval);
-        progressBar.style.width = `${progress}%`;
-        progressBar.setAttribute('aria-valuenow', progress);
-    }, 200);
-    
-    // Send request to server
-    fetch('/upload', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => {
-        clearInterval(progressInterval);
-        
-        if (!response.ok) {
-            return response.json().then(data => {
-                throw new Error(data.error || 'Error uploading PDF');
-            });
-        }
-        return response.json();
-    })
+    // Send the file to the server, then poll the ingestion job for real progress
+    const upload = file.size > CHUNKED_UPLOAD_THRESHOLD ? uploadInParts(file) : uploadWhole(file);
+    upload
+    .then(data => data.status === 'completed' ? data : waitForJob(data.job_id))
     .then(data => {
         // Complete progress bar
         progressBar.style.width = '100%';
         progressBar.setAttribute('aria-valuenow', 100);
         
-        // Save PDF text for later questions
-        pdfText = data.text;
-        
         // Update UI
         uploadStatus.textContent = 'PDF processed successfully!';
         uploadStatus.className = 'mt-3 text-success';
@@ -228,6 +201,127 @@ function uploadPdf() {
     });
 }
 
+// Files above this size are sent in resumable parts
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const PART_ATTEMPTS = 5;
+
+// Parse a JSON response, throwing its error message if the request failed
+function jsonOrThrow(response, fallback) {
+    return response.json().then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || fallback);
+        }
+        return data;
+    });
+}
+
+// Upload a file in a single request
+function uploadWhole(file) {
+    const formData = new FormData();
+    formData.append('pdfFile', file);
+    return fetch('/upload', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => jsonOrThrow(response, 'Error uploading PDF'));
+}
+
+// Upload a file part by part, retrying parts that fail so a flaky link does not restart the upload
+async function uploadInParts(file) {
+    let upload = await fetch('/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ file_name: file.name, size: file.size })
+    }).then(response => jsonOrThrow(response, 'Error starting upload'));
+    
+    for (const index of upload.missing) {
+        const start = index * upload.part_size;
+        const part = file.slice(start, Math.min(start + upload.part_size, file.size));
+        for (let attempt = 1; ; attempt++) {
+            const response = await fetch(`/uploads/${upload.upload_id}/parts/${index}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: part
+            }).catch(() => null);  // Network failure
+            if (response && response.ok) {
+                upload = await response.json();
+                break;
+            }
+            // Parts the server rejected would be rejected again
+            if (response && response.status < 500) {
+                await jsonOrThrow(response, 'Error uploading PDF');
+            }
+            if (attempt >= PART_ATTEMPTS) {
+                throw new Error('Upload interrupted. Please check your connection and try again.');
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+        const percent = Math.round(100 * upload.received_bytes / upload.size);
+        uploadStatus.textContent = `Uploading PDF... ${percent}%`;
+    }
+    
+    return fetch(`/uploads/${upload.upload_id}/complete`, { method: 'POST' })
+        .then(response => jsonOrThrow(response, 'Error uploading PDF'));
+}
+
+// Map an ingestion job stage to a progress percentage and status message
+function describeJobProgress(job) {
+    switch (job.stage) {
+        case 'queued':
+            return { percent: 2, message: 'Waiting for a worker...' };
+        case 'parsing': {
+            // Pages are embedded while later ones are still being parsed
+            const fraction = job.total ? job.done / job.total : 0;
+            return {
+                percent: 5 + Math.round(65 * fraction),
+                message: `Parsing and embedding pages ${job.done || 0}/${job.total || 0}...`
+            };
+        }
+        case 'embedding': {
+            const fraction = job.total ? job.done / job.total : 0;
+            return {
+                percent: 70 + Math.round(20 * fraction),
+                message: `Embedding chunks ${job.done || 0}/${job.total || 0}...`
+            };
+        }
+        case 'storing':
+            return { percent: 95, message: 'Storing embeddings...' };
+        default:
+            return { percent: 100, message: 'Finishing...' };
+    }
+}
+
+// Poll an ingestion job until it completes or fails
+function waitForJob(jobId) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(`/jobs/${jobId}`)
+                .then(response => response.json().then(job => ({ response, job })))
+                .then(({ response, job }) => {
+                    if (!response.ok) {
+                        throw new Error(job.error || 'Error checking upload progress');
+                    }
+                    if (job.status === 'failed') {
+                        throw new Error(job.error || 'Error processing PDF');
+                    }
+                    
+                    const { percent, message } = describeJobProgress(job);
+                    progressBar.style.width = `${percent}%`;
+                    progressBar.setAttribute('aria-valuenow', percent);
+                    uploadStatus.textContent = message;
+                    
+                    if (job.status === 'completed') {
+                        resolve(job);
+                    } else {
+                        setTimeout(poll, 500);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
 // Function to ask a question
 async function askQuestion() {
     const question = questionInput.value.trim();
@@ -241,8 +335,10 @@ async function askQuestion() {
     const loadingMessage = addMessageToChat('assistant', 'Thinking...');
     loadingMessage.classList.add('loading');
 
+    const answerText = loadingMessage.querySelector('.message-text');
+
     try {
-        const response = await fetch('/ask', {
+        const response = await fetch('/ask-stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -250,19 +346,50 @@ async function askQuestion() {
             body: JSON.stringify({ question })
         });
 
-        const data = await response.json();
-
         if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.error || 'Failed to get answer');
         }
 
-        // Update loading message with actual answer
-        loadingMessage.textContent = data.answer;
+        // Render Server-Sent Events as they arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const frames = buffer.split('\n\n');
+            buffer = frames.pop();
+
+            for (const frame of frames) {
+                const dataLine = frame.split('\n').find(line => line.startsWith('data: '));
+                if (!dataLine) continue;
+
+                const event = JSON.parse(dataLine.slice(6));
+                if (event.type === 'token') {
+                    if (!answer) loadingMessage.classList.remove('loading');
+                    answer += event.text;
+                    answerText.textContent = answer;
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                } else if (event.type === 'error') {
+                    throw new Error(event.error || 'Failed to get answer');
+                }
+            }
+        }
+
+        if (!answer) {
+            throw new Error('No answer could be generated from the PDF content');
+        }
         loadingMessage.classList.remove('loading');
+        chatHistory[chatHistory.length - 1].text = answer;
 
     } catch (error) {
         // Update loading message with error
-        loadingMessage.textContent = error.message;
+        answerText.textContent = error.message;
         loadingMessage.classList.remove('loading');
         loadingMessage.classList.add('error');
     }
@@ -0,0 +1,130 @@
+"""
+Fixtures running the app against the fake OpenAI server (benchmarks.fake_openai)
+
+Each server runs in its own process on a free port, the app with temporary
+storage, so the tests need neither network access nor an API key.
+"""
+import os
+import sys
+import time
+import socket
+import subprocess
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.sample_pdf import write_sample_pdf
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, process, name, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not start")
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def start_fake_openai(*args):
+    """Start benchmarks.fake_openai with fast responses; returns (process, base URL ending in /v1)"""
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_openai", "--port", str(port), "--dimension", "64",
+        "--chat-latency-ms", "20", "--embed-latency-ms", "5", "--token-delay-ms", "1", *args
+    ], cwd=ROOT, stdout=subprocess.DEVNULL)
+    wait_for(f"http://127.0.0.1:{port}/", process, "Fake OpenAI server")
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def start_asgi(work_dir, openai_base_url, target="asgi:app", interface="auto", **settings):
+    """Start asgi.py (or the app given as target) under uvicorn with its storage in work_dir; returns (process, base URL)"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-test",
+        OPENAI_BASE_URL=openai_base_url,
+        CHROMA_PATH=":memory:",
+        NUMPY_STORE_PATH=os.path.join(work_dir, "vector_db"),
+        UPLOAD_FOLDER=os.path.join(work_dir, "uploads"),
+        JOBS_DB_PATH=os.path.join(work_dir, "jobs.sqlite3"),
+        EMBEDDING_CACHE_PATH=os.path.join(work_dir, "embedding_cache.sqlite3"),
+        ANSWER_CACHE_PATH=os.path.join(work_dir, "answer_cache.sqlite3"),
+        EXTRACT_WORKERS="1",
+        PYTHONPATH=ROOT,
+        **settings
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--interface", interface, "--log-level", "warning",
+         "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for(f"http://127.0.0.1:{port}/list-pdfs", process, f"{target} server")
+    return process, f"http://127.0.0.1:{port}"
+
+
+def upload_sample(client, work_dir, file_name="sample.pdf", pages=3, seed=0):
+    """Upload a generated PDF and wait for its ingestion; the client's session then selects it"""
+    pdf_path = os.path.join(work_dir, file_name)
+    write_sample_pdf(pdf_path, pages=pages, seed=seed)
+    with open(pdf_path, "rb") as f:
+        response = client.post("/upload", files={'pdfFile': (file_name, f, "application/pdf")})
+    assert response.status_code in (200, 202), response.text
+    job_id = response.json().get('job_id')
+    deadline = time.time() + 120
+    while job_id:
+        job = client.get(f"/jobs/{job_id}").json()
+        assert job['status'] != "failed", job.get('error')
+        if job['status'] == "completed":
+            break
+        assert time.time() < deadline, "Ingestion did not finish"
+        time.sleep(0.2)
+
+
+@pytest.fixture(scope="session")
+def fake_openai():
+    process, base_url = start_fake_openai()
+    yield base_url
+    stop(process)
+
+
+@pytest.fixture(scope="module")
+def asgi_app(fake_openai, tmp_path_factory):
+    """The async app with two ingested PDFs; yields (base URL, session cookies selecting other.pdf)"""
+    work_dir = str(tmp_path_factory.mktemp("asgi"))
+    process, base_url = start_asgi(work_dir, fake_openai)
+    try:
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            upload_sample(client, work_dir)
+            upload_sample(client, work_dir, file_name="other.pdf", seed=1)
+            cookies = dict(client.cookies)
+        yield base_url, cookies
+    finally:
+        stop(process)
+
+
+@pytest.fixture
+def client(asgi_app):
+    base_url, cookies = asgi_app
+    with httpx.Client(base_url=base_url, cookies=cookies, timeout=60) as client:
+        yield client
@@ -0,0 +1,132 @@
+"""
+The question routes of asgi.py, answered by the fake OpenAI server
+"""
+import json
+import httpx
+from conftest import start_fake_openai, start_asgi, upload_sample, stop
+
+
+def parse_events(body):
+    """Split a text/event-stream body into its events, checking every frame's framing"""
+    assert body.endswith("\n\n"), "Stream must end with a complete frame"
+    events = []
+    for frame in body[:-2].split("\n\n"):
+        event_line, data_line = frame.split("\n")
+        assert event_line.startswith("event: ")
+        assert data_line.startswith("data: ")
+        event = json.loads(data_line[len("data: "):])
+        assert event['type'] == event_line[len("event: "):]
+        events.append(event)
+    return events
+
+
+def test_ask_answers_from_the_session_document(client):
+    response = client.post("/ask", json={'question': "What does the payment clause say?"})
+    assert response.status_code == 200
+    assert response.json()['answer'].startswith("This is a simulated answer to:")
+
+
+def test_ask_several_documents_returns_sources(client):
+    response = client.post("/ask", json={'question': "Which notice terms apply?",
+                                         'documents': ["sample.pdf", "other.pdf"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data['answer']
+    assert data['sources'] and all(source['chunks'] for source in data['sources'])
+    assert {source['file_name'] for source in data['sources']} <= {"sample.pdf", "other.pdf"}
+
+
+def test_ask_rejects_bad_requests(client):
+    assert client.post("/ask", content=b"not json", headers={'Content-Type': "application/json"}).status_code == 400
+    assert client.post("/ask", json=["question"]).status_code == 400
+    assert client.post("/ask", json={}).status_code == 400
+    response = client.post("/ask", json={'question': "Anything?", 'documents': ["missing.pdf"]})
+    assert response.status_code == 404
+    assert response.json()['documents'] == ["missing.pdf"]
+
+
+def test_ask_without_a_document_in_session(asgi_app):
+    base_url, _ = asgi_app
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        response = client.post("/ask", json={'question': "What is the renewal term?"})
+    assert response.status_code == 400
+    assert "upload a PDF" in response.json()['error']
+
+
+def test_ask_batch_answers_in_order(client):
+    questions = [f"What does section {i} say about liability?" for i in range(1, 6)]
+    response = client.post("/ask-batch", json={'questions': questions})
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [result['question'] for result in results] == questions
+    assert all(result['answer'].startswith("This is a simulated answer to:") for result in results)
+
+
+def test_ask_batch_rejects_invalid_questions(client):
+    assert client.post("/ask-batch", json={'questions': []}).status_code == 400
+    assert client.post("/ask-batch", json={'questions': "not a list"}).status_code == 400
+    response = client.post("/ask-batch", json={'questions': ["Fine?", "  "]})
+    assert response.status_code == 400
+    assert response.json()['error'] == "Every question must be a non-empty string"
+
+
+def test_ask_stream_frames_sources_tokens_and_done(client):
+    question = "How is a dispute resolved by arbitration?"
+    with client.stream("POST", "/ask-stream", json={'question': question}) as response:
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith("text/event-stream")
+        assert response.headers['cache-control'] == "no-cache"
+        body = response.read().decode("utf-8")
+
+    events = parse_events(body)
+    assert events[0]['type'] == "sources" and events[0]['sources']
+    assert events[-1]['type'] == "done"
+    tokens = events[1:-1]
+    assert len(tokens) > 1 and all(event['type'] == "token" for event in tokens)
+    streamed = "".join(event['text'] for event in tokens)
+    assert streamed == f"This is a simulated answer to: {question}"
+
+
+def test_ask_stream_replays_a_cached_answer(client):
+    question = "When may the agreement be terminated?"
+    answer = client.post("/ask", json={'question': question}).json()['answer']
+
+    events = parse_events(client.post("/ask-stream", json={'question': question}).text)
+    assert [event['type'] for event in events] == ["sources", "token", "done"]
+    assert events[1]['text'] == answer
+
+
+def test_ask_stream_rejects_a_missing_question(client):
+    response = client.post("/ask-stream", json={'question': ""})
+    assert response.status_code == 400
+    assert response.headers['content-type'] == "application/json"
+
+
+def test_model_failures_are_reported(tmp_path):
+    """Once the model is unreachable, each route reports it in its own way"""
+    openai_process, openai_url = start_fake_openai()
+    app_process = None
+    try:
+        # Failed calls are not retried, so the errors surface at once
+        app_process, base_url = start_asgi(str(tmp_path), openai_url, MODEL_MAX_RETRIES="0")
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            upload_sample(client, str(tmp_path))
+            stop(openai_process)
+
+            response = client.post("/ask", json={'question': "Who pays for insurance?"})
+            assert response.status_code == 500
+            assert "Failed to connect to OpenAI API" in response.json()['error']
+
+            response = client.post("/ask-batch", json={'questions': ["Who audits?", "Who indemnifies?"]})
+            assert response.status_code == 500
+            assert "Failed to connect to OpenAI API" in response.json()['error']
+
+            response = client.post("/ask-stream", json={'question': "Who may subcontract?"})
+            assert response.status_code == 200
+            events = parse_events(response.text)
+            assert [event['type'] for event in events] == ["error"]
+            assert "Failed to connect to OpenAI API" in events[0]['error']
+    finally:
+        stop(openai_process)
+        if app_process:
+            stop(app_process)
@@ -0,0 +1,25 @@
+"""
+The question routes of the Flask app, served directly rather than through asgi.py
+"""
+import httpx
+import pytest
+from conftest import start_asgi, stop
+
+
+@pytest.fixture(scope="module")
+def flask_client(fake_openai, tmp_path_factory):
+    work_dir = str(tmp_path_factory.mktemp("flask"))
+    process, base_url = start_asgi(work_dir, fake_openai, target="app:app", interface="wsgi")
+    try:
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            yield client
+    finally:
+        stop(process)
+
+
+@pytest.mark.parametrize("path", ["/ask", "/ask-batch", "/ask-stream"])
+@pytest.mark.parametrize("body", [b'["question"]', b'"question"', b"null"])
+def test_question_routes_reject_json_that_is_not_an_object(flask_client, path, body):
+    response = flask_client.post(path, content=body, headers={'Content-Type': "application/json"})
+    assert response.status_code == 400
+    assert response.json() == {'error': 'Invalid JSON body'}
@@ -0,0 +1,74 @@
+"""
+Streaming calls hold their place in the model scheduler until the stream ends
+"""
+import asyncio
+from types import SimpleNamespace
+from utils.model_scheduler import ModelScheduler
+
+
+def events(count, total_tokens):
+    """A completion stream whose last event reports its usage, like stream_options include_usage"""
+    for i in range(count):
+        yield SimpleNamespace(choices=[i], usage=None)
+    yield SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=total_tokens))
+
+
+class ClosableStream:
+    def __init__(self, items):
+        self.items = items
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_holds_its_slot_until_exhausted_and_corrects_tokens():
+    scheduler = ModelScheduler("chat", tpm=60000, max_concurrency=4)
+    stream = scheduler.stream(lambda: events(3, total_tokens=50), tokens=300)
+    next(stream)
+    assert scheduler._in_flight == 1
+    assert scheduler.tokens.available == scheduler.tokens.capacity - 300
+
+    assert len(list(stream)) == 3
+    assert scheduler._in_flight == 0
+    # The reservation of 300 was corrected to the 50 tokens reported
+    assert scheduler.tokens.available >= scheduler.tokens.capacity - 50
+
+
+def test_closing_a_stream_early_releases_its_slot_and_the_response():
+    scheduler = ModelScheduler("chat", max_concurrency=1)
+    response = ClosableStream(list(events(5, total_tokens=10)))
+    stream = scheduler.stream(lambda: response)
+    next(stream)
+    stream.close()
+    assert response.closed
+    assert scheduler._in_flight == 0
+
+
+def test_async_stream_holds_its_slot_until_exhausted():
+    async def scenario():
+        scheduler = ModelScheduler("chat", max_concurrency=1)
+
+        async def open_stream():
+            async def generate():
+                for event in events(2, total_tokens=5):
+                    yield event
+            return generate()
+
+        first = scheduler.astream(open_stream)
+        await first.__anext__()
+        # A second stream waits for the only slot while the first is being read
+        second = asyncio.create_task(scheduler.astream(open_stream).__anext__())
+        await asyncio.sleep(0.05)
+        assert not second.done()
+
+        async for _ in first:
+            pass
+        await asyncio.wait_for(second, timeout=1)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.stats['admitted'] == 2
@@ -0,0 +1,126 @@
+"""
+The vector stores, an in-process Chroma database and the numpy store shared by two workers
+"""
+import os
+import hashlib
+import threading
+import numpy as np
+import pytest
+from utils.chroma_store import ChromaStore
+from utils.numpy_store import NumpyStore
+from utils.document_handles import DocumentHandleCache
+
+
+def embed(texts):
+    """Deterministic unit vectors, like benchmarks.fake_openai"""
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(16)
+        vectors.append((vector / np.linalg.norm(vector)).tolist())
+    return vectors
+
+
+@pytest.fixture(params=["single", "document", "hashed"])
+def chroma_store(request):
+    return ChromaStore(path=":memory:", sharding=request.param, shards=4)
+
+
+def test_chroma_in_memory_stores_searches_and_deletes(chroma_store):
+    chunks = ["payment is due in thirty days", "either party may terminate", "disputes go to arbitration"]
+    chroma_store.store_pdf_data("doc-a", chunks, embed(chunks), file_name="a.pdf")
+    chroma_store.store_pdf_data("doc-b", ["unrelated text"], embed(["unrelated text"]), file_name="b.pdf")
+
+    results = chroma_store.get_similar_chunks(embed([chunks[1]])[0], n_results=2, doc_id="doc-a")
+    assert results[0]['document'] == chunks[1]
+    assert all(result['metadata']['doc_id'] == "doc-a" for result in results)
+    assert chroma_store.embeddings_exist("doc-a")
+
+    chroma_store.delete_file_data("doc-a")
+    assert not chroma_store.embeddings_exist("doc-a")
+    assert chroma_store.stored_chunk_keys("doc-a") == set()
+    assert chroma_store.get_similar_chunks(embed(["unrelated text"])[0], n_results=1, doc_id="doc-b")
+
+
+def test_chroma_in_memory_stores_are_isolated():
+    first = ChromaStore(path=":memory:")
+    first.store_pdf_data("doc-a", ["only in the first store"], embed(["only in the first store"]))
+    second = ChromaStore(path=":memory:", sharding="document")
+    assert not second.embeddings_exist("doc-a")
+    assert second.stored_chunk_keys("doc-a") == set()
+    assert second.client.list_collections() == []
+
+
+def test_chroma_server_requires_a_shared_catalog():
+    with pytest.raises(ValueError, match="CATALOG_PATH"):
+        ChromaStore(host="chroma.internal")
+
+
+def test_chroma_revision_copies_kept_chunks_and_drops_stale_ones(chroma_store):
+    chroma_store.sync_pdf_data("v1", ["a", "b", "c"], embed, file_name="doc.pdf")
+    # Left behind by an interrupted ingest of the revision
+    chroma_store.store_pdf_data("v2", ["stale"], embed(["stale"]))
+
+    calls = []
+    stats = chroma_store.sync_pdf_data("v2", ["a", "b", "d"], lambda texts: calls.append(texts) or embed(texts),
+                                       file_name="doc.pdf", base_doc_id="v1")
+    assert stats == {'kept': 2, 'added': 1, 'removed': 1}
+    assert calls == [["d"]]
+    assert len(chroma_store.stored_chunk_keys("v2")) == 3
+
+
+def test_chroma_revision_of_a_deleted_source_embeds_everything(chroma_store):
+    chroma_store.sync_pdf_data("v1", ["a", "b"], embed)
+    keys = chroma_store.stored_chunk_keys("v1")
+    chroma_store.delete_file_data("v1")
+    # The source disappears between reading its keys and copying its embeddings
+    chroma_store.stored_chunk_keys = lambda doc_id: keys if doc_id == "v1" else set()
+
+    stats = chroma_store.sync_pdf_data("v2", ["a", "b"], embed, base_doc_id="v1")
+    assert stats['kept'] == 0 and stats['added'] == 2
+
+
+@pytest.mark.parametrize("storage", ["float32", "int8"])
+def test_numpy_workers_see_documents_rewritten_by_each_other(tmp_path, storage):
+    # Two stores on one path stand for two gunicorn workers
+    writer = NumpyStore(path=str(tmp_path), storage=storage)
+    reader = NumpyStore(path=str(tmp_path), storage=storage)
+    handles = DocumentHandleCache(reader)
+
+    first = ["payment is due in thirty days", "either party may terminate"]
+    writer.sync_pdf_data("doc", first, embed, file_name="doc.pdf")
+    handle = handles.get("doc")
+    assert handle.search(embed([first[1]])[0], 1)[0]['document'] == first[1]
+
+    second = ["notice must be given in writing", "the warranty lasts one year", "either party may terminate"]
+    writer.sync_pdf_data("doc", second, embed, file_name="doc.pdf")
+    results = handles.get("doc").search(embed([second[1]])[0], 3)
+    assert results[0]['document'] == second[1]
+    assert sorted(result['document'] for result in results) == sorted(second)
+
+    writer.delete_file_data("doc")
+    assert handles.get("doc") is None
+    assert reader.get_file_chunks("doc") == []
+
+
+def test_numpy_rewrites_never_hide_the_document_from_readers(tmp_path):
+    writer = NumpyStore(path=str(tmp_path))
+    reader = NumpyStore(path=str(tmp_path))
+    chunks = ["payment is due in thirty days", "either party may terminate"]
+    embeddings = embed(chunks)
+    writer.store_pdf_data("doc", chunks, embeddings)
+
+    done = threading.Event()
+
+    def rewrite():
+        for _ in range(50):
+            writer.store_pdf_data("doc", chunks, embeddings)
+        done.set()
+
+    thread = threading.Thread(target=rewrite)
+    thread.start()
+    while not done.is_set():
+        assert reader.stored_chunk_keys("doc")
+    thread.join()
+    # Only the current generation is left next to the catalog
+    assert len([name for name in os.listdir(tmp_path) if not name.startswith("document_catalog")]) == 2
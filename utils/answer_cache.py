@@ -0,0 +1,280 @@
+import os
+import re
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+from array import array
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "true").lower() == "true"  # Reuse answers to repeated questions
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "./answer_cache.sqlite3")
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", 7 * 24 * 3600))  # Seconds an answer is reused
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 50000))  # Least recently used beyond this are evicted
+ANSWER_CACHE_SEMANTIC = os.environ.get("ANSWER_CACHE_SEMANTIC", "false").lower() == "true"  # Also match reworded questions
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", 0.95))  # Cosine similarity of a semantic match
+ANSWER_CACHE_PRUNE_INTERVAL = 300  # Seconds between sweeps of expired answers
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def normalize_question(question):
+    """Lowercase a question, collapse its whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+
+def _hash(*parts):
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def context_chunk_ids(similar_chunks):
+    """Ids of the chunks placed in a prompt, including the chunks merged into packed passages"""
+    return [chunk['id'] for passage in similar_chunks for chunk in passage.get('chunks', [passage])]
+
+
+def context_doc_ids(similar_chunks):
+    """Documents the chunks placed in a prompt come from"""
+    return {chunk['metadata'].get('doc_id') for passage in similar_chunks
+            for chunk in passage.get('chunks', [passage])}
+
+
+class AnswerCache:
+    """
+    On-disk cache of generated answers, shared by every worker on a node
+
+    An answer is keyed by the chat model, the document or documents asked,
+    the ids of the chunks its prompt was built from and the normalized
+    question. Chunk ids are derived from chunk content, so a changed document
+    retrieves other ids and misses the cache; answers are also dropped
+    explicitly when a document they were built from is deleted or ingested
+    again. Entries expire after ttl seconds, and the least recently used are
+    evicted beyond max_entries.
+
+    In semantic mode the question embedding is stored too, and a question
+    retrieving the same chunks reuses the answer to the most similar earlier
+    question if their cosine similarity reaches the threshold.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 semantic=ANSWER_CACHE_SEMANTIC, similarity=ANSWER_CACHE_SIMILARITY):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity = similarity
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pruned_at = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                scope TEXT NOT NULL,
+                question_hash TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                question_vector BLOB,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (scope, question_hash)
+            )
+        """)
+        # Documents each scope's answers were built from, to drop them when a document changes
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answer_documents (
+                doc_id TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                PRIMARY KEY (doc_id, scope)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_created_at ON answers (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_documents_scope ON answer_documents (scope)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        logger.info(f"Answer cache opened at {path} with {self._size} entries")
+
+    @staticmethod
+    def _scope(model, document_key, chunk_ids):
+        """Key shared by the questions answered by a model from the same chunks of the same documents"""
+        return _hash(model, document_key, *sorted(chunk_ids))
+
+    def get(self, model, document_key, chunk_ids, question, question_embedding=None):
+        """
+        Look up the answer to a question asked of the same chunks before
+
+        Parameters:
+        model (str): Name of the chat model
+        document_key (str): Identity of the document or documents asked
+        chunk_ids (list): Ids of the chunks the prompt is built from
+        question (str): The question
+        question_embedding (list, optional): Embedding of the question, used in semantic mode
+
+        Returns:
+        str: The cached answer, or None
+        """
+        scope = self._scope(model, document_key, chunk_ids)
+        question_hash = _hash(normalize_question(question))
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT question_hash, answer FROM answers "
+                "WHERE scope = ? AND question_hash = ? AND created_at >= ?",
+                (scope, question_hash, now - self.ttl)
+            ).fetchone()
+            semantic = False
+            if row is None and self.semantic and question_embedding is not None:
+                row = self._most_similar(scope, question_embedding, now)
+                semantic = row is not None
+
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE scope = ? AND question_hash = ?",
+                               (now, scope, row[0]))
+            self._conn.commit()
+            if semantic:
+                self.semantic_hits += 1
+            else:
+                self.hits += 1
+        logger.info(f"Answer cache hit{' (semantic)' if semantic else ''} for question: {question}")
+        return row[1]
+
+    def _most_similar(self, scope, question_embedding, now):
+        """Return (question_hash, answer) of the scope's question most similar to the embedding, if similar enough"""
+        rows = self._conn.execute(
+            "SELECT question_hash, answer, question_vector FROM answers "
+            "WHERE scope = ? AND created_at >= ? AND question_vector IS NOT NULL",
+            (scope, now - self.ttl)
+        ).fetchall()
+        if not rows:
+            return None
+        import numpy as np
+        query = np.asarray(question_embedding, dtype=np.float32)
+        vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in rows])
+        similarities = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            return None
+        return rows[best][0], rows[best][1]
+
+    def put(self, model, document_key, chunk_ids, question, answer, doc_ids, question_embedding=None):
+        """
+        Store an answer, evicting expired and least recently used entries if needed
+
+        Parameters:
+        model (str): Name of the chat model
+        document_key (str): Identity of the document or documents asked
+        chunk_ids (list): Ids of the chunks the prompt was built from
+        question (str): The question
+        answer (str): The generated answer
+        doc_ids (iterable): Documents the chunks come from
+        question_embedding (list, optional): Embedding of the question, kept in semantic mode
+        """
+        scope = self._scope(model, document_key, chunk_ids)
+        vector = None
+        if self.semantic and question_embedding is not None:
+            vector = array("f", question_embedding).tobytes()
+        question_hash = _hash(normalize_question(question))
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM answers WHERE scope = ? AND question_hash = ?", (scope, question_hash)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(scope, question_hash, question, answer, question_vector, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, question_hash, question, answer, vector, now, now)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO answer_documents (doc_id, scope) VALUES (?, ?)",
+                [(doc_id, scope) for doc_id in doc_ids]
+            )
+            if not exists:
+                self._size += 1
+
+            if now - self._pruned_at >= ANSWER_CACHE_PRUNE_INTERVAL:
+                self._pruned_at = now
+                expired = self._conn.execute(
+                    "SELECT rowid, scope FROM answers WHERE created_at < ?", (now - self.ttl,)
+                ).fetchall()
+                if expired:
+                    self._delete_rows(expired)
+                    logger.info(f"Dropped {len(expired)} expired answers from cache")
+            if self._size > self.max_entries:
+                # Other workers share the file; recount before evicting
+                self._size = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if self._size > self.max_entries:
+                evicted = self._conn.execute(
+                    "SELECT rowid, scope FROM answers ORDER BY last_used ASC LIMIT ?",
+                    (self._size - self.max_entries,)
+                ).fetchall()
+                self._delete_rows(evicted)
+                logger.info(f"Evicted {len(evicted)} least recently used answers from cache")
+            self._conn.commit()
+
+    def _delete_rows(self, rows):
+        """Delete answers given as (rowid, scope), and the document mappings of scopes left without answers"""
+        for start in range(0, len(rows), _LOOKUP_BATCH):
+            batch = rows[start:start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM answers WHERE rowid IN ({placeholders})", [row[0] for row in batch])
+            scopes = list({row[1] for row in batch})
+            placeholders = ",".join("?" * len(scopes))
+            self._conn.execute(
+                f"DELETE FROM answer_documents WHERE scope IN ({placeholders}) AND NOT EXISTS "
+                f"(SELECT 1 FROM answers WHERE answers.scope = answer_documents.scope)",
+                scopes
+            )
+        self._size -= len(rows)
+
+    def invalidate(self, doc_id):
+        """
+        Drop every answer built from a document's chunks
+
+        Parameters:
+        doc_id (str): Identity of the document that was deleted or ingested again
+
+        Returns:
+        int: Number of answers dropped
+        """
+        with self._lock:
+            scopes = [row[0] for row in self._conn.execute(
+                "SELECT scope FROM answer_documents WHERE doc_id = ?", (doc_id,)
+            ).fetchall()]
+            dropped = 0
+            for start in range(0, len(scopes), _LOOKUP_BATCH):
+                batch = scopes[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                dropped += self._conn.execute(f"DELETE FROM answers WHERE scope IN ({placeholders})", batch).rowcount
+                self._conn.execute(f"DELETE FROM answer_documents WHERE scope IN ({placeholders})", batch)
+            self._conn.commit()
+            self._size -= dropped
+        if dropped:
+            logger.info(f"Dropped {dropped} cached answers of {doc_id}")
+        return dropped
+
+    def stats(self):
+        """Return hit/miss counters and the current number of cached answers"""
+        with self._lock:
+            total = self.hits + self.semantic_hits + self.misses
+            return {
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.semantic_hits) / total if total else 0.0,
+                'entries': self._size,
+                'max_entries': self.max_entries
+            }
@@ -0,0 +1,140 @@
+"""
+Prompt, context and answer-cache logic shared by the threaded and the async answer paths
+"""
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+from utils.answer_cache import AnswerCache, ANSWER_CACHE, context_chunk_ids, context_doc_ids
+from utils.context_packer import pack_context, CONTEXT_TOKEN_BUDGET, CONTEXT_CANDIDATES
+from utils import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Answer settings
+CHAT_MODEL = os.environ.get("CHAT_MODEL", "gpt-3.5-turbo")
+ANSWER_TEMPERATURE = float(os.environ.get("ANSWER_TEMPERATURE", 0.1))
+ANSWER_TOP_K = int(os.environ.get("ANSWER_TOP_K", 3))  # Chunks placed in the answer prompt when context packing is off
+# Chunks retrieved per question; packing picks from a larger candidate set to fill its token budget
+RETRIEVAL_TOP_K = CONTEXT_CANDIDATES if CONTEXT_TOKEN_BUDGET > 0 else ANSWER_TOP_K
+ANSWER_MAX_TOKENS_ESTIMATE = int(os.environ.get("ANSWER_MAX_TOKENS_ESTIMATE", 512))  # Completion tokens reserved per answer
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the on-disk answer cache, opening its database on first use, or None if ANSWER_CACHE is off"""
+    global _answer_cache
+    if _answer_cache is None and ANSWER_CACHE:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def invalidate_answers(doc_id):
+    """Drop the cached answers built from a document, after it was deleted or ingested again"""
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate(doc_id)
+
+
+def cached_answer(question, document, similar_chunks, question_embedding=None):
+    """Return the cached answer to a question asked of the same chunks before, or None"""
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return None
+    answer = answer_cache.get(CHAT_MODEL, document.cache_key, context_chunk_ids(similar_chunks),
+                              question, question_embedding)
+    metrics.inc('answer_cache_total', result="hit" if answer is not None else "miss")
+    return answer
+
+
+def cache_answer(question, document, similar_chunks, answer, question_embedding=None):
+    """Keep a generated answer for later questions retrieving the same chunks"""
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.put(CHAT_MODEL, document.cache_key, context_chunk_ids(similar_chunks), question, answer,
+                         context_doc_ids(similar_chunks), question_embedding)
+
+
+def embedding_input(texts):
+    """Texts as sent to the embedding model, with newlines flattened as before"""
+    return [text.replace("\n", " ") for text in texts]
+
+
+def describe_error(e):
+    """Map an exception raised while answering to a user-facing message"""
+    from openai import RateLimitError, APIConnectionError, APIError
+    from httpx import HTTPStatusError
+    if isinstance(e, RateLimitError) and getattr(e, "code", None) != "insufficient_quota":
+        return "OpenAI API is rate limiting requests. Please try again shortly."
+    if isinstance(e, (RateLimitError, HTTPStatusError)):
+        return "OpenAI API quota exceeded. Please check your billing details and current quota."
+    if isinstance(e, APIConnectionError):
+        return "Failed to connect to OpenAI API. Please check your internet connection."
+    if isinstance(e, APIError):
+        return "OpenAI API error. Please check your API key and billing status."
+    return f"Error getting answer: {str(e)}"
+
+
+def build_answer_messages(question, similar_chunks):
+    """Assemble the chat messages for answering a question from retrieved chunks"""
+    doc_ids = {chunk['metadata'].get('doc_id') for chunk in similar_chunks}
+    if len(doc_ids) <= 1:
+        context = "\n\n".join([chunk['document'] for chunk in similar_chunks])
+        instructions = ("Answer the question using only the provided PDF context. "
+                        "If the context does not contain the answer, say so.")
+    else:
+        # Label each chunk with its document so the answer can attribute sources
+        context = "\n\n".join([
+            f"[Source: {chunk['metadata'].get('file_name')}]\n{chunk['document']}" for chunk in similar_chunks
+        ])
+        instructions = ("Answer the question using only the provided context from several PDFs. "
+                        "Name the source PDF of each fact you use. "
+                        "If the context does not contain the answer, say so.")
+    return [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": f"Context: {context}\n\nQuestion: {question}"}
+    ]
+
+
+def select_context(similar_chunks):
+    """Pack retrieved chunks into passages within the context token budget, unless packing is off"""
+    if CONTEXT_TOKEN_BUDGET <= 0 or not similar_chunks:
+        return similar_chunks
+    return pack_context(similar_chunks)
+
+
+def describe_sources(similar_chunks):
+    """Summarize retrieved chunks (or the chunks merged into packed passages) as source entries for API responses"""
+    return [{
+        'id': chunk['id'],
+        'doc_id': chunk['metadata'].get('doc_id'),
+        'file_name': chunk['metadata'].get('file_name'),
+        'chunk_index': chunk['metadata'].get('chunk_index'),
+        'distance': chunk['distance']
+    } for passage in similar_chunks for chunk in passage.get('chunks', [passage])]
+
+
+def group_sources(similar_chunks):
+    """Group retrieved chunks by document, in order of each document's best match"""
+    documents = {}
+    for source in describe_sources(similar_chunks):
+        entry = documents.setdefault(source['doc_id'], {
+            'doc_id': source['doc_id'],
+            'file_name': source['file_name'],
+            'chunks': []
+        })
+        entry['chunks'].append({
+            'id': source['id'],
+            'chunk_index': source['chunk_index'],
+            'distance': source['distance']
+        })
+    return list(documents.values())
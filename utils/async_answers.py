@@ -0,0 +1,249 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from utils.model_scheduler import embedding_scheduler, chat_scheduler, estimate_tokens, INTERACTIVE, BULK
+from utils import metrics
+from utils.pdf_processor import (
+    EMBED_MODEL, EMBED_BATCH_SIZE, ANSWER_CONCURRENCY, OPENAI_API_KEY, OPENAI_MAX_CONNECTIONS, get_embedding_cache
+)
+from utils.answering import (
+    CHAT_MODEL, ANSWER_TEMPERATURE, RETRIEVAL_TOP_K, ANSWER_MAX_TOKENS_ESTIMATE, cached_answer, cache_answer,
+    embedding_input, describe_error, build_answer_messages, select_context, describe_sources, group_sources
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_async_client = None
+
+
+def get_async_client():
+    """
+    Return the non-blocking client of the async serving mode, creating it on first use
+
+    Waiting on OpenAI holds no thread. The aiohttp transport stays cheap with
+    hundreds of open connections, where httpx's own async pool spends most of
+    its CPU rescanning queued requests. Only called from the event loop thread.
+    """
+    global _async_client
+    if _async_client is None:
+        import httpx
+        from httpx_aiohttp import HttpxAiohttpClient
+        from openai import AsyncOpenAI, DEFAULT_TIMEOUT
+        _async_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            max_retries=0,  # Retries are left to the model scheduler
+            http_client=HttpxAiohttpClient(
+                timeout=DEFAULT_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                )
+            )
+        )
+    return _async_client
+
+
+async def embed_texts_async(texts, batch_size=EMBED_BATCH_SIZE):
+    """
+    Embed texts without blocking the event loop, sharing the on-disk embedding cache
+
+    Parameters:
+    texts (list): Texts to embed
+    batch_size (int): Number of texts sent in a single embedding request
+
+    Returns:
+    list: One embedding per text, in input order
+    """
+    if not texts:
+        return []
+
+    embeddings = await asyncio.to_thread(get_embedding_cache().get_many, EMBED_MODEL, texts)
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    metrics.inc('embedding_cache_total', len(texts) - len(missing), result="hit")
+    metrics.inc('embedding_cache_total', len(missing), result="miss")
+    if not missing:
+        return embeddings
+
+    batches = [embedding_input(missing[i:i + batch_size]) for i in range(0, len(missing), batch_size)]
+    responses = await asyncio.gather(*[
+        embedding_scheduler.acall(
+            lambda batch=batch: get_async_client().embeddings.create(model=EMBED_MODEL, input=batch),
+            tokens=estimate_tokens(batch)
+        ) for batch in batches
+    ])
+    for response in responses:
+        metrics.record_usage("embedding", getattr(response, "usage", None))
+    fresh = [item.embedding for response in responses for item in sorted(response.data, key=lambda d: d.index)]
+    await asyncio.to_thread(get_embedding_cache().put_many, EMBED_MODEL, missing, fresh)
+
+    fresh_by_text = dict(zip(missing, fresh))
+    return [embedding if embedding is not None else fresh_by_text[text] for text, embedding in zip(texts, embeddings)]
+
+
+async def _retrieve_chunks_async(question, document):
+    """Embed the question and run the vector search on a worker thread, returning (embedding, chunks)"""
+    with metrics.stage("query_embed"):
+        question_embedding = (await embed_texts_async([question]))[0]
+    with metrics.stage("vector_search"):
+        similar_chunks = await asyncio.to_thread(document.search, question_embedding, RETRIEVAL_TOP_K)
+    if not similar_chunks:
+        raise Exception("No relevant content found in PDF")
+    logger.info(f"Retrieved {len(similar_chunks)} relevant chunks from the vector store")
+    return question_embedding, select_context(similar_chunks)
+
+
+async def _create_completion(messages, priority=INTERACTIVE):
+    """Async counterpart of pdf_processor._create_completion"""
+    tokens = estimate_tokens([message['content'] for message in messages]) + ANSWER_MAX_TOKENS_ESTIMATE
+    response = await chat_scheduler.acall(
+        lambda: get_async_client().chat.completions.create(
+            model=CHAT_MODEL, messages=messages, temperature=ANSWER_TEMPERATURE
+        ),
+        tokens=tokens,
+        priority=priority
+    )
+    metrics.record_usage("chat", getattr(response, "usage", None))
+    return response
+
+
+async def _stream_completion(messages, priority=INTERACTIVE):
+    """Async counterpart of pdf_processor._stream_completion"""
+    tokens = estimate_tokens([message['content'] for message in messages]) + ANSWER_MAX_TOKENS_ESTIMATE
+    events = chat_scheduler.astream(
+        lambda: get_async_client().chat.completions.create(
+            model=CHAT_MODEL, messages=messages, temperature=ANSWER_TEMPERATURE,
+            stream=True, stream_options={"include_usage": True}
+        ),
+        tokens=tokens,
+        priority=priority
+    )
+    async with aclosing(events):
+        async for event in events:
+            metrics.record_usage("chat", getattr(event, "usage", None))
+            yield event
+
+
+async def _complete(question, similar_chunks, document, question_embedding, priority=INTERACTIVE):
+    """Answer from the retrieved chunks, reusing a cached answer; cache lookups run on a worker thread"""
+    answer = await asyncio.to_thread(cached_answer, question, document, similar_chunks, question_embedding)
+    if answer is not None:
+        return answer
+    with metrics.stage("llm_completion"):
+        response = await _create_completion(build_answer_messages(question, similar_chunks), priority)
+    answer = response.choices[0].message.content if response.choices else None
+    if not answer or answer.strip() == "":
+        raise Exception("No answer could be generated from the PDF content")
+    await asyncio.to_thread(cache_answer, question, document, similar_chunks, answer, question_embedding)
+    return answer
+
+
+async def get_answer_async(question, document, with_sources=False):
+    """
+    Async counterpart of get_answer_from_pdf and get_answer_from_pdfs
+
+    Parameters:
+    question (str): The question to answer
+    document (DocumentHandle or DocumentSetHandle): Retrieval handle of the PDF or PDFs
+    with_sources (bool): Return a dict with 'answer' and per-document 'sources' instead of the answer text
+
+    Returns:
+    str or dict: The answer, or the answer with its sources
+
+    Raises:
+    Exception: If there's an error getting the answer, with a user-facing message
+    """
+    try:
+        logger.info(f"Getting answer for question: {question}")
+        question_embedding, similar_chunks = await _retrieve_chunks_async(question, document)
+        answer = await _complete(question, similar_chunks, document, question_embedding)
+        logger.info("Answer generated successfully")
+        if with_sources:
+            return {'answer': answer, 'sources': group_sources(similar_chunks)}
+        return answer
+
+    except Exception as e:
+        error_msg = describe_error(e)
+        logger.error(f"{error_msg} Error: {str(e)}")
+        raise Exception(error_msg)
+
+
+async def get_answers_async(questions, document, concurrency=ANSWER_CONCURRENCY):
+    """
+    Async counterpart of get_answers_from_pdf
+
+    Returns:
+    list: One dict per question, in order, with 'question' and either 'answer' or 'error'
+
+    Raises:
+    Exception: If embedding or retrieval fails for the whole batch
+    """
+    try:
+        with metrics.stage("query_embed"):
+            question_embeddings = await embed_texts_async(questions)
+        with metrics.stage("vector_search"):
+            retrieved = await asyncio.to_thread(document.search_batch, question_embeddings, RETRIEVAL_TOP_K)
+        retrieved = [select_context(similar_chunks) for similar_chunks in retrieved]
+    except Exception as e:
+        error_msg = describe_error(e)
+        logger.error(f"{error_msg} Error: {str(e)}")
+        raise Exception(error_msg)
+
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer_one(question, similar_chunks, question_embedding):
+        if not similar_chunks:
+            return {'question': question, 'error': "No relevant content found in PDF"}
+        async with limit:
+            try:
+                answer = await _complete(question, similar_chunks, document, question_embedding, BULK)
+                return {'question': question, 'answer': answer}
+            except Exception as e:
+                error_msg = describe_error(e)
+                logger.error(f"{error_msg} Error: {str(e)}")
+                return {'question': question, 'error': error_msg}
+
+    return await asyncio.gather(*[
+        answer_one(q, chunks, embedding) for q, chunks, embedding in zip(questions, retrieved, question_embeddings)
+    ])
+
+
+async def stream_answer_async(question, document):
+    """
+    Async counterpart of stream_answer_from_pdf, yielding the same events
+
+    Raises:
+    Exception: If there's an error getting the answer, with a user-facing message
+    """
+    try:
+        logger.info(f"Streaming answer for question: {question}")
+        question_embedding, similar_chunks = await _retrieve_chunks_async(question, document)
+        yield {'type': 'sources', 'sources': describe_sources(similar_chunks)}
+
+        answer = await asyncio.to_thread(cached_answer, question, document, similar_chunks, question_embedding)
+        if answer is not None:
+            yield {'type': 'token', 'text': answer}
+            yield {'type': 'done'}
+            return
+
+        parts = []
+        with metrics.stage("llm_completion"):
+            async with aclosing(_stream_completion(build_answer_messages(question, similar_chunks))) as stream:
+                async for event in stream:
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield {'type': 'token', 'text': delta}
+
+        if "".join(parts).strip():
+            await asyncio.to_thread(cache_answer, question, document, similar_chunks, "".join(parts),
+                                    question_embedding)
+        yield {'type': 'done'}
+
+    except Exception as e:
+        error_msg = describe_error(e)
+        logger.error(f"{error_msg} Error: {str(e)}")
+        raise Exception(error_msg)
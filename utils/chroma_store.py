@@ -1,148 +1,585 @@
+import os
+import re
+import atexit
+import shutil
+import hashlib
+import tempfile
 import chromadb
 import logging
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from utils.document_catalog import DocumentCatalog
+from utils.vector_store import VectorStore
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 import json
 
-class ChromaStore:
-    def __init__(self):
-        """Initialize ChromaDB client and collection"""
-        self.client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.client.get_or_create_collection(
-            name="pdf_embeddings",
-            metadata={"description": "Store PDF embeddings and related data"}
-        )
+CHROMA_PATH = os.environ.get("CHROMA_PATH", "./chroma_db")  # ":memory:" for a throwaway database, for tests
+# A Chroma server shared by every worker, instead of an embedded database per process
+CHROMA_HOST = os.environ.get("CHROMA_HOST")
+CHROMA_PORT = int(os.environ.get("CHROMA_PORT", 8000))
+CHROMA_SSL = os.environ.get("CHROMA_SSL", "false").lower() == "true"
+CATALOG_PATH = os.environ.get("CATALOG_PATH")  # Default: document_catalog.sqlite3 in CHROMA_PATH; required with CHROMA_HOST
+SHARDING = os.environ.get("SHARDING", "single")  # Collections chunks are spread over: single, document, tenant or hashed
+CHROMA_SHARDS = int(os.environ.get("CHROMA_SHARDS", 16))  # Collections of hashed sharding
+CHROMA_TENANT = os.environ.get("CHROMA_TENANT", "default")  # Tenant of this deployment, for tenant sharding
+SHARD_QUERY_WORKERS = int(os.environ.get("SHARD_QUERY_WORKERS", 8))  # Shards searched in parallel
+
+COLLECTION_NAME = "pdf_embeddings"  # The single collection, and where unsharded stores keep their chunks
+MIGRATION_PAGE_SIZE = 1000  # Chunks moved per request when sharding an existing collection
+
+
+def create_chroma_client(path=CHROMA_PATH, host=CHROMA_HOST):
+    """
+    Create the ChromaDB client selected by configuration
+    
+    An embedded PersistentClient keeps its index in the memory of the process
+    that opened it, so several workers writing one path each see a stale index.
+    With CHROMA_HOST set, every worker talks to the same Chroma server instead.
+    
+    Parameters:
+    path (str): Directory of the embedded database, or ":memory:" for a throwaway one
+    host (str, optional): Host of a Chroma server, which takes precedence over path
+    
+    Returns:
+    chromadb.api.ClientAPI: The client
+    """
+    if host:
+        logging.info(f"Connecting to Chroma server at {host}:{CHROMA_PORT}")
+        return chromadb.HttpClient(host=host, port=CHROMA_PORT, ssl=CHROMA_SSL)
+    if path == ":memory:":
+        # Every EphemeralClient of a process shares one database; a temporary directory
+        # gives each store its own, removed when the process exits
+        path = tempfile.mkdtemp(prefix="chroma-")
+        atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return chromadb.PersistentClient(path=path)
+
+
+class ShardRouter:
+    """
+    Maps documents to the Chroma collection (shard) holding their chunks
+
+    Strategies:
+    single: every document in one collection, isolated by doc_id filters
+    document: a collection per document, searched without filters and dropped as a whole on delete
+    tenant: a collection per tenant (CHROMA_TENANT), so deployments sharing a Chroma server stay apart
+    hashed: documents spread over a fixed number of collections by a hash of their doc_id
+
+    Shard names are derived from the doc_id alone, so every worker routes alike
+    without sharing any state.
+    """
+
+    STRATEGIES = ("single", "document", "tenant", "hashed")
+
+    def __init__(self, strategy=SHARDING, shards=CHROMA_SHARDS, tenant=CHROMA_TENANT):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown sharding strategy {strategy}; expected one of {', '.join(self.STRATEGIES)}")
+        if strategy == "hashed" and shards < 1:
+            raise ValueError("CHROMA_SHARDS must be at least 1")
+        # Collection names allow letters, digits, _ and -, ending in a letter or digit
+        if strategy == "tenant" and not re.fullmatch(r"[A-Za-z0-9_-]{0,39}[A-Za-z0-9]", tenant or ""):
+            raise ValueError("CHROMA_TENANT must be up to 40 letters, digits, _ or -, ending in a letter or digit")
+        self.strategy = strategy
+        self.shards = shards
+        self.tenant = tenant
+
+    @property
+    def dedicated(self):
+        """True if every shard holds the chunks of a single document"""
+        return self.strategy == "document"
+
+    def shard(self, doc_id=None):
+        """Return the name of the collection holding a document's chunks"""
+        if self.strategy == "single":
+            return COLLECTION_NAME
+        if self.strategy == "tenant":
+            return f"pdf_tenant_{self.tenant}"
+        # doc_ids are content hashes, or file names for legacy documents; hashing keeps names valid
+        digest = hashlib.sha256(doc_id.encode("utf-8")).hexdigest()
+        if self.strategy == "document":
+            return f"pdf_doc_{digest[:48]}"
+        return f"pdf_shard_{int(digest[:16], 16) % self.shards}_of_{self.shards}"
+
+    def group(self, doc_ids):
+        """Group documents by the shard holding them"""
+        groups = {}
+        for doc_id in doc_ids:
+            groups.setdefault(self.shard(doc_id), []).append(doc_id)
+        return groups
+
+
+class ChromaStore(VectorStore):
+    """Vector store backed by ChromaDB collections, embedded or on a Chroma server, routed by a ShardRouter"""
+
+    def __init__(self, path=CHROMA_PATH, host=CHROMA_HOST, catalog_path=CATALOG_PATH, sharding=SHARDING,
+                 shards=CHROMA_SHARDS, tenant=CHROMA_TENANT):
+        """Initialize ChromaDB client, shard router and document catalog"""
+        if not catalog_path and host:
+            # The catalog is not kept in Chroma; nodes sharing a server must share it as well
+            raise ValueError("CATALOG_PATH must be set with CHROMA_HOST, to the same catalog file on every node")
+        self.client = create_chroma_client(path, host)
+        self.router = ShardRouter(sharding, shards, tenant)
+        self._collections = {}  # Shard name -> collection handle
+        self._collections_lock = threading.Lock()
+        if not catalog_path:
+            catalog_path = ":memory:" if path == ":memory:" else os.path.join(path, "document_catalog.sqlite3")
+        self.catalog = DocumentCatalog(catalog_path)
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
-        logging.info("ChromaDB initialized successfully")
+        self._bootstrap_catalog()
+        if self.router.strategy != "single":
+            self._shard_legacy_collection()
+        logging.info(f"ChromaDB initialized successfully with {self.router.strategy} sharding")
+
+    def _collection(self, name, create=False):
+        """
+        Look up a shard's collection, refreshing the handle cached for searches
+        
+        Parameters:
+        name (str): Shard name, from the router
+        create (bool): Create the collection if it does not exist
+        
+        Returns:
+        Collection: The collection, or None if it does not exist and create is False
+        """
+        if create:
+            collection = self.client.get_or_create_collection(
+                name=name,
+                metadata={"description": "Store PDF embeddings and related data"}
+            )
+        else:
+            try:
+                collection = self.client.get_collection(name)
+            except ValueError:
+                with self._collections_lock:
+                    self._collections.pop(name, None)
+                return None
+        with self._collections_lock:
+            self._collections[name] = collection
+        return collection
+
+    def _cached_collection(self, name):
+        """Return the cached handle of a shard's collection, looking it up on first use"""
+        with self._collections_lock:
+            collection = self._collections.get(name)
+        return collection if collection is not None else self._collection(name)
+
+    def _shard_of(self, doc_id, create=False):
+        """Return the collection holding a document's chunks, or None if it does not exist"""
+        return self._collection(self.router.shard(doc_id), create)
+
+    def _doc_filter(self, doc_id):
+        """Metadata filter selecting a document's chunks within its shard, or None when the shard is the document"""
+        return None if self.router.dedicated else {"doc_id": doc_id}
+
+    def _drop_document(self, doc_id):
+        """Remove a document's chunks: a dedicated shard is dropped as a whole, others are filtered"""
+        name = self.router.shard(doc_id)
+        if self.router.dedicated:
+            try:
+                self.client.delete_collection(name)
+            except ValueError:
+                pass  # Ignore if document doesn't exist
+            with self._collections_lock:
+                self._collections.pop(name, None)
+            return
+        collection = self._collection(name)
+        if collection is not None:
+            collection.delete(where={"doc_id": doc_id})
+
+    def _legacy_collection(self):
+        """Return the single collection of an unsharded store, or None if it does not exist"""
+        if self.router.strategy == "single":
+            return self._collection(COLLECTION_NAME, create=True)
+        return self._collection(COLLECTION_NAME)
+
+    def _shard_legacy_collection(self):
+        """Move the chunks of the single collection into their shards, once, after sharding is turned on"""
+        legacy = self._legacy_collection()
+        if legacy is None:
+            return
+        moved = 0
+        for entry in self.catalog.list_documents():
+            doc_id = entry['doc_id']
+            shard = self._shard_of(doc_id, create=True)
+            while True:
+                results = legacy.get(where={"doc_id": doc_id}, limit=MIGRATION_PAGE_SIZE,
+                                     include=["embeddings", "documents", "metadatas"])
+                if not results['ids']:
+                    break
+                shard.upsert(
+                    ids=results['ids'],
+                    documents=results['documents'],
+                    embeddings=results['embeddings'],
+                    metadatas=results['metadatas']
+                )
+                legacy.delete(ids=results['ids'])
+                moved += len(results['ids'])
+        if legacy.count() == 0:
+            self.client.delete_collection(COLLECTION_NAME)
+            with self._collections_lock:
+                self._collections.pop(COLLECTION_NAME, None)
+        else:
+            logging.warning(f"{legacy.count()} chunks of {COLLECTION_NAME} belong to no catalogued document; "
+                            f"leaving them in place")
+        if moved:
+            logging.info(f"Moved {moved} chunks of {COLLECTION_NAME} into {self.router.strategy} shards")
+
+    def _bootstrap_catalog(self):
+        """Build the document catalog from chunk metadata for collections created before it existed"""
+        legacy = self._legacy_collection()
+        if legacy is None:
+            return
+        if self.catalog.count() > 0 or legacy.count() == 0:
+            return
+        
+        logging.info("Building document catalog from existing chunks...")
+        results = legacy.get(include=["metadatas"])
+        documents = {}
+        for metadata in results['metadatas']:
+            doc_id = metadata.get('doc_id') or metadata.get('file_name')
+            if doc_id and doc_id not in documents:
+                documents[doc_id] = metadata
+        for doc_id, metadata in documents.items():
+            file_name = metadata.get('file_name', doc_id)
+            self.catalog.upsert(
+                doc_id=doc_id,
+                file_name=file_name,
+                chunk_count=metadata.get('total_chunks', 0),
+                upload_time=metadata.get('timestamp', datetime.now().isoformat())
+            )
+            self.catalog.set_alias(file_name, doc_id)
+        self._tag_legacy_chunks(legacy, [doc_id for doc_id, metadata in documents.items() if 'doc_id' not in metadata])
+        logging.info(f"Document catalog built with {len(documents)} documents")
 
-    def store_pdf_data(self, file_name, chunks, embeddings, metadata=None):
+    def _tag_legacy_chunks(self, collection, file_names):
+        """Add a doc_id (equal to the file name) to chunks stored before content-hash identity"""
+        for file_name in file_names:
+            results = collection.get(where={"file_name": file_name}, include=["metadatas"])
+            if not results['ids']:
+                continue
+            metadatas = [dict(metadata, doc_id=file_name) for metadata in results['metadatas']]
+            collection.update(ids=results['ids'], metadatas=metadatas)
+            logging.info(f"Tagged {len(results['ids'])} legacy chunks of {file_name} with doc_id")
+
+    def store_pdf_data(self, doc_id, chunks, embeddings, metadata=None, file_name=None, content_hash=None, model=None):
         """
         Store PDF data in ChromaDB
         
         Parameters:
-        file_name (str): Name of the PDF file
+        doc_id (str): Identity of the document (SHA-256 of its content)
         chunks (list): List of text chunks
         embeddings (list): List of embeddings for each chunk
         metadata (dict): Additional metadata about the PDF
+        file_name (str, optional): Name the PDF was uploaded under
+        content_hash (str, optional): SHA-256 of the PDF, recorded in the catalog
+        model (str, optional): Embedding model name, recorded in the catalog
         """
         try:
-            # Generate unique IDs for each chunk
-            ids = [f"{file_name}_{i}" for i in range(len(chunks))]
+            file_name = file_name or doc_id
+            
+            # Generate stable, content-derived IDs for each chunk
+            ids = self._chunk_ids(doc_id, chunks)
             
             # Get current timestamp
             timestamp = datetime.now().isoformat()
             
             # Prepare metadata for each chunk
-            metadatas = [{
-                "file_name": file_name,
-                "chunk_index": i,
-                "timestamp": timestamp,  # Same timestamp for all chunks of a file
-                "total_chunks": len(chunks),
-                "chunk_size": len(chunk)
-            } for i, chunk in enumerate(chunks)]
-            
-            # Delete existing data for this file if it exists
+            metadatas = self._chunk_metadatas(doc_id, file_name, chunks, timestamp)
+            
+            # Delete existing chunks for this document if there are any
             try:
-                self.delete_file_data(file_name)
-                logging.info(f"Deleted existing data for {file_name}")
+                self._drop_document(doc_id)
+                logging.info(f"Deleted existing data for {doc_id}")
             except Exception:
-                pass  # Ignore if file doesn't exist
+                pass  # Ignore if document doesn't exist
             
-            # Store in ChromaDB
-            self.collection.add(
+            # Store in the document's shard
+            self._shard_of(doc_id, create=True).add(
                 ids=ids,
                 documents=chunks,
                 embeddings=embeddings,
                 metadatas=metadatas
             )
-            logging.info(f"Successfully stored {len(chunks)} chunks for {file_name}")
+            self.catalog.upsert(
+                doc_id=doc_id,
+                file_name=file_name,
+                chunk_count=len(chunks),
+                upload_time=timestamp,
+                content_hash=content_hash,
+                model=model
+            )
+            logging.info(f"Successfully stored {len(chunks)} chunks for {file_name} ({doc_id})")
             
         except Exception as e:
             logging.error(f"Error storing PDF data: {str(e)}")
             raise
 
-    def get_similar_chunks(self, query_embedding, n_results=5, file_name=None):
+    def sync_pdf_data(self, doc_id, chunks, embed_fn, file_name=None, content_hash=None, model=None, base_doc_id=None):
+        """
+        Incrementally store PDF data, embedding only chunks that are not stored yet
+        
+        Chunks are compared by their content-derived IDs with the chunks stored for
+        base_doc_id (the previous version of the document); without a base every
+        chunk is new. Kept chunks reuse their stored embeddings, new chunks are
+        embedded with embed_fn, and chunks that disappeared are not carried over.
+        
+        Parameters:
+        doc_id (str): Identity of the document (SHA-256 of its content)
+        chunks (list): List of text chunks, in document order
+        embed_fn (callable): Called with the list of new chunk texts; returns their embeddings
+        file_name (str, optional): Name the PDF was uploaded under
+        content_hash (str, optional): SHA-256 of the PDF, recorded in the catalog
+        model (str, optional): Embedding model name, recorded in the catalog
+        base_doc_id (str, optional): Stored document this one is a revision of
+        
+        Returns:
+        dict: Counts of kept, added and removed chunks
+        """
+        try:
+            file_name = file_name or doc_id
+            timestamp = datetime.now().isoformat()
+            
+            ids = self._chunk_ids(doc_id, chunks)
+            metadatas = self._chunk_metadatas(doc_id, file_name, chunks, timestamp)
+            keys = [chunk_id[len(doc_id) + 1:] for chunk_id in ids]
+            
+            # Compare with the chunks stored for the previous version
+            stored_keys = self.stored_chunk_keys(base_doc_id) if base_doc_id else set()
+            
+            kept = [i for i, key in enumerate(keys) if key in stored_keys]
+            added = [i for i, key in enumerate(keys) if key not in stored_keys]
+            removed_keys = stored_keys - set(keys)
+            
+            previous_embeddings = {}
+            if kept:
+                # Kept chunks are copied from the previous version, which may live in another shard
+                source = self._shard_of(base_doc_id)
+                if source is not None:
+                    previous = source.get(
+                        ids=[f"{base_doc_id}_{keys[i]}" for i in kept],
+                        include=["embeddings"]
+                    )
+                    previous_embeddings = dict(zip(previous['ids'], previous['embeddings']))
+                lost = [i for i in kept if f"{base_doc_id}_{keys[i]}" not in previous_embeddings]
+                if lost:
+                    # The previous version was deleted meanwhile: embed its chunks again
+                    logging.warning(f"{len(lost)} chunks of {base_doc_id} disappeared during the sync of {doc_id}")
+                    kept = [i for i in kept if i not in set(lost)]
+                    added = sorted(added + lost)
+            
+            # Embed only the chunks that are new
+            new_embeddings = embed_fn([chunks[i] for i in added]) if added else []
+            
+            # Drop chunks left under the new id by an interrupted earlier ingest
+            self._drop_document(doc_id)
+            collection = self._shard_of(doc_id, create=True)
+            if kept:
+                collection.upsert(
+                    ids=[ids[i] for i in kept],
+                    documents=[chunks[i] for i in kept],
+                    embeddings=[previous_embeddings[f"{base_doc_id}_{keys[i]}"] for i in kept],
+                    metadatas=[metadatas[i] for i in kept]
+                )
+            
+            if added:
+                collection.upsert(
+                    ids=[ids[i] for i in added],
+                    documents=[chunks[i] for i in added],
+                    embeddings=new_embeddings,
+                    metadatas=[metadatas[i] for i in added]
+                )
+            
+            self.catalog.upsert(
+                doc_id=doc_id,
+                file_name=file_name,
+                chunk_count=len(chunks),
+                upload_time=timestamp,
+                content_hash=content_hash,
+                model=model
+            )
+            stats = {'kept': len(kept), 'added': len(added), 'removed': len(removed_keys)}
+            logging.info(f"Synced {len(chunks)} chunks for {file_name} ({doc_id}) against {base_doc_id}: {stats}")
+            return stats
+            
+        except Exception as e:
+            logging.error(f"Error syncing PDF data: {str(e)}")
+            raise
+
+    def stored_chunk_keys(self, doc_id):
+        """Return the content-derived keys of the chunks stored for a document"""
+        collection = self._shard_of(doc_id)
+        if collection is None:
+            return set()
+        stored_ids = collection.get(where=self._doc_filter(doc_id), include=[])['ids']
+        return {chunk_id[len(doc_id) + 1:] for chunk_id in stored_ids}
+
+    def _where(self, doc_ids):
+        """Metadata filter restricting a shard query to the given documents, or None for the whole shard"""
+        if doc_ids is None or self.router.dedicated:
+            return None
+        if len(doc_ids) == 1:
+            return {"doc_id": doc_ids[0]}
+        return {"doc_id": {"$in": doc_ids}}
+
+    def _scope_shards(self, scope):
+        """Map the shards a search covers to the documents to filter each by, None searching a whole shard"""
+        if scope is not None:
+            return self.router.group(scope)
+        if self.router.strategy in ("single", "tenant"):
+            return {self.router.shard(): None}
+        # Every stored document's shard; hashed shards hold nothing else, so none needs a filter
+        return {name: None for name in self.router.group(entry['doc_id'] for entry in self.catalog.list_documents())}
+
+    def _query(self, query_embeddings, n_results, scope):
+        """
+        Query the shards holding the scope's documents and merge their results
+        
+        A document's own shard answers a per-document search alone; searches over
+        documents in several shards query those shards in parallel and keep the
+        n_results nearest chunks of each query.
+        
+        Parameters:
+        query_embeddings (list): Embedding vectors of the queries
+        n_results (int): Number of similar chunks to return per query
+        scope (list): doc_ids to search, or None for all documents
+        
+        Returns:
+        list: One list of similar chunks per query, nearest first
+        """
+        def query_shard(shard):
+            name, doc_ids = shard
+            query_args = {'query_embeddings': query_embeddings, 'n_results': n_results}
+            where = self._where(doc_ids)
+            if where:
+                query_args['where'] = where
+            collection = self._cached_collection(name)
+            if collection is None:
+                return None
+            try:
+                return collection.query(**query_args)
+            except Exception:
+                # Another worker may have dropped or recreated the shard since its handle was cached
+                current = self._collection(name)
+                if current is None:
+                    return None
+                if current.id == collection.id:
+                    raise
+                return current.query(**query_args)
+
+        shards = list(self._scope_shards(scope).items())
+        if len(shards) > 1 and SHARD_QUERY_WORKERS > 1:
+            with ThreadPoolExecutor(max_workers=min(SHARD_QUERY_WORKERS, len(shards))) as pool:
+                shard_results = list(pool.map(query_shard, shards))
+        else:
+            shard_results = [query_shard(shard) for shard in shards]
+
+        # Serializing the payload is costly; only do it when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Raw results: {json.dumps(shard_results, indent=2)}")
+
+        batch = []
+        for q in range(len(query_embeddings)):
+            similar_chunks = []
+            for results in shard_results:
+                if not results or not results['ids']:
+                    continue
+                ids = results['ids'][q]
+                similar_chunks.extend({
+                    'id': ids[i],
+                    'document': results['documents'][q][i],
+                    'metadata': results['metadatas'][q][i],
+                    'distance': results['distances'][q][i]
+                } for i in range(len(ids)))
+            if len(shard_results) > 1:
+                similar_chunks = sorted(similar_chunks, key=lambda chunk: chunk['distance'])[:n_results]
+            batch.append(similar_chunks)
+        return batch
+
+    def get_similar_chunks(self, query_embedding, n_results=5, doc_id=None, verify_document=True, doc_ids=None):
         """
         Get similar chunks based on query embedding
         
         Parameters:
         query_embedding (list): Embedding vector for the query
         n_results (int): Number of similar chunks to return
-        file_name (str, optional): Name of the PDF file to search within
+        doc_id (str, optional): Identity of the document to search within
+        verify_document (bool): Check that the requested documents exist before querying
+        doc_ids (list, optional): Documents to search within; all documents if neither this nor doc_id is given
         
         Returns:
         list: List of similar chunks with their metadata
         """
         try:
-            # If file_name is provided, only search within that file's chunks
-            where = {"file_name": file_name} if file_name else None
-            logger.info(f"file_name: {file_name}")
-            logger.info(f"query_embedding: {query_embedding}")
-            logger.info(f"n_results: {n_results}")
-            logger.info(f"where: {json.dumps(where, indent=2)}")
-
-            # Check available file names to avoid empty search
-            all_metadata = self.collection.get(include=["metadatas"])["metadatas"]
-            file_names = set(md.get("file_name") for md in all_metadata if "file_name" in md)
-            logger.info(f"Available file_names: {file_names}")
-
-            if file_name and file_name not in file_names:
-                logger.warning(f"Requested file_name '{file_name}' not found in collection.")
+            # Check the catalog to avoid an empty search
+            scope = self._search_scope(doc_id, doc_ids, verify_document)
+            if scope == []:
+                logger.warning(f"Requested documents not found in collection: {doc_id or doc_ids}")
                 return []  # No need to query, return empty immediately
 
-            if where:
-                logger.info("Running query WITH where filter")
-                results = self.collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=n_results,
-                    where=where
-                )
-            else:
-                logger.info("Running query WITHOUT where filter")
-                results = self.collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=n_results
-                )
-
-            logger.info(f"Raw results: {json.dumps(results, indent=2)}")
+            # If documents are requested, only search their shards and chunks
+            logger.debug(f"Querying {n_results} chunks of {len(scope) if scope else 'all'} documents")
+            similar_chunks = self._query([query_embedding], n_results, scope)[0]
 
             # Safely handle empty results
-            if not results['ids'] or not results['ids'][0]:
-                logger.warning(f"No matching chunks found for file: {file_name}")
+            if not similar_chunks:
+                logger.warning(f"No matching chunks found for document: {doc_id}")
                 return []
 
-            # Format results
-            similar_chunks = []
-            for i in range(len(results['ids'][0])):
-                similar_chunks.append({
-                    'id': results['ids'][0][i],
-                    'document': results['documents'][0][i],
-                    'metadata': results['metadatas'][0][i],
-                    'distance': results['distances'][0][i]
-                })
-
             return similar_chunks
 
         except Exception as e:
             logging.error(f"Error getting similar chunks: {str(e)}")
             raise
 
-    def get_file_chunks(self, file_name):
+    def get_similar_chunks_batch(self, query_embeddings, n_results=5, doc_id=None, verify_document=True, doc_ids=None):
+        """
+        Get similar chunks for several query embeddings with one query per shard
+        
+        Parameters:
+        query_embeddings (list): Embedding vectors of the queries
+        n_results (int): Number of similar chunks to return per query
+        doc_id (str, optional): Identity of the document to search within
+        verify_document (bool): Check that the requested documents exist before querying
+        doc_ids (list, optional): Documents to search within; all documents if neither this nor doc_id is given
+        
+        Returns:
+        list: One list of similar chunks per query, in the order of query_embeddings
+        """
+        try:
+            if not query_embeddings:
+                return []
+            scope = self._search_scope(doc_id, doc_ids, verify_document)
+            if scope == []:
+                logger.warning(f"Requested documents not found in collection: {doc_id or doc_ids}")
+                return [[] for _ in query_embeddings]
+
+            logger.info(f"Running {len(query_embeddings)} queries over {len(scope) if scope else 'all'} documents")
+            return self._query(query_embeddings, n_results, scope)
+
+        except Exception as e:
+            logging.error(f"Error getting similar chunks: {str(e)}")
+            raise
+
+    def get_file_chunks(self, doc_id):
         """
-        Get all chunks for a specific file
+        Get all chunks for a specific document
         
         Parameters:
-        file_name (str): Name of the PDF file
+        doc_id (str): Identity of the document
         
         Returns:
         list: List of chunks with their metadata
         """
         try:
-            results = self.collection.get(
-                where={"file_name": file_name}
+            collection = self._shard_of(doc_id)
+            if collection is None:
+                return []
+            results = collection.get(
+                where=self._doc_filter(doc_id)
             )
             
             # Format results
@@ -160,79 +597,116 @@ class ChromaStore:
             logging.error(f"Error getting file chunks: {str(e)}")
             raise
 
-    def delete_file_data(self, file_name):
+    def get_file_chunks_page(self, doc_id, limit, offset=0, include=("documents", "metadatas")):
         """
-        Delete all data for a specific file
+        Get one page of a document's chunks
         
         Parameters:
-        file_name (str): Name of the PDF file
+        doc_id (str): Identity of the document
+        limit (int): Most chunks returned
+        offset (int): Chunks to skip, in stored order
+        include (tuple): Fields to read besides the ids: documents, metadatas and/or embeddings
+        
+        Returns:
+        dict: 'ids' and a list per included field; 'embeddings' is a float32 matrix
         """
         try:
-            self.collection.delete(
-                where={"file_name": file_name}
+            collection = self._shard_of(doc_id)
+            if collection is None:
+                return {'ids': [], **{field: [] for field in include}}
+            results = collection.get(
+                where=self._doc_filter(doc_id),
+                limit=limit,
+                offset=offset,
+                include=list(include)
             )
-            logging.info(f"Successfully deleted data for {file_name}")
+            page = {'ids': results['ids']}
+            for field in include:
+                page[field] = results[field]
+            if "embeddings" in include:
+                page['embeddings'] = np.asarray(results['embeddings'], dtype=np.float32)
+            return page
             
         except Exception as e:
-            logging.error(f"Error deleting file data: {str(e)}")
+            logging.error(f"Error getting file chunks: {str(e)}")
             raise
 
-    def list_available_pdfs(self):
+    def store_document_pages(self, doc_id, pages, chunk_count, file_name=None, content_hash=None, model=None,
+                             upload_time=None):
         """
-        List all available PDF documents with their metadata
+        Replace a document with pages of chunks that already carry their ids, metadata and embeddings
         
-        Returns:
-        list: List of PDF documents with their metadata
+        Used to import exported documents without embedding them again; one page
+        is held in memory at a time.
+        
+        Parameters:
+        doc_id (str): Identity of the document
+        pages (iterable): Dicts of ids, documents, metadatas and embeddings
+        chunk_count (int): Number of chunks the pages hold
+        file_name (str, optional): Name the PDF was uploaded under
+        content_hash (str, optional): SHA-256 of the PDF, recorded in the catalog
+        model (str, optional): Embedding model name, recorded in the catalog
+        upload_time (str, optional): Original upload time, recorded in the catalog
         """
         try:
-            # Get all documents from the collection
-            results = self.collection.get()
+            self._drop_document(doc_id)
+            collection = self._shard_of(doc_id, create=True)
+            stored = 0
+            for page in pages:
+                collection.upsert(
+                    ids=page['ids'],
+                    documents=page['documents'],
+                    embeddings=np.asarray(page['embeddings'], dtype=np.float32).tolist(),
+                    metadatas=page['metadatas']
+                )
+                stored += len(page['ids'])
+            if stored != chunk_count:
+                raise ValueError(f"Expected {chunk_count} chunks for {doc_id}, received {stored}")
             
-            # If no documents exist, return empty list
-            if not results or not results.get('metadatas') or len(results['metadatas']) == 0:
-                logging.info("No PDFs found in ChromaDB")
-                return []
-                
-            # Create a dictionary to store unique files with their metadata
-            pdf_files = {}
-            for metadata in results['metadatas']:
-                file_name = metadata['file_name']
-                if file_name not in pdf_files:
-                    pdf_files[file_name] = {
-                        'file_name': file_name,
-                        'total_chunks': metadata['total_chunks'],
-                        'upload_time': metadata['timestamp'],  # Use timestamp as upload time
-                        'chunk_count': metadata['total_chunks']
-                    }
-            
-            # Convert to list and sort by upload time (most recent first)
-            pdf_list = list(pdf_files.values())
-            pdf_list.sort(key=lambda x: x['upload_time'], reverse=True)
-            
-            logging.info(f"Found {len(pdf_list)} PDFs in ChromaDB")
-            return pdf_list
+            self.catalog.upsert(
+                doc_id=doc_id,
+                file_name=file_name or doc_id,
+                chunk_count=stored,
+                upload_time=upload_time or datetime.now().isoformat(),
+                content_hash=content_hash,
+                model=model
+            )
+            logging.info(f"Successfully stored {stored} imported chunks for {doc_id}")
             
         except Exception as e:
-            logging.error(f"Error listing available PDFs: {str(e)}")
+            logging.error(f"Error storing PDF data: {str(e)}")
+            # Leave no partial document behind
+            self._drop_document(doc_id)
+            self.catalog.remove(doc_id)
             raise
 
-    def embeddings_exist(self, file_name: str) -> bool:
-        """Check if embeddings exist for a file"""
+    def delete_file_data(self, doc_id):
+        """
+        Delete all data for a specific document, including its file name aliases
+        
+        With document sharding the document's collection is dropped as a whole.
+        
+        Parameters:
+        doc_id (str): Identity of the document
+        """
         try:
-            results = self.collection.get(
-                where={"file_name": file_name},
-                limit=1
-            )
-            return len(results['ids']) > 0
+            self._drop_document(doc_id)
+            self.catalog.remove(doc_id)
+            logging.info(f"Successfully deleted data for {doc_id}")
+            
         except Exception as e:
-            self.logger.error(f"Error checking embeddings existence: {str(e)}")
-            return False
+            logging.error(f"Error deleting file data: {str(e)}")
+            raise
 
-    def get_embeddings(self, file_name: str) -> dict:
-        """Get embeddings and chunks for a file"""
+    def get_embeddings(self, doc_id: str) -> dict:
+        """Get embeddings and chunks for a document"""
         try:
-            results = self.collection.get(
-                where={"file_name": file_name}
+            collection = self._shard_of(doc_id)
+            if collection is None:
+                return {'ids': [], 'embeddings': [], 'documents': [], 'metadatas': []}
+            results = collection.get(
+                where=self._doc_filter(doc_id),
+                include=["embeddings", "documents", "metadatas"]
             )
             return {
                 'ids': results['ids'],
@@ -242,4 +716,4 @@ class ChromaStore:
             }
         except Exception as e:
             self.logger.error(f"Error getting embeddings: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
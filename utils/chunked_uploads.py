@@ -0,0 +1,252 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPLOAD_PART_SIZE = int(os.environ.get("UPLOAD_PART_SIZE", 8 * 1024 * 1024))  # Bytes per part of a chunked upload
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 200 * 1024 * 1024))  # Largest file accepted in parts
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", 24 * 3600))  # Seconds an idle upload is kept
+BLOCK_SIZE = 1024 * 1024  # Parts are written and hashed in 1MB blocks
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be honoured, with the HTTP status to report"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def copy_stream(stream, out, limit, digest=None):
+    """
+    Copy a stream to a file in blocks, stopping as soon as it exceeds a size limit
+
+    Parameters:
+    stream (file-like): Source, read in BLOCK_SIZE blocks
+    out (file-like): Destination
+    limit (int): Most bytes accepted
+    digest (hashlib object, optional): Updated with every block
+
+    Returns:
+    int: Bytes copied
+
+    Raises:
+    UploadError: With status 413 once more than limit bytes arrive
+    """
+    copied = 0
+    for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+        copied += len(block)
+        if copied > limit:
+            raise UploadError(f"Upload exceeds the maximum size of {limit / (1024 * 1024):.1f}MB", 413)
+        if digest is not None:
+            digest.update(block)
+        out.write(block)
+    return copied
+
+
+class ChunkedUploadStore:
+    """
+    Resumable uploads sent as numbered parts
+
+    A client creates an upload with the file's size, sends its parts in any
+    order (resending any that failed) and completes it once all have arrived.
+    Every part is verified and renamed into place atomically, and all state
+    lives on disk under the directory, so parts of one upload may be handled
+    by different worker processes and an interrupted upload resumes from the
+    parts already received.
+    """
+
+    def __init__(self, directory, part_size=UPLOAD_PART_SIZE, max_size=MAX_UPLOAD_SIZE, ttl=UPLOAD_SESSION_TTL):
+        self.directory = directory
+        self.part_size = part_size
+        self.max_size = max_size
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, upload_id, *parts):
+        if not isinstance(upload_id, str) or not _UPLOAD_ID.match(upload_id):
+            raise UploadError("Upload not found", 404)
+        return os.path.join(self.directory, upload_id, *parts)
+
+    def _load(self, upload_id):
+        try:
+            with open(self._path(upload_id, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("Upload not found", 404)
+
+    def _received(self, upload_id):
+        parts_dir = self._path(upload_id, "parts")
+        try:
+            return sorted(int(name) for name in os.listdir(parts_dir) if name.isdigit())
+        except FileNotFoundError:
+            raise UploadError("Upload not found", 404)
+
+    def _part_length(self, meta, index):
+        return min(meta['part_size'], meta['size'] - index * meta['part_size'])
+
+    def create(self, file_name, size, sha256=None):
+        """
+        Start an upload
+
+        Parameters:
+        file_name (str): Name of the file being uploaded
+        size (int): Total size in bytes
+        sha256 (str, optional): Hex digest of the whole file, checked on completion
+
+        Returns:
+        dict: The upload's status, including its id, part size and number of parts
+        """
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError("size must be a positive number of bytes")
+        if size > self.max_size:
+            raise UploadError(f"File too large. Maximum size is {self.max_size / (1024 * 1024):.1f}MB", 413)
+        if sha256 is not None and (not isinstance(sha256, str) or not _SHA256.match(sha256.lower())):
+            raise UploadError("sha256 must be a hex SHA-256 digest")
+        self.sweep()
+
+        upload_id = uuid.uuid4().hex
+        meta = {
+            'upload_id': upload_id,
+            'file_name': file_name,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'part_size': self.part_size,
+            'parts': -(-size // self.part_size),
+            'created_at': time.time()
+        }
+        os.makedirs(self._path(upload_id, "parts"))
+        temp_path = self._path(upload_id, "meta.json.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self._path(upload_id, "meta.json"))
+        logger.info(f"Started chunked upload {upload_id} of {file_name}: {size} bytes in {meta['parts']} parts")
+        return self.status(upload_id)
+
+    def write_part(self, upload_id, index, stream, sha256=None):
+        """
+        Store one part, read from a stream in blocks
+
+        A part that is resent replaces the earlier copy; a part that arrives
+        incomplete or fails its checksum is discarded.
+
+        Parameters:
+        upload_id (str): Upload the part belongs to
+        index (int): Zero-based part number
+        stream (file-like): The part's bytes
+        sha256 (str, optional): Hex digest the part must match
+
+        Returns:
+        dict: The upload's status
+        """
+        meta = self._load(upload_id)
+        if not 0 <= index < meta['parts']:
+            raise UploadError(f"Part number must be between 0 and {meta['parts'] - 1}")
+        expected = self._part_length(meta, index)
+
+        digest = hashlib.sha256()
+        temp_path = self._path(upload_id, "parts", f".{index}-{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, "wb") as out:
+                received = copy_stream(stream, out, expected, digest)
+            if received != expected:
+                raise UploadError(f"Part {index} must be {expected} bytes, received {received}")
+            if sha256 and digest.hexdigest() != sha256.lower():
+                raise UploadError(f"Part {index} does not match its checksum", 422)
+            os.replace(temp_path, self._path(upload_id, "parts", str(index)))
+        except UploadError as e:
+            if e.status == 413:
+                e = UploadError(f"Part {index} must be {expected} bytes", 400)
+            os.remove(temp_path)
+            raise e
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logger.info(f"Received part {index + 1}/{meta['parts']} of upload {upload_id}")
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """Return an upload's progress, with the parts still missing"""
+        meta = self._load(upload_id)
+        received = self._received(upload_id)
+        received_set = set(received)
+        return {
+            'upload_id': upload_id,
+            'file_name': meta['file_name'],
+            'size': meta['size'],
+            'part_size': meta['part_size'],
+            'parts': meta['parts'],
+            'received': received,
+            'missing': [index for index in range(meta['parts']) if index not in received_set],
+            'received_bytes': sum(self._part_length(meta, index) for index in received)
+        }
+
+    def complete(self, upload_id, destination_dir):
+        """
+        Join the parts of a finished upload into one file, hashing it on the way
+
+        Parameters:
+        upload_id (str): Upload with every part received
+        destination_dir (str): Directory the joined file is written to
+
+        Returns:
+        tuple: (file name, temporary path of the joined file, SHA-256 hex digest)
+        """
+        meta = self._load(upload_id)
+        missing = self.status(upload_id)['missing']
+        if missing:
+            raise UploadError("Upload is missing parts", 409, missing=missing)
+        # Claim the upload, so that a repeated request cannot join it twice
+        try:
+            os.mkdir(self._path(upload_id, "completing"))
+        except FileExistsError:
+            raise UploadError("Upload is already being completed", 409)
+
+        digest = hashlib.sha256()
+        temp_path = os.path.join(destination_dir, f".upload-{uuid.uuid4().hex}.part")
+        try:
+            with open(temp_path, "wb") as out:
+                for index in range(meta['parts']):
+                    with open(self._path(upload_id, "parts", str(index)), "rb") as part:
+                        copy_stream(part, out, meta['part_size'], digest)
+            if meta['sha256'] and digest.hexdigest() != meta['sha256']:
+                raise UploadError("Uploaded file does not match its checksum; please upload it again", 422)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.abort(upload_id)
+            raise
+        self.abort(upload_id)
+        logger.info(f"Completed chunked upload {upload_id} of {meta['file_name']}")
+        return meta['file_name'], temp_path, digest.hexdigest()
+
+    def abort(self, upload_id):
+        """Discard an upload and the parts it received"""
+        shutil.rmtree(self._path(upload_id), ignore_errors=True)
+
+    def sweep(self):
+        """Discard uploads that received nothing for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        for upload_id in os.listdir(self.directory):
+            if not _UPLOAD_ID.match(upload_id):
+                continue
+            try:
+                last_activity = os.path.getmtime(self._path(upload_id, "parts"))
+            except OSError:
+                continue
+            if last_activity < cutoff:
+                logger.info(f"Discarding abandoned upload {upload_id}")
+                self.abort(upload_id)
@@ -0,0 +1,199 @@
+import os
+import re
+import logging
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# By default the budget holds as much text as the ANSWER_TOP_K chunks placed without packing
+_UNPACKED_CONTEXT_TOKENS = int(os.environ.get("ANSWER_TOP_K", 3)) * int(os.environ.get("CHUNK_SIZE", 1024))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", _UNPACKED_CONTEXT_TOKENS))  # Prompt tokens of context; 0 disables packing
+CONTEXT_CANDIDATES = int(os.environ.get("CONTEXT_CANDIDATES", 12))  # Chunks retrieved for packing
+CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", 0.8))  # Shingle overlap of near-duplicates
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "tiktoken")  # tiktoken, or estimate for about four characters per token
+TOKENIZER_MODEL = os.environ.get("CHAT_MODEL", "gpt-3.5-turbo")
+
+MAX_OVERLAP_CHARS = 4096  # Longest text shared by neighbouring chunks that is looked for when merging them
+SHINGLE_WORDS = 3
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """Return the tiktoken encoding of the chat model, or None to estimate token counts"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                if CONTEXT_TOKENIZER == "tiktoken":
+                    try:
+                        import tiktoken
+                        try:
+                            _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+                        except KeyError:
+                            _encoding = tiktoken.get_encoding("cl100k_base")
+                    except Exception as e:
+                        # tiktoken fetches its vocabulary once; offline without a TIKTOKEN_CACHE_DIR it cannot
+                        logger.warning(f"Tokenizer unavailable, estimating token counts instead: {str(e)}")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Count the tokens of text with the chat model's tokenizer, or estimate about four characters per token"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut text to at most max_tokens tokens"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _is_near_duplicate(shingles, kept_shingles, threshold):
+    """True if most of a chunk's word shingles already appear in a kept chunk"""
+    for kept in kept_shingles:
+        if len(shingles & kept) >= threshold * min(len(shingles), len(kept)):
+            return True
+    return False
+
+
+def _overlap(before, after):
+    """Length of the longest end of before that after starts with, as left by overlapping chunking"""
+    probe = after[:32]
+    if not probe:
+        return 0
+    start = max(0, len(before) - MAX_OVERLAP_CHARS)
+    position = before.find(probe, start)
+    while position != -1:
+        if after.startswith(before[position:]):
+            return len(before) - position
+        position = before.find(probe, position + 1)
+    return 0
+
+
+def _join(before, after):
+    """Join the texts of neighbouring chunks, writing the text they share once"""
+    shared = _overlap(before, after)
+    if shared:
+        return before + after[shared:]
+    return before + "\n" + after
+
+
+def _passage_text(chunks):
+    text = chunks[0]['document']
+    for chunk in chunks[1:]:
+        text = _join(text, chunk['document'])
+    return text
+
+
+class _Passage:
+    """A run of neighbouring chunks of one document, kept in document order"""
+
+    def __init__(self, chunk):
+        self.doc_id = chunk['metadata'].get('doc_id')
+        self.chunks = [chunk]
+        self.best = chunk  # Most relevant chunk, whose rank orders the passage
+
+    def _indexes(self):
+        return self.chunks[0]['metadata'].get('chunk_index'), self.chunks[-1]['metadata'].get('chunk_index')
+
+    def extended_with(self, chunks, doc_id):
+        """Return the passage's chunks joined with a run of chunks right before or after it, or None"""
+        first, last = self._indexes()
+        start = chunks[0]['metadata'].get('chunk_index')
+        end = chunks[-1]['metadata'].get('chunk_index')
+        if doc_id != self.doc_id or None in (first, start):
+            return None
+        if start == last + 1:
+            return self.chunks + chunks
+        if end == first - 1:
+            return chunks + self.chunks
+        return None
+
+    def to_chunk(self):
+        """Present the passage like a retrieved chunk, listing the chunks it was built from"""
+        return {
+            'id': self.best['id'],
+            'document': _passage_text(self.chunks),
+            'metadata': self.best['metadata'],
+            'distance': self.best['distance'],
+            'chunks': self.chunks
+        }
+
+
+def pack_context(chunks, budget=CONTEXT_TOKEN_BUDGET, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """
+    Select and merge retrieved chunks into passages that fit a token budget
+
+    Chunks are taken in relevance order. A chunk whose text mostly repeats a
+    chunk already taken is dropped, and a chunk next to a taken chunk of the
+    same document (by chunk_index) is merged into its passage, writing the
+    text the two overlap on once. Chunks that would overrun the budget are
+    skipped in favour of smaller, less relevant ones; the most relevant chunk
+    is always kept, cut to the budget if it has to be.
+
+    Parameters:
+    chunks (list): Retrieved chunks, most relevant first, with document, metadata and distance
+    budget (int): Tokens of context to fill
+    duplicate_threshold (float): Share of word shingles two chunks must have in common to be near-duplicates
+
+    Returns:
+    list: Passages, most relevant first, shaped like retrieved chunks plus a 'chunks' list of their members
+    """
+    passages = []
+    kept_shingles = []
+    used = 0
+    for chunk in chunks:
+        shingles = _shingles(chunk['document'])
+        if _is_near_duplicate(shingles, kept_shingles, duplicate_threshold):
+            continue
+
+        doc_id = chunk['metadata'].get('doc_id')
+        passage = next((passage for passage in passages if passage.extended_with([chunk], doc_id)), None)
+        if passage:
+            members = passage.extended_with([chunk], doc_id)
+            cost = count_tokens(_passage_text(members)) - count_tokens(_passage_text(passage.chunks))
+            if used + cost > budget:
+                continue
+            passage.chunks = members
+            # A chunk filling the gap between two passages joins them
+            for other in passages:
+                if other is not passage and (joined := passage.extended_with(other.chunks, other.doc_id)):
+                    passage.chunks = joined
+                    passages.remove(other)
+                    break
+        else:
+            cost = count_tokens(chunk['document'])
+            if used + cost > budget:
+                if passages:
+                    continue
+                # The most relevant chunk alone is over budget: keep its beginning
+                chunk = dict(chunk, document=truncate_tokens(chunk['document'], budget))
+                cost = budget
+            passages.append(_Passage(chunk))
+        kept_shingles.append(shingles)
+        used += cost
+        if used >= budget:
+            break
+
+    packed = [passage.to_chunk() for passage in passages]
+    logger.info(f"Packed {sum(len(passage.chunks) for passage in passages)} of {len(chunks)} retrieved chunks "
+                f"into {len(packed)} passages of about {used} tokens")
+    return packed
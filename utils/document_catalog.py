@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# WAL needs memory shared by every process using the file; use DELETE for a catalog shared between nodes
+CATALOG_JOURNAL_MODE = os.environ.get("CATALOG_JOURNAL_MODE", "WAL")
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in fixed-size blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentCatalog:
+    """
+    One row per stored document, kept next to the vector store
+
+    Documents are identified by doc_id, the SHA-256 of their content (documents
+    stored before content hashing keep their file name as doc_id). Uploaded file
+    names are aliases that point at a doc_id. Existence checks and listings read
+    these tables instead of scanning every chunk in the embeddings collection.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(f"PRAGMA journal_mode={CATALOG_JOURNAL_MODE}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                file_name TEXT,
+                content_hash TEXT,
+                chunk_count INTEGER NOT NULL,
+                upload_time TEXT NOT NULL,
+                model TEXT
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_upload_time ON documents (upload_time)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_aliases_doc_id ON aliases (doc_id)")
+        self._conn.commit()
+
+    def upsert(self, doc_id, chunk_count, upload_time, file_name=None, content_hash=None, model=None):
+        """Add or replace the catalog entry of a document"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, file_name, content_hash, chunk_count, upload_time, model) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_id, file_name, content_hash, chunk_count, upload_time, model)
+            )
+            self._conn.commit()
+
+    def remove(self, doc_id):
+        """Remove the catalog entry of a document together with its aliases"""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM aliases WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def get(self, doc_id):
+        """Return the catalog entry of a document as a dict, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def exists(self, doc_id):
+        """Check whether a document is in the catalog"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row is not None
+
+    def existing(self, doc_ids):
+        """Return the subset of doc_ids that are in the catalog"""
+        found = set()
+        doc_ids = list(doc_ids)
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(doc_ids), 500):
+                batch = doc_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT doc_id FROM documents WHERE doc_id IN ({placeholders})", batch
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def list(self):
+        """Return one entry per alias with its document's details, most recently uploaded first"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT aliases.alias AS file_name, documents.doc_id, documents.content_hash,
+                       documents.chunk_count, documents.upload_time, documents.model
+                FROM aliases JOIN documents ON documents.doc_id = aliases.doc_id
+                ORDER BY documents.upload_time DESC, aliases.alias
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_documents(self):
+        """Return one entry per document, most recently uploaded first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM documents ORDER BY upload_time DESC").fetchall()
+        return [dict(row) for row in rows]
+
+    def data_version(self):
+        """Return a counter that changes whenever another connection, such as another worker's, commits"""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def count(self):
+        """Return the number of documents in the catalog"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def set_alias(self, alias, doc_id):
+        """
+        Point a file name at a document
+
+        Returns:
+        str: The doc_id the alias pointed at before, or None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT doc_id FROM aliases WHERE alias = ?", (alias,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO aliases (alias, doc_id, created_at) VALUES (?, ?, ?)",
+                (alias, doc_id, datetime.now().isoformat())
+            )
+            self._conn.commit()
+        previous = row[0] if row else None
+        return previous if previous != doc_id else None
+
+    def resolve_alias(self, alias):
+        """Return the doc_id a file name points at, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT doc_id FROM aliases WHERE alias = ?", (alias,)).fetchone()
+        return row[0] if row else None
+
+    def remove_alias(self, alias):
+        """Remove a file name alias"""
+        with self._lock:
+            self._conn.execute("DELETE FROM aliases WHERE alias = ?", (alias,))
+            self._conn.commit()
+
+    def aliases(self, doc_id):
+        """Return the file names pointing at a document"""
+        with self._lock:
+            rows = self._conn.execute("SELECT alias FROM aliases WHERE doc_id = ? ORDER BY alias", (doc_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def alias_count(self, doc_id):
+        """Return the number of file names pointing at a document"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM aliases WHERE doc_id = ?", (doc_id,)).fetchone()[0]
@@ -0,0 +1,137 @@
+import logging
+import threading
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class DocumentHandle:
+    """Retrieval handle for a document whose embeddings are known to be stored"""
+
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.doc_id = doc_id
+        self.cache_key = doc_id  # Identity of the searched documents in the answer cache
+        self.resolved_at = datetime.now().isoformat()
+
+    def search(self, query_embedding, n_results):
+        """Return the chunks of this document most similar to the query embedding"""
+        return self.store.get_similar_chunks(
+            query_embedding,
+            n_results=n_results,
+            doc_id=self.doc_id,
+            verify_document=False  # Existence was checked when the handle was resolved
+        )
+
+    def search_batch(self, query_embeddings, n_results):
+        """Return the most similar chunks of this document for each query embedding, in order"""
+        return self.store.get_similar_chunks_batch(
+            query_embeddings,
+            n_results=n_results,
+            doc_id=self.doc_id,
+            verify_document=False
+        )
+
+
+class DocumentSetHandle:
+    """Retrieval handle searching several documents, or all stored documents, with one query"""
+
+    def __init__(self, store, doc_ids=None):
+        self.store = store
+        self.doc_ids = doc_ids  # None searches every stored document
+        self.cache_key = "all" if doc_ids is None else ",".join(sorted(doc_ids))
+        self.resolved_at = datetime.now().isoformat()
+
+    def search(self, query_embedding, n_results):
+        """Return the chunks of these documents most similar to the query embedding"""
+        return self.store.get_similar_chunks(
+            query_embedding,
+            n_results=n_results,
+            doc_ids=self.doc_ids,
+            verify_document=False
+        )
+
+    def search_batch(self, query_embeddings, n_results):
+        """Return the most similar chunks of these documents for each query embedding, in order"""
+        return self.store.get_similar_chunks_batch(
+            query_embeddings,
+            n_results=n_results,
+            doc_ids=self.doc_ids,
+            verify_document=False
+        )
+
+
+class DocumentHandleCache:
+    """
+    In-process cache of document handles, resolved once per document
+
+    Documents removed in this process are invalidated explicitly. Every handle
+    is dropped once another process, such as another gunicorn worker, changes
+    the catalog, since the change may have deleted one of their documents.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._handles = {}
+        self._catalog_version = None
+        self._lock = threading.Lock()
+
+    def _follow_catalog(self):
+        """Drop every cached handle if another process has written to the catalog since the last lookup"""
+        version = self.store.catalog.data_version()
+        with self._lock:
+            if version == self._catalog_version:
+                return
+            if self._handles:
+                logger.info(f"Document catalog changed in another process; dropping {len(self._handles)} handles")
+                self._handles.clear()
+            self._catalog_version = version
+
+    def get(self, doc_id):
+        """
+        Get the handle for a document, resolving it on first use
+
+        Parameters:
+        doc_id (str): Identity of the document
+
+        Returns:
+        DocumentHandle: The cached handle, or None if no embeddings are stored for the document
+        """
+        self._follow_catalog()
+        with self._lock:
+            handle = self._handles.get(doc_id)
+        if handle:
+            return handle
+
+        if not self.store.embeddings_exist(doc_id):
+            return None
+
+        with self._lock:
+            handle = self._handles.setdefault(doc_id, DocumentHandle(self.store, doc_id))
+        logger.info(f"Resolved retrieval handle for {doc_id}")
+        return handle
+
+    def get_set(self, doc_ids=None):
+        """
+        Get a handle searching several documents at once
+
+        Parameters:
+        doc_ids (list, optional): Identities of the documents; all stored documents if None
+
+        Returns:
+        tuple: (DocumentSetHandle, list of requested doc_ids with no stored embeddings)
+        """
+        if doc_ids is None:
+            return DocumentSetHandle(self.store), []
+        doc_ids = list(dict.fromkeys(doc_ids))
+        found = self.store.catalog.existing(doc_ids)
+        missing = [doc_id for doc_id in doc_ids if doc_id not in found]
+        return DocumentSetHandle(self.store, [doc_id for doc_id in doc_ids if doc_id in found]), missing
+
+    def invalidate(self, doc_id):
+        """Drop the cached handle for a document"""
+        with self._lock:
+            if self._handles.pop(doc_id, None):
+                logger.info(f"Invalidated retrieval handle for {doc_id}")
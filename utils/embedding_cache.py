@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+import time
+from array import array
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 500000))
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text):
+    """Return the content hash used as the cache key for a chunk of text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, SHA-256 of the text)
+
+    Vectors are stored as float32 blobs in SQLite. When the cache grows past
+    max_entries the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache opened at {path} with {self._size} entries")
+
+    def get_many(self, model, texts):
+        """
+        Look up cached embeddings
+
+        Parameters:
+        model (str): Name of the embedding model
+        texts (list): Texts to look up
+
+        Returns:
+        list: One embedding (list of floats) per text, or None where the text is not cached
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = list(set(hashes[start:start + _LOOKUP_BATCH]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in hashes]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model, texts, embeddings):
+        """
+        Store embeddings in the cache, evicting least recently used entries if needed
+
+        Parameters:
+        model (str): Name of the embedding model
+        texts (list): Texts that were embedded
+        embeddings (list): One embedding per text
+        """
+        now = time.time()
+        rows = [
+            (model, text_hash(text), array("f", embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            # Count the rows added instead of the whole table; a text already cached
+            # (by another worker, say) has the same embedding and only needs touching
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            added = self._conn.total_changes - before
+            self._size += added
+            if added < len(rows):
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for _, key, _, _ in rows]
+                )
+            if self._size > self.max_entries:
+                # Other workers share the file; recount before evicting
+                self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._size > self.max_entries:
+                evict = self._size - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (evict,)
+                )
+                self._size -= evict
+                logger.info(f"Evicted {evict} least recently used embeddings from cache")
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current number of cached entries"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': self._size,
+                'max_entries': self.max_entries
+            }
@@ -0,0 +1,207 @@
+import os
+import json
+import uuid
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+MAX_TRACKED_JOBS = int(os.environ.get("MAX_TRACKED_JOBS", 1000))
+# Job status shared by every worker process, so any of them can answer a poll
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", "./jobs.sqlite3")
+JOB_STALE_AFTER = int(os.environ.get("JOB_STALE_AFTER", 3600))  # Seconds without progress before a job is presumed lost
+
+_JOB_FIELDS = ("doc_id", "file_name", "file_path", "status", "stage", "done", "total", "error", "error_type",
+               "result", "created_at", "updated_at")
+
+
+class IngestionJob:
+    """Progress and outcome of a single background ingestion"""
+
+    def __init__(self, file_name, file_path, doc_id=None):
+        self.id = uuid.uuid4().hex
+        self.doc_id = doc_id
+        self.file_name = file_name
+        self.file_path = file_path
+        self.status = "queued"  # queued, running, completed, failed
+        self.stage = "queued"  # parsing (pages are chunked and embedded as they stream in), embedding, storing, done
+        self.done = None
+        self.total = None
+        self.error = None
+        self.error_type = None
+        self.result = None
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = self.created_at
+
+    def update(self, stage, done=None, total=None):
+        """Record the current stage and, for countable stages, how far along it is"""
+        self.stage = stage
+        self.done = done
+        self.total = total
+        self.updated_at = datetime.now().isoformat()
+
+    @classmethod
+    def from_row(cls, row):
+        """Rebuild a job from its row in the job table"""
+        job = cls(row['file_name'], row['file_path'], row['doc_id'])
+        job.id = row['job_id']
+        for field in _JOB_FIELDS:
+            setattr(job, field, row[field])
+        job.result = json.loads(row['result']) if row['result'] else None
+        return job
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'doc_id': self.doc_id,
+            'file_name': self.file_name,
+            'status': self.status,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'error': self.error,
+            'error_type': self.error_type,
+            'result': self.result,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class JobManager:
+    """
+    Runs ingestion jobs on a local thread pool and keeps their status for polling
+
+    Status lives in a SQLite table rather than in worker memory, so a job queued
+    by one worker process can be polled through any other, and a re-upload of a
+    document being ingested elsewhere follows that job instead of starting again.
+    """
+
+    def __init__(self, max_workers=INGEST_WORKERS, max_tracked=MAX_TRACKED_JOBS, path=JOBS_DB_PATH,
+                 stale_after=JOB_STALE_AFTER):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self.max_tracked = max_tracked
+        self.stale_after = stale_after
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                doc_id TEXT,
+                file_name TEXT,
+                file_path TEXT,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                done INTEGER,
+                total INTEGER,
+                error TEXT,
+                error_type TEXT,
+                result TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                heartbeat REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_doc_id ON jobs (doc_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_heartbeat ON jobs (heartbeat)")
+        self._conn.commit()
+
+    def _save(self, job):
+        """Write the current state of a job to the shared table"""
+        values = [getattr(job, field) for field in _JOB_FIELDS]
+        values[_JOB_FIELDS.index("result")] = json.dumps(job.result) if job.result is not None else None
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs (job_id, {', '.join(_JOB_FIELDS)}, heartbeat) "
+                f"VALUES ({', '.join('?' * (len(_JOB_FIELDS) + 2))})",
+                [job.id, *values, time.time()]
+            )
+            self._conn.commit()
+
+    def submit(self, file_name, file_path, func, on_error=None, doc_id=None):
+        """
+        Queue an ingestion job
+
+        Parameters:
+        file_name (str): Name of the uploaded file
+        file_path (str): Path of the saved file
+        func (callable): Called as func(file_path, progress=update), update taking job.update's arguments; its return value is kept as the result
+        on_error (callable, optional): Called as on_error(job, exception) when the job fails
+        doc_id (str, optional): Identity of the document being ingested
+
+        Returns:
+        IngestionJob: The queued job
+        """
+        job = IngestionJob(file_name, file_path, doc_id)
+        self._save(job)
+        self._prune()
+        self._executor.submit(self._run, job, func, on_error)
+        logger.info(f"Queued ingestion job {job.id} for {file_name}")
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given id, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return IngestionJob.from_row(row) if row else None
+
+    def find_active(self, doc_id):
+        """Return a queued or running job for the given document, or None"""
+        with self._lock:
+            # A job whose worker died stops making progress; it no longer blocks a new upload
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE doc_id = ? AND status IN ('queued', 'running') AND heartbeat >= ? "
+                "ORDER BY heartbeat DESC LIMIT 1",
+                (doc_id, time.time() - self.stale_after)
+            ).fetchone()
+        return IngestionJob.from_row(row) if row else None
+
+    def _run(self, job, func, on_error):
+        def progress(stage, done=None, total=None):
+            job.update(stage, done, total)
+            self._save(job)
+
+        job.status = "running"
+        self._save(job)
+        try:
+            job.result = func(job.file_path, progress=progress)
+            job.update("done")
+            job.status = "completed"
+            logger.info(f"Ingestion job {job.id} completed")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.error_type = type(e).__name__
+            job.updated_at = datetime.now().isoformat()
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+            if on_error:
+                try:
+                    on_error(job, e)
+                except Exception as cleanup_error:
+                    logger.error(f"Error cleaning up job {job.id}: {str(cleanup_error)}")
+        self._save(job)
+
+    def _prune(self):
+        """Forget the oldest finished jobs once more than max_tracked are held"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            if count <= self.max_tracked:
+                return
+            self._conn.execute(
+                "DELETE FROM jobs WHERE job_id IN (SELECT job_id FROM jobs WHERE status IN ('completed', 'failed') "
+                "ORDER BY heartbeat LIMIT ?)",
+                (count - self.max_tracked,)
+            )
+            self._conn.commit()
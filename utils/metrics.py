@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-request traces are logged at debug level; TRACE_REQUESTS=true enables them without debugging everything
+if os.environ.get("TRACE_REQUESTS", "false").lower() == "true":
+    logger.setLevel(logging.DEBUG)
+
+METRICS_PREFIX = "chatpdf"
+
+# Histogram buckets for stage durations, in seconds
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_help = {
+    'stage_seconds': ("histogram", "Time spent in each pipeline stage"),
+    'stage_errors_total': ("counter", "Pipeline stages that raised an exception"),
+    'tokens_total': ("counter", "Tokens reported by the model API"),
+    'embedding_cache_total': ("counter", "Embedding cache lookups by result"),
+    'answer_cache_total': ("counter", "Answer cache lookups by result"),
+    'ingested_total': ("counter", "Pages and chunks ingested"),
+    'model_calls_total': ("counter", "Model calls by scheduler outcome")
+}
+
+# Spans of the request being handled, when tracing
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add value to a counter"""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Record a duration in a histogram"""
+    key = (name, _labels_key(labels))
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(STAGE_BUCKETS) + 2)
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage, counting it as an error if it raises
+
+    Parameters:
+    name (str): parse, chunk, embed, store, query_embed, vector_search or llm_completion
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc('stage_errors_total', stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('stage_seconds', elapsed, stage=name)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def timed_iter(name, iterable):
+    """Yield from iterable, timing the production of each item as the named stage"""
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        with stage(name):
+            item = next(iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def record_usage(kind, usage):
+    """Count the tokens of an API response's usage, if it reported any"""
+    if usage is None:
+        return
+    if kind == "embedding":
+        inc('tokens_total', getattr(usage, "prompt_tokens", 0) or 0, kind="embedding")
+    else:
+        inc('tokens_total', getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+        inc('tokens_total', getattr(usage, "completion_tokens", 0) or 0, kind="completion")
+
+
+def start_trace():
+    """Start collecting stage spans for the current request, if trace logging is enabled"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return None
+    spans = []
+    _trace.set(spans)
+    return spans
+
+
+def finish_trace(spans, label, started):
+    """Log the collected spans of a request at debug level"""
+    _trace.set(None)
+    if spans is None:
+        return
+    total_ms = (time.perf_counter() - started) * 1000
+    stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in spans)
+    logger.debug(f"trace {label} total={total_ms:.1f}ms {stages}".rstrip())
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in pairs]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def render_prometheus():
+    """
+    Render every metric in the Prometheus text exposition format
+
+    Returns:
+    str: The metrics page, including the model scheduler counters
+    """
+    from utils.model_scheduler import embedding_scheduler, chat_scheduler
+
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+    for scheduler in (embedding_scheduler, chat_scheduler):
+        for outcome, value in scheduler.stats.items():
+            counters[('model_calls_total', _labels_key({'model': scheduler.name, 'outcome': outcome}))] = value
+
+    lines = []
+    for name, (kind, description) in _help.items():
+        metric = f"{METRICS_PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        if kind == "counter":
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        else:
+            for (key_name, labels), values in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                for bound, count in zip(STAGE_BUCKETS, values):
+                    lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {values[-2]}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
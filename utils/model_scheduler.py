@@ -0,0 +1,400 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+from types import SimpleNamespace
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Limits per model; 0 leaves requests or tokens per minute unlimited
+EMBED_RPM = int(os.environ.get("EMBED_RPM", 0))
+EMBED_TPM = int(os.environ.get("EMBED_TPM", 0))
+CHAT_RPM = int(os.environ.get("CHAT_RPM", 0))
+CHAT_TPM = int(os.environ.get("CHAT_TPM", 0))
+# Processes sharing the limits above, such as gunicorn workers; each one enforces its share
+MODEL_LIMIT_PROCESSES = max(1, int(os.environ.get("MODEL_LIMIT_PROCESSES", 1)))
+MODEL_MAX_CONCURRENCY = int(os.environ.get("MODEL_MAX_CONCURRENCY", 32))  # Requests in flight per model
+MODEL_MAX_RETRIES = int(os.environ.get("MODEL_MAX_RETRIES", 6))  # Retries of server and connection errors
+MODEL_RETRY_TIMEOUT = float(os.environ.get("MODEL_RETRY_TIMEOUT", 120))  # Seconds a rate-limited call keeps retrying
+BACKOFF_BASE = float(os.environ.get("BACKOFF_BASE", 0.5))  # Seconds before the first retry
+BACKOFF_MAX = float(os.environ.get("BACKOFF_MAX", 30))
+
+# Lower values are admitted first
+INTERACTIVE = 0
+BULK = 1
+
+
+def estimate_tokens(texts):
+    """Rough token count used for admission, about four characters per token"""
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, from Retry-After headers, or None"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _is_rate_limit(error):
+    from openai import RateLimitError
+    return isinstance(error, RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def _is_retryable(error):
+    """Rate limits, overload, server errors and connection failures are retried; quota exhaustion is not"""
+    # Imported on first failure, by which time the client has loaded openai anyway
+    from openai import RateLimitError, APIStatusError, APIConnectionError, APITimeoutError
+    if isinstance(error, RateLimitError):
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class TokenBucket:
+    """
+    Allowance of `per_minute` units, refilled continuously
+
+    At most one second's worth is banked, matching how the API enforces its
+    per-minute limits. A request larger than that waits for a full bucket and
+    overdraws it, so the requests after it wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount units can be taken (0 if they can now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def take(self, amount):
+        self.available -= amount
+
+    def adjust(self, amount):
+        """Correct a reservation once the actual usage is known (positive charges more)"""
+        self.available = min(self.capacity, self.available - amount)
+
+
+class ModelScheduler:
+    """
+    Admission control, retries and backoff for calls to one model
+
+    Callers reserve an estimated token count. Requests are admitted highest
+    priority first, once a concurrency slot is free and the request and token
+    buckets allow it. Retryable failures back off with full jitter, or for as
+    long as Retry-After asks. A rate limit pauses admission for every caller of
+    the model and halves the concurrency, which then grows back by about one
+    slot per window of successful requests, so throughput settles just under
+    the limits the server enforces instead of failing in bursts.
+    """
+
+    def __init__(self, name, rpm=0, tpm=0, max_concurrency=MODEL_MAX_CONCURRENCY,
+                 max_retries=MODEL_MAX_RETRIES, retry_timeout=MODEL_RETRY_TIMEOUT,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.retry_timeout = retry_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._condition = threading.Condition()
+        self._waiting = []  # Heap of (priority, sequence)
+        self._async_waiters = {}  # Ticket -> (loop, future) of a coroutine sleeping until it may be admitted
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._concurrency = float(self.max_concurrency)  # Adaptive limit, halved on rate limits
+        self._paused_until = 0.0
+        self.stats = {'admitted': 0, 'retries': 0, 'rate_limited': 0, 'failed': 0}
+
+    def _admission_wait(self, ticket, tokens):
+        """Seconds the ticket must still wait, or 0 after admitting it; call with the condition held"""
+        if self._waiting[0] != ticket or self._in_flight >= int(self._concurrency):
+            return None  # Wait for a release or a higher priority request to go first
+        now = time.monotonic()
+        wait = max(0.0, self._paused_until - now)
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+
+        heapq.heappop(self._waiting)
+        self._in_flight += 1
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+        self.stats['admitted'] += 1
+        # The next ticket may be admissible as well
+        self._notify()
+        return 0
+
+    def _notify(self):
+        """Wake waiting threads and the coroutine holding the first ticket; call with the condition held"""
+        self._condition.notify_all()
+        waiter = self._async_waiters.get(self._waiting[0]) if self._waiting else None
+        if waiter is not None:
+            loop, future = waiter
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # The waiter's loop is closed
+
+    def set_max_concurrency(self, max_concurrency):
+        """Change the number of requests in flight, for serving modes that hold no thread per request"""
+        with self._condition:
+            self.max_concurrency = max(1, max_concurrency)
+            self._concurrency = float(self.max_concurrency)
+            self._notify()
+
+    def _acquire(self, ticket, tokens):
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                wait = self._admission_wait(ticket, tokens)
+                if wait == 0:
+                    return
+                self._condition.wait(timeout=wait)
+
+    async def _acquire_async(self, ticket, tokens):
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._admission_wait(ticket, tokens)
+                    if wait == 0:
+                        return
+                    wakeup = loop.create_future()
+                    self._async_waiters[ticket] = (loop, wakeup)
+                # Sleep until signalled at the head of the queue, or until the buckets have refilled
+                await asyncio.wait([wakeup], timeout=wait)
+        except asyncio.CancelledError:
+            with self._condition:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._notify()
+            raise
+        finally:
+            with self._condition:
+                self._async_waiters.pop(ticket, None)
+
+    def _release(self, tokens, result, succeeded):
+        with self._condition:
+            self._in_flight -= 1
+            if succeeded:
+                self._concurrency = min(self.max_concurrency, self._concurrency + 1 / self._concurrency)
+            usage = getattr(result, "usage", None)
+            if self.tokens and usage is not None and getattr(usage, "total_tokens", None):
+                self.tokens.adjust(usage.total_tokens - tokens)
+            self._notify()
+
+    def _give_up(self, error, attempt, started):
+        """Rate limits are retried until retry_timeout has passed, other failures max_retries times"""
+        if not _is_retryable(error):
+            give_up = True
+        elif _is_rate_limit(error):
+            give_up = time.monotonic() - started >= self.retry_timeout
+        else:
+            give_up = attempt >= self.max_retries
+        if give_up:
+            self.stats['failed'] += 1
+        return give_up
+
+    def _backoff(self, error, attempt):
+        """Delay before the next attempt; rate limits pause admission for everyone"""
+        delay = _retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if _is_rate_limit(error):
+            self.stats['rate_limited'] += 1
+            with self._condition:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self._concurrency = max(1.0, self._concurrency / 2)
+        self.stats['retries'] += 1
+        logger.warning(f"{self.name} call failed ({type(error).__name__}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def call(self, fn, tokens=1, priority=INTERACTIVE):
+        """
+        Run a blocking model call under the scheduler
+
+        Parameters:
+        fn (callable): Makes the request; called again on each retry
+        tokens (int): Estimated tokens the request consumes
+        priority (int): INTERACTIVE or BULK
+
+        Returns:
+        The result of fn
+
+        Raises:
+        Exception: The last error once retries are exhausted, or any error that is not retried
+        """
+        ticket = (priority, next(self._sequence))  # Retries keep their place in the queue
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            self._acquire(ticket, tokens)
+            result, succeeded = None, False
+            try:
+                result = fn()
+                succeeded = True
+                return result
+            except Exception as e:
+                if self._give_up(e, attempt, started):
+                    raise
+                delay = self._backoff(e, attempt)
+            finally:
+                self._release(tokens, result, succeeded)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, fn, tokens=1, priority=INTERACTIVE):
+        """Async counterpart of call; fn returns an awaitable"""
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            await self._acquire_async(ticket, tokens)
+            result, succeeded = None, False
+            try:
+                result = await fn()
+                succeeded = True
+                return result
+            except Exception as e:
+                if self._give_up(e, attempt, started):
+                    raise
+                delay = self._backoff(e, attempt)
+            finally:
+                self._release(tokens, result, succeeded)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stream(self, fn, tokens=1, priority=INTERACTIVE):
+        """
+        Run a streaming model call under the scheduler, yielding its events
+
+        The concurrency slot and the token reservation are held until the stream
+        is exhausted or closed, and the reservation is corrected from the usage
+        reported by the last event. Only opening the stream is retried.
+
+        Parameters:
+        fn (callable): Opens the stream; called again on each retry
+        tokens (int): Estimated tokens the request consumes
+        priority (int): INTERACTIVE or BULK
+
+        Yields:
+        The events of the stream
+        """
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            self._acquire(ticket, tokens)
+            stream = None
+            try:
+                stream = fn()
+                break
+            except Exception as e:
+                if self._give_up(e, attempt, started):
+                    raise
+                delay = self._backoff(e, attempt)
+            finally:
+                if stream is None:
+                    self._release(tokens, None, False)
+            attempt += 1
+            time.sleep(delay)
+
+        usage, succeeded = None, False
+        try:
+            for event in stream:
+                usage = getattr(event, "usage", None) or usage
+                yield event
+            succeeded = True
+        finally:
+            try:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+            finally:
+                self._release(tokens, SimpleNamespace(usage=usage), succeeded)
+
+    async def astream(self, fn, tokens=1, priority=INTERACTIVE):
+        """Async counterpart of stream; fn returns an awaitable resolving to an async iterable"""
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            await self._acquire_async(ticket, tokens)
+            stream = None
+            try:
+                stream = await fn()
+                break
+            except Exception as e:
+                if self._give_up(e, attempt, started):
+                    raise
+                delay = self._backoff(e, attempt)
+            finally:
+                if stream is None:
+                    self._release(tokens, None, False)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+        usage, succeeded = None, False
+        try:
+            async for event in stream:
+                usage = getattr(event, "usage", None) or usage
+                yield event
+            succeeded = True
+        finally:
+            try:
+                close = getattr(stream, "close", None)
+                if close:
+                    await close()
+            finally:
+                self._release(tokens, SimpleNamespace(usage=usage), succeeded)
+
+# Shared schedulers: every outbound call to a model goes through the same instance
+embedding_scheduler = ModelScheduler("embeddings", rpm=EMBED_RPM / MODEL_LIMIT_PROCESSES,
+                                     tpm=EMBED_TPM / MODEL_LIMIT_PROCESSES)
+chat_scheduler = ModelScheduler("chat", rpm=CHAT_RPM / MODEL_LIMIT_PROCESSES, tpm=CHAT_TPM / MODEL_LIMIT_PROCESSES)
@@ -0,0 +1,575 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+import numpy as np
+from utils.document_catalog import DocumentCatalog
+from utils.vector_store import VectorStore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NUMPY_STORE_PATH = os.environ.get("NUMPY_STORE_PATH", "./vector_db")
+EMBEDDING_STORAGE = os.environ.get("EMBEDDING_STORAGE", "float32")  # float32, float16 or int8
+RESCORE_FULL_PRECISION = os.environ.get("RESCORE_FULL_PRECISION", "false").lower() == "true"
+RESCORE_CANDIDATES = int(os.environ.get("RESCORE_CANDIDATES", 4))  # Candidates per result when rescoring
+DOT_BLOCK_ROWS = 8192  # Compact rows widened to float32 at a time during search
+
+
+def quantize_int8(matrix):
+    """
+    Scalar-quantize rows to int8 with one float32 scale per row
+
+    Returns:
+    tuple: (int8 codes, float32 scales) such that codes * scales[:, None] approximates matrix
+    """
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _generation(link):
+    """Name of the generation directory a document's link points at, or None if the document has none"""
+    try:
+        return os.readlink(link)
+    except FileNotFoundError:
+        return None
+
+
+class _DocumentVectors:
+    """Memory-mapped vectors of one document plus random access to its chunk records"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.generation = os.path.basename(directory)
+        # Records are read through this descriptor, so they stay those of these vectors
+        # even after another process swaps in a new version and removes this one
+        self._chunks = os.open(os.path.join(directory, "chunks.jsonl"), os.O_RDONLY)
+        self._chunks_size = os.fstat(self._chunks).st_size
+        manifest_path = os.path.join(directory, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'storage': "float32", 'full_precision': False}
+        self.storage = self.manifest['storage']
+        self.embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(directory, "scales.npy")) if self.storage == "int8" else None
+        self.full = None
+        if self.manifest.get('full_precision'):
+            self.full = np.load(os.path.join(directory, "embeddings_full.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(directory, "norms.npy"))
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+
+    def __del__(self):
+        chunks = getattr(self, "_chunks", None)
+        if chunks is not None:
+            os.close(chunks)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def dimension(self):
+        return self.embeddings.shape[1]
+
+    def dot(self, queries):
+        """
+        Dot products of every stored vector with a batch of queries, computed on the stored form
+
+        Parameters:
+        queries (numpy.ndarray): float32 query matrix of shape (queries, dimension)
+
+        Returns:
+        numpy.ndarray: Matrix of shape (rows, queries)
+        """
+        if self.storage == "float32":
+            return self.embeddings @ queries.T
+
+        # Widen compact rows block by block so the product runs through BLAS
+        # without materializing a float32 copy of the whole matrix
+        products = np.empty((len(self.embeddings), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.embeddings), DOT_BLOCK_ROWS):
+            block = self.embeddings[start:start + DOT_BLOCK_ROWS].astype(np.float32)
+            products[start:start + DOT_BLOCK_ROWS] = block @ queries.T
+        if self.storage == "int8":
+            products *= self.scales[:, None]
+        return products
+
+    def vectors(self, rows=None):
+        """Return float32 vectors for the given rows (all rows if None), at full precision when kept"""
+        rows = slice(None) if rows is None else rows
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        vectors = np.asarray(self.embeddings[rows], dtype=np.float32)
+        if self.storage == "int8":
+            vectors = vectors * self.scales[rows][:, None]
+        return vectors
+
+    def _read(self, start, stop):
+        """Bytes of the records of rows [start, stop)"""
+        begin = int(self.offsets[start]) if start < len(self.offsets) else self._chunks_size
+        end = int(self.offsets[stop]) if stop < len(self.offsets) else self._chunks_size
+        return os.pread(self._chunks, end - begin, begin)
+
+    def records(self, rows):
+        """Read the chunk records at the given row positions"""
+        return [json.loads(self._read(row, row + 1)) for row in rows]
+
+    def record_range(self, start, stop):
+        """Read the chunk records of consecutive rows with one read"""
+        return [json.loads(line) for line in self._read(start, stop).splitlines()]
+
+    def all_records(self):
+        return [json.loads(line) for line in os.pread(self._chunks, self._chunks_size, 0).splitlines()]
+
+
+class NumpyStore(VectorStore):
+    """
+    Vector store that keeps each document as a contiguous matrix on disk
+
+    A document's files live in a generation directory that is never modified;
+    a symlink named after the document points at the current generation and is
+    atomically replaced when the document is rewritten.
+
+    Searches memory-map the document's matrix and answer top-k exactly with one
+    matrix-vector product and argpartition. Distances are squared L2, the same
+    metric as the default Chroma collection.
+
+    Vectors can be stored compactly as float16 or as int8 with a per-vector scale.
+    Search then runs on the compact form; with rescoring enabled a float32 copy is
+    also kept on disk and only the top candidates are re-ranked against it.
+    """
+
+    def __init__(self, path=NUMPY_STORE_PATH, storage=EMBEDDING_STORAGE,
+                 rescore=RESCORE_FULL_PRECISION, rescore_candidates=RESCORE_CANDIDATES):
+        if storage not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unknown embedding storage: {storage}")
+        self.storage = storage
+        self.rescore = rescore and storage != "float32"
+        self.rescore_candidates = max(rescore_candidates, 1)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.catalog = DocumentCatalog(os.path.join(path, "document_catalog.sqlite3"))
+        self._loaded = {}
+        self._lock = threading.Lock()
+        logging.info(f"NumPy vector store initialized at {path}")
+
+    def _document_dir(self, doc_id):
+        """Path of the symlink to the current generation directory of a document"""
+        return os.path.join(self.path, hashlib.sha256(doc_id.encode("utf-8")).hexdigest())
+
+    def _load(self, doc_id):
+        """
+        Return the memory-mapped vectors of a document, or None if it has none
+
+        Loaded vectors are checked against the document's files on each use, so
+        a document rewritten or deleted by another worker process is reloaded or
+        dropped instead of being served from stale memory maps.
+        """
+        link = self._document_dir(doc_id)
+        for _ in range(3):
+            generation = _generation(link)
+            if generation is None:
+                self._forget(doc_id)
+                return None
+            with self._lock:
+                vectors = self._loaded.get(doc_id)
+            if vectors and vectors.generation == generation:
+                return vectors
+
+            try:
+                vectors = _DocumentVectors(os.path.join(self.path, generation))
+            except FileNotFoundError:
+                continue  # Replaced and removed by another writer while loading
+            with self._lock:
+                self._loaded[doc_id] = vectors
+            return vectors
+        raise RuntimeError(f"Vectors of {doc_id} kept changing while they were loaded")
+
+    def _forget(self, doc_id):
+        with self._lock:
+            self._loaded.pop(doc_id, None)
+
+    def _write_document(self, doc_id, ids, chunks, embeddings, metadatas):
+        """Write a document's files to a new generation directory and point its link at it"""
+        page = {'ids': ids, 'documents': chunks, 'metadatas': metadatas, 'embeddings': embeddings}
+        self._write_pages(doc_id, [page], len(ids))
+
+    def _write_pages(self, doc_id, pages, count):
+        """Write a document given as pages of chunks to a new generation directory, one page at a time, and point its link at it"""
+        link = self._document_dir(doc_id)
+        generation = f"{os.path.basename(link)}.{uuid.uuid4().hex}"
+        temp_dir = os.path.join(self.path, generation)
+        os.makedirs(temp_dir)
+        try:
+            stored = full = scales = None
+            norms = np.zeros(count, dtype=np.float32)
+            offsets = np.zeros(count, dtype=np.int64)
+            row = 0
+            with open(os.path.join(temp_dir, "chunks.jsonl"), "wb") as f:
+                for page in pages:
+                    if not len(page['ids']):
+                        continue
+                    matrix = np.asarray(page['embeddings'], dtype=np.float32)
+                    end = row + len(matrix)
+                    if end > count:
+                        raise ValueError(f"Expected {count} chunks for {doc_id}, received more")
+                    if stored is None:
+                        # Written in place, so the whole matrix never has to be in memory
+                        dtype = np.int8 if self.storage == "int8" else self.storage
+                        stored = np.lib.format.open_memmap(os.path.join(temp_dir, "embeddings.npy"), mode="w+",
+                                                           dtype=dtype, shape=(count, matrix.shape[1]))
+                        if self.storage == "int8":
+                            scales = np.ones(count, dtype=np.float32)
+                        if self.rescore:
+                            full = np.lib.format.open_memmap(os.path.join(temp_dir, "embeddings_full.npy"),
+                                                             mode="w+", dtype=np.float32, shape=(count, matrix.shape[1]))
+                    if self.storage == "int8":
+                        stored[row:end], scales[row:end] = quantize_int8(matrix)
+                    else:
+                        stored[row:end] = matrix
+                    if full is not None:
+                        full[row:end] = matrix
+                    norms[row:end] = np.einsum("ij,ij->i", matrix, matrix)
+
+                    for i, (chunk_id, chunk, metadata) in enumerate(zip(page['ids'], page['documents'], page['metadatas'])):
+                        offsets[row + i] = f.tell()
+                        record = {'id': chunk_id, 'document': chunk, 'metadata': metadata}
+                        f.write(json.dumps(record).encode("utf-8") + b"\n")
+                    row = end
+            if row != count:
+                raise ValueError(f"Expected {count} chunks for {doc_id}, received {row}")
+
+            if stored is None:
+                # A document without chunks still gets every file its manifest promises
+                dtype = np.int8 if self.storage == "int8" else self.storage
+                np.save(os.path.join(temp_dir, "embeddings.npy"), np.zeros((0, 0), dtype=dtype))
+                if self.storage == "int8":
+                    scales = np.ones(0, dtype=np.float32)
+                if self.rescore:
+                    np.save(os.path.join(temp_dir, "embeddings_full.npy"), np.zeros((0, 0), dtype=np.float32))
+            else:
+                stored.flush()
+            if full is not None:
+                full.flush()
+            if scales is not None:
+                np.save(os.path.join(temp_dir, "scales.npy"), scales)
+            np.save(os.path.join(temp_dir, "norms.npy"), norms)
+            np.save(os.path.join(temp_dir, "offsets.npy"), offsets)
+            with open(os.path.join(temp_dir, "manifest.json"), "w") as f:
+                json.dump({'storage': self.storage, 'full_precision': self.rescore}, f)
+            del stored, full
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        # Readers always find either the previous or the new generation, and a
+        # crash before the rename leaves the previous one in place
+        self._forget(doc_id)
+        previous = _generation(link)
+        temp_link = f"{link}.link-{uuid.uuid4().hex}"
+        os.symlink(generation, temp_link)
+        os.replace(temp_link, link)
+        if previous:
+            shutil.rmtree(os.path.join(self.path, previous), ignore_errors=True)
+
+    def store_pdf_data(self, doc_id, chunks, embeddings, metadata=None, file_name=None, content_hash=None, model=None):
+        """
+        Store PDF data as a document matrix
+
+        Parameters:
+        doc_id (str): Identity of the document (SHA-256 of its content)
+        chunks (list): List of text chunks
+        embeddings (list): List of embeddings for each chunk
+        metadata (dict): Additional metadata about the PDF
+        file_name (str, optional): Name the PDF was uploaded under
+        content_hash (str, optional): SHA-256 of the PDF, recorded in the catalog
+        model (str, optional): Embedding model name, recorded in the catalog
+        """
+        try:
+            file_name = file_name or doc_id
+            timestamp = datetime.now().isoformat()
+            ids = self._chunk_ids(doc_id, chunks)
+            metadatas = self._chunk_metadatas(doc_id, file_name, chunks, timestamp)
+
+            self._write_document(doc_id, ids, chunks, embeddings, metadatas)
+            self.catalog.upsert(
+                doc_id=doc_id,
+                file_name=file_name,
+                chunk_count=len(chunks),
+                upload_time=timestamp,
+                content_hash=content_hash,
+                model=model
+            )
+            logging.info(f"Successfully stored {len(chunks)} chunks for {file_name} ({doc_id})")
+
+        except Exception as e:
+            logging.error(f"Error storing PDF data: {str(e)}")
+            raise
+
+    def sync_pdf_data(self, doc_id, chunks, embed_fn, file_name=None, content_hash=None, model=None, base_doc_id=None):
+        """
+        Incrementally store PDF data, embedding only chunks that are not stored yet
+
+        Kept chunks copy their rows from the stored matrix of base_doc_id, new
+        chunks are embedded with embed_fn; without a base every chunk is new.
+
+        Returns:
+        dict: Counts of kept, added and removed chunks
+        """
+        try:
+            file_name = file_name or doc_id
+            timestamp = datetime.now().isoformat()
+
+            ids = self._chunk_ids(doc_id, chunks)
+            metadatas = self._chunk_metadatas(doc_id, file_name, chunks, timestamp)
+            keys = [chunk_id[len(doc_id) + 1:] for chunk_id in ids]
+
+            # Map stored chunk keys to their rows in the matrix of the previous version
+            source = self._load(base_doc_id) if base_doc_id else None
+            stored_rows = {}
+            if source:
+                for row, record in enumerate(source.all_records()):
+                    stored_rows[record['id'][len(base_doc_id) + 1:]] = row
+
+            added = [i for i, key in enumerate(keys) if key not in stored_rows]
+            kept_count = len(keys) - len(added)
+            removed_count = len(set(stored_rows) - set(keys))
+
+            new_embeddings = embed_fn([chunks[i] for i in added]) if added else []
+            dimension = len(new_embeddings[0]) if new_embeddings else source.dimension
+
+            matrix = np.empty((len(chunks), dimension), dtype=np.float32)
+            for i, embedding in zip(added, new_embeddings):
+                matrix[i] = embedding
+            kept = [i for i, key in enumerate(keys) if key in stored_rows]
+            if kept:
+                matrix[kept] = source.vectors([stored_rows[keys[i]] for i in kept])
+
+            self._write_document(doc_id, ids, chunks, matrix, metadatas)
+            self.catalog.upsert(
+                doc_id=doc_id,
+                file_name=file_name,
+                chunk_count=len(chunks),
+                upload_time=timestamp,
+                content_hash=content_hash,
+                model=model
+            )
+            stats = {'kept': kept_count, 'added': len(added), 'removed': removed_count}
+            logging.info(f"Synced {len(chunks)} chunks for {file_name} ({doc_id}) against {base_doc_id}: {stats}")
+            return stats
+
+        except Exception as e:
+            logging.error(f"Error syncing PDF data: {str(e)}")
+            raise
+
+    def stored_chunk_keys(self, doc_id):
+        """Return the content-derived keys of the chunks stored for a document"""
+        vectors = self._load(doc_id)
+        if not vectors:
+            return set()
+        return {record['id'][len(doc_id) + 1:] for record in vectors.all_records()}
+
+    @staticmethod
+    def _top_k(distances, k):
+        """Return the rows of the k smallest distances, nearest first"""
+        k = min(k, len(distances))
+        if k < len(distances):
+            rows = np.argpartition(distances, k - 1)[:k]
+        else:
+            rows = np.arange(len(distances))
+        return rows[np.argsort(distances[rows])]
+
+    def _search(self, vectors, queries, query_norms, n_results):
+        """Return one (rows, distances) pair per query with the n_results nearest rows of one document"""
+        distances = vectors.norms[:, None] - 2.0 * vectors.dot(queries) + query_norms[None, :]
+        matches = []
+        for q in range(len(queries)):
+            column = distances[:, q]
+            if vectors.full is None:
+                rows = self._top_k(column, n_results)
+                matches.append((rows, column[rows]))
+                continue
+
+            # Rank on the compact form, then rescore the best candidates at full precision
+            candidates = self._top_k(column, n_results * self.rescore_candidates)
+            exact = vectors.norms[candidates] - 2.0 * (vectors.vectors(candidates) @ queries[q]) + query_norms[q]
+            order = np.argsort(exact)[:n_results]
+            matches.append((candidates[order], exact[order]))
+        return matches
+
+    def get_similar_chunks(self, query_embedding, n_results=5, doc_id=None, verify_document=True, doc_ids=None):
+        """
+        Get similar chunks based on query embedding
+
+        Parameters:
+        query_embedding (list): Embedding vector for the query
+        n_results (int): Number of similar chunks to return
+        doc_id (str, optional): Identity of the document to search within
+        verify_document (bool): Check that the requested documents exist before querying
+        doc_ids (list, optional): Documents to search within; all documents if neither this nor doc_id is given
+
+        Returns:
+        list: List of similar chunks with their metadata
+        """
+        similar_chunks = self.get_similar_chunks_batch(
+            [query_embedding], n_results, doc_id, verify_document, doc_ids
+        )[0]
+        if not similar_chunks:
+            logger.warning(f"No matching chunks found for document: {doc_id}")
+        return similar_chunks
+
+    def get_similar_chunks_batch(self, query_embeddings, n_results=5, doc_id=None, verify_document=True, doc_ids=None):
+        """
+        Get similar chunks for several query embeddings with one matrix product per document
+
+        Each document is a shard; its top n_results per query are merged into a
+        global top n_results.
+
+        Parameters:
+        query_embeddings (list): Embedding vectors of the queries
+        n_results (int): Number of similar chunks to return per query
+        doc_id (str, optional): Identity of the document to search within
+        verify_document (bool): Check that the requested documents exist before querying
+        doc_ids (list, optional): Documents to search within; all documents if neither this nor doc_id is given
+
+        Returns:
+        list: One list of similar chunks per query, in the order of query_embeddings
+        """
+        try:
+            if not query_embeddings:
+                return []
+            scope = self._search_scope(doc_id, doc_ids, verify_document)
+            if scope is None:
+                scope = [entry['doc_id'] for entry in self.catalog.list_documents()]
+
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            query_norms = np.einsum("ij,ij->i", queries, queries)
+
+            candidates = [[] for _ in query_embeddings]
+            loaded = {}  # Records are read from the vectors that were searched
+            for candidate_doc_id in scope:
+                vectors = self._load(candidate_doc_id)
+                if not vectors:
+                    continue
+                loaded[candidate_doc_id] = vectors
+                matches = self._search(vectors, queries, query_norms, n_results)
+                for q, (rows, distances) in enumerate(matches):
+                    candidates[q].extend(
+                        (float(distance), candidate_doc_id, int(row)) for row, distance in zip(rows, distances)
+                    )
+
+            batch = []
+            for query_candidates in candidates:
+                query_candidates.sort()
+                batch.append([
+                    dict(loaded[candidate_doc_id].records([row])[0], distance=distance)
+                    for distance, candidate_doc_id, row in query_candidates[:n_results]
+                ])
+            return batch
+
+        except Exception as e:
+            logging.error(f"Error getting similar chunks: {str(e)}")
+            raise
+
+    def get_file_chunks(self, doc_id):
+        """Get all chunks for a specific document"""
+        try:
+            vectors = self._load(doc_id)
+            return vectors.all_records() if vectors else []
+        except Exception as e:
+            logging.error(f"Error getting file chunks: {str(e)}")
+            raise
+
+    def get_file_chunks_page(self, doc_id, limit, offset=0, include=("documents", "metadatas")):
+        """
+        Get one page of a document's chunks, reading only those rows
+
+        Returns:
+        dict: 'ids' and a list per included field; 'embeddings' is a float32 matrix
+        """
+        try:
+            vectors = self._load(doc_id)
+            end = min(offset + limit, len(vectors)) if vectors else 0
+            if offset >= end:
+                page = {'ids': []}
+                for field in include:
+                    page[field] = []
+                if "embeddings" in include:
+                    page['embeddings'] = np.zeros((0, vectors.dimension if vectors else 0), dtype=np.float32)
+                return page
+
+            records = vectors.record_range(offset, end)
+            page = {'ids': [record['id'] for record in records]}
+            if "documents" in include:
+                page['documents'] = [record['document'] for record in records]
+            if "metadatas" in include:
+                page['metadatas'] = [record['metadata'] for record in records]
+            if "embeddings" in include:
+                page['embeddings'] = vectors.vectors(slice(offset, end))
+            return page
+        except Exception as e:
+            logging.error(f"Error getting file chunks: {str(e)}")
+            raise
+
+    def store_document_pages(self, doc_id, pages, chunk_count, file_name=None, content_hash=None, model=None,
+                             upload_time=None):
+        """
+        Replace a document with pages of chunks that already carry their ids, metadata and embeddings
+
+        Used to import exported documents without embedding them again; one page
+        is held in memory at a time.
+        """
+        try:
+            self._write_pages(doc_id, pages, chunk_count)
+            self.catalog.upsert(
+                doc_id=doc_id,
+                file_name=file_name or doc_id,
+                chunk_count=chunk_count,
+                upload_time=upload_time or datetime.now().isoformat(),
+                content_hash=content_hash,
+                model=model
+            )
+            logging.info(f"Successfully stored {chunk_count} imported chunks for {doc_id}")
+        except Exception as e:
+            logging.error(f"Error storing PDF data: {str(e)}")
+            raise
+
+    def delete_file_data(self, doc_id):
+        """Delete all data for a specific document, including its file name aliases"""
+        try:
+            self._forget(doc_id)
+            link = self._document_dir(doc_id)
+            generation = _generation(link)
+            if generation:
+                os.remove(link)
+                shutil.rmtree(os.path.join(self.path, generation), ignore_errors=True)
+            self.catalog.remove(doc_id)
+            logging.info(f"Successfully deleted data for {doc_id}")
+        except Exception as e:
+            logging.error(f"Error deleting file data: {str(e)}")
+            raise
+
+    def get_embeddings(self, doc_id: str) -> dict:
+        """Get embeddings and chunks for a document"""
+        try:
+            vectors = self._load(doc_id)
+            if not vectors:
+                return {'ids': [], 'embeddings': [], 'documents': [], 'metadatas': []}
+            records = vectors.all_records()
+            return {
+                'ids': [record['id'] for record in records],
+                'embeddings': vectors.vectors().tolist(),
+                'documents': [record['document'] for record in records],
+                'metadatas': [record['metadata'] for record in records]
+            }
+        except Exception as e:
+            logger.error(f"Error getting embeddings: {str(e)}")
+            return None
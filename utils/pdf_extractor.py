@@ -0,0 +1,92 @@
+import os
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", os.cpu_count() or 1))
+PAGES_PER_TASK = int(os.environ.get("PAGES_PER_TASK", 16))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Return the shared extraction process pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers are safe to start from the threaded web server
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _extract_page_range(pdf_path, start, end):
+    """Extract the text of pages [start, end), dropping empty or image-only pages"""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    pages = []
+    for number in range(start, end):
+        text = reader.pages[number].extract_text() or ""
+        if text.strip():
+            pages.append((number, text))
+    return pages
+
+
+def count_pages(pdf_path):
+    """Return the number of pages in a PDF"""
+    from pypdf import PdfReader
+    return len(PdfReader(pdf_path).pages)
+
+
+def iter_pages(pdf_path, workers=EXTRACT_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """
+    Yield the text of each non-empty page in order, parsing page ranges in parallel
+
+    At most two ranges per worker are in flight, so memory stays bounded no matter
+    how many pages the document has, and the caller can start chunking and
+    embedding the first pages while later ones are still being parsed.
+
+    Parameters:
+    pdf_path (str): Path to the PDF file
+    workers (int): Number of worker processes; 1 parses in the calling thread
+    pages_per_task (int): Number of pages parsed by a single task
+
+    Yields:
+    tuple: (page number starting at 0, page text)
+    """
+    total = count_pages(pdf_path)
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+    logger.info(f"Extracting {total} pages in {len(ranges)} ranges (workers={workers})")
+
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from _extract_page_range(pdf_path, start, end)
+        return
+
+    pool = _get_pool()
+    remaining = iter(ranges)
+    pending = deque()
+    for start, end in remaining:
+        pending.append(pool.submit(_extract_page_range, pdf_path, start, end))
+        if len(pending) >= workers * 2:
+            break
+
+    try:
+        while pending:
+            pages = pending.popleft().result()
+            next_range = next(remaining, None)
+            if next_range:
+                pending.append(pool.submit(_extract_page_range, pdf_path, *next_range))
+            yield from pages
+    finally:
+        for future in pending:
+            future.cancel()
@@ -1,17 +1,22 @@
 import os
 import logging
-from openai import OpenAI, RateLimitError, APIConnectionError, APIError
 from dotenv import load_dotenv
-from llama_index.core import VectorStoreIndex, Settings, SimpleDirectoryReader, Document, ServiceContext
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.readers.file import PDFReader
-from llama_index.core.retrievers import VectorIndexRetriever
-from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.llms.openai import OpenAI as LlamaOpenAI
-from httpx import HTTPStatusError
-from utils.chroma_store import ChromaStore
-from datetime import datetime
+import threading
+from functools import partial
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from utils.vector_store import get_vector_store, chunk_key
+from utils.pdf_extractor import iter_pages, count_pages
+from utils.embedding_cache import EmbeddingCache
+from utils.document_handles import DocumentHandleCache
+from utils.document_catalog import file_sha256
+from utils.model_scheduler import embedding_scheduler, chat_scheduler, estimate_tokens, INTERACTIVE, BULK
+from utils.answering import (
+    CHAT_MODEL, ANSWER_TEMPERATURE, RETRIEVAL_TOP_K, ANSWER_MAX_TOKENS_ESTIMATE, invalidate_answers, cached_answer,
+    cache_answer, embedding_input, describe_error, build_answer_messages, select_context, describe_sources,
+    group_sources
+)
+from utils import metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,115 +30,343 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logging.warning("OpenAI API key not found in environment variables")
 
-# Initialize OpenAI client with no retries
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-    max_retries=0  # Disable retries to show errors immediately
-)
+# Model settings
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "text-embedding-3-small")
+ANSWER_CONCURRENCY = int(os.environ.get("ANSWER_CONCURRENCY", 4))  # Completions in flight for batch questions
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 256))  # Pooled connections to OpenAI
 
-# Configure settings
-Settings.embed_model = OpenAIEmbedding(
-    model="text-embedding-3-small",
-    api_key=os.environ.get("OPENAI_API_KEY"),
-    max_retries=0  # Disable retries for embeddings too
-)
+# Ingestion settings
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 1024))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", 200))
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 128))  # Texts per embedding request
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", 4))  # Embedding requests in flight
+INCREMENTAL_INGEST = os.environ.get("INCREMENTAL_INGEST", "true").lower() == "true"  # Embed only changed chunks
 
-# Initialize LlamaIndex OpenAI client with no retries
-llm = LlamaOpenAI(
-    model="gpt-3.5-turbo",
-    temperature=0.1,
-    api_key=os.environ.get("OPENAI_API_KEY"),
-    max_retries=0  # Disable retries for completions too
-)
-Settings.llm = llm
+# Clients are created on first use so importing the app stays fast
+_client = None
+_document_handles = None
+_embedding_cache = None
+_lazy_lock = threading.Lock()
+
+def get_openai_client():
+    """
+    Return the OpenAI client shared by embeddings and chat, creating it on first use
+
+    Requests go over one keep-alive connection pool. Retries are left to the
+    model scheduler, which also paces requests to the rate limits.
+    """
+    global _client
+    if _client is None:
+        with _lazy_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI, DefaultHttpxClient
+                _client = OpenAI(
+                    api_key=OPENAI_API_KEY,
+                    max_retries=0,
+                    http_client=DefaultHttpxClient(limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                    ))
+                )
+    return _client
+
+def get_document_handles():
+    """Return the per-document retrieval handles, resolved once and reused by every question"""
+    global _document_handles
+    if _document_handles is None:
+        with _lazy_lock:
+            if _document_handles is None:
+                _document_handles = DocumentHandleCache(get_vector_store())
+    return _document_handles
+
+def get_embedding_cache():
+    """Return the on-disk embedding cache, opening its database on first use"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _lazy_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+def _embed_batch(batch, priority):
+    """Embed one batch of texts with a single scheduled request"""
+    batch_input = embedding_input(batch)
+    response = embedding_scheduler.call(
+        lambda: get_openai_client().embeddings.create(model=EMBED_MODEL, input=batch_input),
+        tokens=estimate_tokens(batch_input),
+        priority=priority
+    )
+    metrics.record_usage("embedding", getattr(response, "usage", None))
+    return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+def _embed_uncached(texts, batch_size, concurrency, on_batch=None, priority=INTERACTIVE):
+    """Send texts to the embedding model in batched requests"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    logging.info(f"Embedding {len(texts)} texts in {len(batches)} batches (concurrency={concurrency})")
+
+    lock = threading.Lock()
+
+    def embed_batch(batch):
+        embeddings = _embed_batch(batch, priority)
+        if on_batch:
+            with lock:
+                on_batch(len(batch))
+        return embeddings
+
+    if concurrency <= 1 or len(batches) == 1:
+        results = [embed_batch(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            results = list(pool.map(embed_batch, batches))
+
+    return [embedding for batch in results for embedding in batch]
+
+def embed_texts(texts, batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY, progress=None, priority=INTERACTIVE):
+    """
+    Embed texts, serving repeats from the embedding cache and batching the rest
+
+    Parameters:
+    texts (list): Texts to embed
+    batch_size (int): Number of texts sent in a single embedding request
+    concurrency (int): Maximum number of embedding requests in flight
+    progress (callable, optional): Called as progress("embedding", done, total) as batches complete
+    priority (int): Scheduler priority of the requests; ingestion passes BULK
+
+    Returns:
+    list: One embedding per text, in input order
+    """
+    if not texts:
+        return []
+
+    embeddings = get_embedding_cache().get_many(EMBED_MODEL, texts)
+
+    # Embed each distinct missing text once
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    metrics.inc('embedding_cache_total', len(texts) - len(missing), result="hit")
+    metrics.inc('embedding_cache_total', len(missing), result="miss")
+    if progress:
+        done = [len(texts) - len(missing)]
+        progress("embedding", done[0], len(texts))
+
+        def on_batch(count):
+            done[0] += count
+            progress("embedding", done[0], len(texts))
+    else:
+        on_batch = None
+
+    if missing:
+        fresh = _embed_uncached(missing, batch_size, concurrency, on_batch, priority)
+        get_embedding_cache().put_many(EMBED_MODEL, missing, fresh)
+        fresh_by_text = dict(zip(missing, fresh))
+        embeddings = [embedding if embedding is not None else fresh_by_text[text]
+                      for text, embedding in zip(texts, embeddings)]
+    if progress:
+        progress("embedding", len(texts), len(texts))
+
+    logging.info(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} texts served from cache")
+    return embeddings
 
-# Initialize ChromaDB
-chroma_store = ChromaStore()
+def _embed_chunks(texts):
+    """Embed chunks for ingestion, timed as the embed stage"""
+    with metrics.stage("embed"):
+        return embed_texts(texts, concurrency=1, priority=BULK)
 
-def process_pdf(pdf_path: str) -> VectorStoreIndex:
-    """Process PDF and return index"""
+def process_pdf(pdf_path: str, doc_id=None, file_name=None, progress=None, base_doc_id=None) -> dict:
+    """
+    Split a PDF into chunks, embed them in batches and store them in the vector store
+
+    Pages are parsed in parallel and streamed into the chunker; embedding batches
+    are sent as soon as they fill, while later pages are still being parsed.
+    With INCREMENTAL_INGEST enabled, chunks already stored for base_doc_id are
+    not embedded again.
+
+    Parameters:
+    pdf_path (str): Path to the PDF file
+    doc_id (str, optional): Identity of the document; defaults to the SHA-256 of the file
+    file_name (str, optional): Name the PDF was uploaded under; defaults to the file's base name
+    progress (callable, optional): Called as progress(stage, done=None, total=None)
+        for the parsing, embedding and storing stages
+    base_doc_id (str, optional): Stored document this PDF is a revision of
+
+    Returns:
+    dict: Number of pages and chunks stored, plus kept/added/removed counts in
+        incremental mode, or None if embeddings already exist
+    """
+    from llama_index.core.node_parser import SentenceSplitter
+    
+    vector_store = get_vector_store()
     try:
-        file_name = os.path.basename(pdf_path)
+        doc_id = doc_id or file_sha256(pdf_path)
+        file_name = file_name or os.path.basename(pdf_path)
         
         # Check if embeddings already exist
-        if chroma_store.embeddings_exist(file_name):
-            logging.info(f"Embeddings already exist for {file_name} in ChromaDB")
+        if vector_store.embeddings_exist(doc_id):
+            logging.info(f"Embeddings already exist for {file_name} ({doc_id}) in the vector store")
             return None  # Return None to indicate embeddings exist
             
         logging.info(f"Creating new embeddings for {file_name}")
-        # Load and process PDF
-        documents = SimpleDirectoryReader(input_files=[pdf_path]).load_data()
-        
-        # Filter out empty documents and create index with valid content
-        valid_documents = []
-        for doc in documents:
-            if doc.text and doc.text.strip():  # Check if document has non-empty text
-                valid_documents.append(doc)
-            else:
-                logging.info(f"Skipping empty or image-only page in {file_name}")
-        
-        if not valid_documents:
-            raise Exception("No valid text content found in PDF")
-            
-        # Create index with valid documents
-        index = VectorStoreIndex.from_documents(
-            valid_documents,
-            service_context=ServiceContext.from_defaults(
-                embed_model=Settings.embed_model
-            )
-        )
-        
-        # Get embeddings and chunks
-        nodes = list(index.docstore.docs.values())
-        if not nodes:
-            raise Exception("No nodes found in the index")
-            
-        embeddings = []
+        total_pages = count_pages(pdf_path)
+        if progress:
+            progress("parsing", 0, total_pages)
+        
+        # Chunks the stored version already has do not need embedding
+        known_keys = vector_store.stored_chunk_keys(base_doc_id) if INCREMENTAL_INGEST and base_doc_id else set()
+        
+        splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
         chunks = []
-        metadatas = []
-        
-        for i, node in enumerate(nodes):
-            try:
-                # Get embedding for the node text
-                embedding = Settings.embed_model.get_text_embedding(node.text)
-                embeddings.append(embedding)
-                chunks.append(node.text)
-                metadatas.append({
-                    "file_name": file_name,
-                    "chunk_index": i,
-                    "timestamp": datetime.now().isoformat(),
-                    "total_chunks": len(nodes),
-                    "chunk_size": len(node.text)
-                })
-            except Exception as e:
-                logging.warning(f"Skipping chunk {i} due to error: {str(e)}")
-                continue
-        
-        if not embeddings:
-            raise Exception("No embeddings generated")
+        batches = []
+        batch = []
+        page_count = 0
+        
+        with ThreadPoolExecutor(max_workers=max(EMBED_CONCURRENCY, 1)) as pool:
+            # Parse, split and send embedding batches as pages stream in
+            for page_number, text in metrics.timed_iter("parse", iter_pages(pdf_path)):
+                page_count += 1
+                with metrics.stage("chunk"):
+                    page_chunks = splitter.split_text(text)
+                for chunk in page_chunks:
+                    if not chunk.strip():
+                        continue
+                    chunks.append(chunk)
+                    if chunk_key(chunk) not in known_keys:
+                        batch.append(chunk)
+                    if len(batch) >= EMBED_BATCH_SIZE:
+                        batches.append((batch, pool.submit(_embed_chunks, batch)))
+                        batch = []
+                if progress:
+                    progress("parsing", page_number + 1, total_pages)
+            if batch:
+                batches.append((batch, pool.submit(_embed_chunks, batch)))
+            
+            if not page_count:
+                raise Exception("No valid text content found in PDF")
+            if not chunks:
+                raise Exception("No chunks produced from PDF")
+            logging.info(f"Split {page_count} of {total_pages} pages of {file_name} into {len(chunks)} chunks")
             
-        # Store in ChromaDB
-        chroma_store.store_pdf_data(
-            file_name=file_name,
-            chunks=chunks,
-            embeddings=embeddings,
-            metadata=metadatas
-        )
+            # Collect the embeddings of every batch
+            embedded = {}
+            total_to_embed = sum(len(texts) for texts, future in batches)
+            for texts, future in batches:
+                embedded.update(zip(texts, future.result()))
+                if progress:
+                    progress("embedding", len(embedded), total_to_embed)
         
-        return index
+        def embeddings_for(texts):
+            """Look up streamed embeddings, embedding any text that was not sent yet"""
+            missing = [text for text in texts if text not in embedded]
+            if missing:
+                embedded.update(zip(missing, _embed_chunks(missing)))
+            if progress:
+                progress("storing", 0, len(chunks))
+            return [embedded[text] for text in texts]
+        
+        stats = {'pages': page_count, 'chunks': len(chunks)}
+        if INCREMENTAL_INGEST:
+            # Store only the chunks the stored version does not have; the
+            # store stage includes embedding any chunk that was not sent yet
+            with metrics.stage("store"):
+                stats.update(vector_store.sync_pdf_data(
+                    doc_id=doc_id,
+                    chunks=chunks,
+                    embed_fn=embeddings_for,
+                    file_name=file_name,
+                    content_hash=doc_id,
+                    model=EMBED_MODEL,
+                    base_doc_id=base_doc_id
+                ))
+        else:
+            # Store every chunk in the vector store
+            embeddings = embeddings_for(chunks)
+            with metrics.stage("store"):
+                vector_store.store_pdf_data(
+                    doc_id=doc_id,
+                    chunks=chunks,
+                    embeddings=embeddings,
+                    file_name=file_name,
+                    content_hash=doc_id,
+                    model=EMBED_MODEL
+                )
+        invalidate_answers(doc_id)
+        metrics.inc('ingested_total', page_count, kind="pages")
+        metrics.inc('ingested_total', len(chunks), kind="chunks")
+        logging.info(f"Embedding cache stats: {get_embedding_cache().stats()}")
+        
+        return stats
         
     except Exception as e:
         logging.error(f"Error processing PDF: {str(e)}")
         raise
 
-def get_answer_from_pdf(question, index=None, file_name=None):
+def _create_completion(messages, priority=INTERACTIVE):
+    """Run a chat completion through the scheduler, reserving the prompt plus an answer's worth of tokens"""
+    tokens = estimate_tokens([message['content'] for message in messages]) + ANSWER_MAX_TOKENS_ESTIMATE
+    response = chat_scheduler.call(
+        lambda: get_openai_client().chat.completions.create(
+            model=CHAT_MODEL, messages=messages, temperature=ANSWER_TEMPERATURE
+        ),
+        tokens=tokens,
+        priority=priority
+    )
+    metrics.record_usage("chat", getattr(response, "usage", None))
+    return response
+
+def _stream_completion(messages, priority=INTERACTIVE):
+    """Stream a chat completion through the scheduler, which holds its slot until the last event"""
+    tokens = estimate_tokens([message['content'] for message in messages]) + ANSWER_MAX_TOKENS_ESTIMATE
+    events = chat_scheduler.stream(
+        lambda: get_openai_client().chat.completions.create(
+            model=CHAT_MODEL, messages=messages, temperature=ANSWER_TEMPERATURE,
+            stream=True, stream_options={"include_usage": True}  # The last event reports the tokens used
+        ),
+        tokens=tokens,
+        priority=priority
+    )
+    with closing(events):
+        for event in events:
+            metrics.record_usage("chat", getattr(event, "usage", None))
+            yield event
+
+def _retrieve_chunks(question, document):
+    """Embed the question and fetch the most similar chunks of the document, returning (embedding, chunks)"""
+    with metrics.stage("query_embed"):
+        question_embedding = embed_texts([question])[0]
+    with metrics.stage("vector_search"):
+        similar_chunks = document.search(question_embedding, n_results=RETRIEVAL_TOP_K)
+    if not similar_chunks:
+        raise Exception("No relevant content found in PDF")
+    logger.info(f"Retrieved {len(similar_chunks)} relevant chunks from the vector store")
+    return question_embedding, select_context(similar_chunks)
+
+def _generate_answer(question, document):
+    """Retrieve chunks and answer a question with one chat completion unless cached, returning (answer, chunks)"""
+    logger.info(f"Getting answer for question: {question}")
+    question_embedding, similar_chunks = _retrieve_chunks(question, document)
+    answer = cached_answer(question, document, similar_chunks, question_embedding)
+    if answer is not None:
+        return answer, similar_chunks
+    
+    with metrics.stage("llm_completion"):
+        response = _create_completion(build_answer_messages(question, similar_chunks))
+    answer = response.choices[0].message.content if response.choices else None
+    
+    if not answer or answer.strip() == "":
+        raise Exception("No answer could be generated from the PDF content")
+        
+    logger.info("Answer generated successfully")
+    cache_answer(question, document, similar_chunks, answer, question_embedding)
+    return answer, similar_chunks
+
+def get_answer_from_pdf(question, document):
     """
-    Get answer to a question from PDF content using the stored embeddings in ChromaDB
+    Get answer to a question from PDF content using the stored embeddings in the vector store
+    
+    The retrieved chunks go into a single prompt answered by one chat completion,
+    unless the same question was answered from the same chunks before.
     
     Parameters:
     question (str): The question to answer
-    index (VectorStoreIndex, optional): The pre-processed index of the PDF
-    file_name (str, optional): Name of the PDF file if using stored embeddings
+    document (DocumentHandle): Retrieval handle of the PDF, from get_document_handles().get
     
     Returns:
     str: The answer to the question
@@ -142,76 +375,142 @@ def get_answer_from_pdf(question, index=None, file_name=None):
     Exception: If there's an error getting the answer
     """
     try:
-        logger.info(f"Getting answer for question: {question}")
-        
-        # Get embeddings for the question
-        logger.info("Creating question embedding...")
-        question_embedding = Settings.embed_model.get_text_embedding(question)
-        
-        # If file_name is provided, use stored embeddings from ChromaDB
-        if file_name:
-            logger.info(f"Using stored embeddings for file: {file_name}")
-            # Get similar chunks from ChromaDB for this specific file
-            # print ("question_embedding", question_embedding)
-            print ("file_name", file_name)
-            similar_chunks = chroma_store.get_similar_chunks(question_embedding, n_results=3, file_name=file_name)
-            if not similar_chunks or len(similar_chunks) == 0:
-                raise Exception("No relevant content found in PDF")
-            
-            # Create context from similar chunks
-            context = "\n\n".join([chunk['document'] for chunk in similar_chunks])
-            logger.info(f"Retrieved {len(similar_chunks)} relevant chunks from ChromaDB")
-            
-            # Create a simple index from the context
-            from llama_index.core import Document
-            doc = Document(text=context)
-            index = VectorStoreIndex.from_documents([doc])
-        
-        # If index is provided, use it directly
-        elif index:
-            logger.info("Using provided index for querying")
-            # Get similar chunks from ChromaDB for this specific file
-            similar_chunks = chroma_store.get_similar_chunks(question_embedding, n_results=3, file_name=file_name)
-            if not similar_chunks or len(similar_chunks) == 0:
-                raise Exception("No relevant content found in PDF")
-            
-            # Create context from similar chunks
-            context = "\n\n".join([chunk['document'] for chunk in similar_chunks])
-            logger.info(f"Retrieved {len(similar_chunks)} relevant chunks")
-        
-        else:
-            raise Exception("Either index or file_name must be provided")
-        
-        # Create query engine with the context
-        logger.info("Creating query engine...")
-        query_engine = index.as_query_engine()
-        
-        # Query with the context
-        logger.info("Querying with context...")
-        response = query_engine.query(f"Context: {context}\n\nQuestion: {question}")
-        
-        if not response or str(response).strip() == "":
-            raise Exception("No answer could be generated from the PDF content")
-            
-        logger.info("Answer generated successfully")
-        return str(response)
+        answer, _ = _generate_answer(question, document)
+        return answer
         
-    except (RateLimitError, HTTPStatusError) as e:
-        error_msg = "OpenAI API quota exceeded. Please check your billing details and current quota."
+    except Exception as e:
+        error_msg = describe_error(e)
         logger.error(f"{error_msg} Error: {str(e)}")
         raise Exception(error_msg)
+
+def get_answer_from_pdfs(question, documents):
+    """
+    Answer a question from several PDFs with a single vector search across them
+    
+    Parameters:
+    question (str): The question to answer
+    documents (DocumentSetHandle): Retrieval handle of the PDFs, from get_document_handles().get_set
+    
+    Returns:
+    dict: 'answer' and 'sources', the retrieved chunks grouped per document
+    
+    Raises:
+    Exception: If there's an error getting the answer
+    """
+    try:
+        answer, similar_chunks = _generate_answer(question, documents)
+        return {'answer': answer, 'sources': group_sources(similar_chunks)}
         
-    except APIConnectionError as e:
-        error_msg = "Failed to connect to OpenAI API. Please check your internet connection."
+    except Exception as e:
+        error_msg = describe_error(e)
         logger.error(f"{error_msg} Error: {str(e)}")
         raise Exception(error_msg)
-        
-    except APIError as e:
-        error_msg = "OpenAI API error. Please check your API key and billing status."
+
+def _complete_answer(question, similar_chunks, question_embedding, document):
+    """Answer one question from already retrieved chunks, returning a result dict instead of raising"""
+    if not similar_chunks:
+        return {'question': question, 'error': "No relevant content found in PDF"}
+    try:
+        answer = cached_answer(question, document, similar_chunks, question_embedding)
+        if answer is not None:
+            return {'question': question, 'answer': answer}
+        # Batch questions yield to single interactive questions
+        with metrics.stage("llm_completion"):
+            response = _create_completion(build_answer_messages(question, similar_chunks), priority=BULK)
+        answer = response.choices[0].message.content if response.choices else None
+        if not answer or answer.strip() == "":
+            return {'question': question, 'error': "No answer could be generated from the PDF content"}
+        cache_answer(question, document, similar_chunks, answer, question_embedding)
+        return {'question': question, 'answer': answer}
+    except Exception as e:
+        error_msg = describe_error(e)
+        logger.error(f"{error_msg} Error: {str(e)}")
+        return {'question': question, 'error': error_msg}
+
+def get_answers_from_pdf(questions, document, concurrency=ANSWER_CONCURRENCY):
+    """
+    Answer several questions about one PDF
+    
+    All questions are embedded together and retrieved with one multi-query search;
+    the chat completions then run on a bounded thread pool.
+    
+    Parameters:
+    questions (list): The questions to answer
+    document (DocumentHandle): Retrieval handle of the PDF (or a DocumentSetHandle of several PDFs)
+    concurrency (int): Maximum number of completions in flight
+    
+    Returns:
+    list: One dict per question, in order, with 'question' and either 'answer' or 'error'
+    
+    Raises:
+    Exception: If embedding or retrieval fails for the whole batch
+    """
+    try:
+        logger.info(f"Getting answers for {len(questions)} questions")
+        with metrics.stage("query_embed"):
+            question_embeddings = embed_texts(questions)
+        with metrics.stage("vector_search"):
+            retrieved = document.search_batch(question_embeddings, n_results=RETRIEVAL_TOP_K)
+        retrieved = [select_context(similar_chunks) for similar_chunks in retrieved]
+        logger.info(f"Retrieved chunks for {len(retrieved)} questions with one search")
+    except Exception as e:
+        error_msg = describe_error(e)
         logger.error(f"{error_msg} Error: {str(e)}")
         raise Exception(error_msg)
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(questions)))) as pool:
+        results = list(pool.map(partial(_complete_answer, document=document),
+                                questions, retrieved, question_embeddings))
+    
+    failed = sum(1 for result in results if 'error' in result)
+    logger.info(f"Answered {len(results) - failed} of {len(results)} questions")
+    return results
+
+def stream_answer_from_pdf(question, document):
+    """
+    Stream an answer to a question, yielding retrieval metadata before the completion tokens
+    
+    Parameters:
+    question (str): The question to answer
+    document (DocumentHandle): Retrieval handle of the PDF, from get_document_handles().get
+    
+    Yields:
+    dict: {'type': 'sources', 'sources': [...]} once, then {'type': 'token', 'text': ...}
+        for each completion delta, then {'type': 'done'}
+    
+    Raises:
+    Exception: If there's an error getting the answer, with a user-facing message
+    """
+    try:
+        logger.info(f"Streaming answer for question: {question}")
+        question_embedding, similar_chunks = _retrieve_chunks(question, document)
+        
+        yield {'type': 'sources', 'sources': describe_sources(similar_chunks)}
+        
+        answer = cached_answer(question, document, similar_chunks, question_embedding)
+        if answer is not None:
+            yield {'type': 'token', 'text': answer}
+            yield {'type': 'done'}
+            return
+        
+        # Timed from the request until the last token has been passed on
+        parts = []
+        with metrics.stage("llm_completion"):
+            with closing(_stream_completion(build_answer_messages(question, similar_chunks))) as stream:
+                for event in stream:
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield {'type': 'token', 'text': delta}
+        
+        # Only an answer streamed to the end is reused
+        if "".join(parts).strip():
+            cache_answer(question, document, similar_chunks, "".join(parts), question_embedding)
+        yield {'type': 'done'}
         
     except Exception as e:
-        error_msg = f"Error getting answer: {str(e)}"
-        logger.error(error_msg)
+        error_msg = describe_error(e)
+        logger.error(f"{error_msg} Error: {str(e)}")
         raise Exception(error_msg)
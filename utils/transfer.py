@@ -0,0 +1,212 @@
+"""
+Export stored documents to files and import them into another store, without re-embedding
+
+Usage:
+    python -m utils.transfer export ./export [--documents a.pdf b.pdf]
+    python -m utils.transfer import ./export [--replace]
+
+An export directory holds, per document, its embeddings as a float32 .npy
+matrix and its chunk ids, texts and metadata as JSONL, in the same row order,
+plus a manifest.json listing the documents with their catalog entries and file
+names. The manifest is written last, so a directory without one is an
+incomplete export. Both directions read and write one page of chunks at a time.
+
+Run an import with the app stopped, or against a Chroma server (CHROMA_HOST),
+as an embedded store must only be written by one process.
+"""
+import os
+import json
+import logging
+import argparse
+from itertools import islice
+import numpy as np
+from utils.vector_store import EXPORT_PAGE_SIZE, get_vector_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT = "chatpdf-export"
+EXPORT_VERSION = 1
+
+
+def _count_chunks(store, doc_id, page_size):
+    """Count a document's chunks by paging through their ids only"""
+    return sum(len(page['ids']) for page in store.iter_file_chunks(doc_id, page_size, include=()))
+
+
+def export_document(store, doc_id, directory, stem, page_size=EXPORT_PAGE_SIZE):
+    """
+    Write one document's embeddings and chunks to files
+
+    Parameters:
+    store (VectorStore): Store holding the document
+    doc_id (str): Identity of the document
+    directory (str): Export directory
+    stem (str): File name prefix of the document's files
+    page_size (int): Chunks read per page
+
+    Returns:
+    dict: File names, chunk count and embedding dimension of the export
+    """
+    count = _count_chunks(store, doc_id, page_size)
+    embeddings_file = f"{stem}.embeddings.npy"
+    chunks_file = f"{stem}.chunks.jsonl"
+    matrix = None
+    dimension = 0
+    row = 0
+    with open(os.path.join(directory, chunks_file), "wb") as f:
+        for page in store.iter_embeddings(doc_id, page_size):
+            vectors = page['embeddings']
+            if matrix is None:
+                dimension = vectors.shape[1]
+                matrix = np.lib.format.open_memmap(os.path.join(directory, embeddings_file), mode="w+",
+                                                   dtype=np.float32, shape=(count, dimension))
+            if row + len(vectors) > count:
+                raise ValueError(f"{doc_id} changed during the export")
+            matrix[row:row + len(vectors)] = vectors
+            for chunk_id, chunk, metadata in zip(page['ids'], page['documents'], page['metadatas']):
+                record = {'id': chunk_id, 'document': chunk, 'metadata': metadata}
+                f.write(json.dumps(record).encode("utf-8") + b"\n")
+            row += len(vectors)
+    if row != count:
+        raise ValueError(f"{doc_id} changed during the export")
+    if matrix is None:
+        np.save(os.path.join(directory, embeddings_file), np.zeros((0, 0), dtype=np.float32))
+    else:
+        matrix.flush()
+    return {'embeddings': embeddings_file, 'chunks': chunks_file, 'chunk_count': count, 'dimension': dimension}
+
+
+def export_documents(directory, doc_ids=None, store=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Export documents with their embeddings, chunks, catalog entries and file names
+
+    Parameters:
+    directory (str): Export directory, created if needed
+    doc_ids (list, optional): Documents to export; all stored documents if None
+    store (VectorStore, optional): Store to read; the configured store if None
+    page_size (int): Chunks read per page
+
+    Returns:
+    dict: The manifest written to the directory
+    """
+    store = store or get_vector_store()
+    os.makedirs(directory, exist_ok=True)
+    entries = store.catalog.list_documents()
+    if doc_ids is not None:
+        wanted = set(doc_ids)
+        entries = [entry for entry in entries if entry['doc_id'] in wanted]
+
+    manifest = {'format': EXPORT_FORMAT, 'version': EXPORT_VERSION, 'documents': []}
+    for n, entry in enumerate(entries):
+        files = export_document(store, entry['doc_id'], directory, f"{n:06d}", page_size)
+        manifest['documents'].append(dict(entry, aliases=store.catalog.aliases(entry['doc_id']), **files))
+        logger.info(f"Exported {files['chunk_count']} chunks of {entry['doc_id']}")
+
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Exported {len(entries)} documents to {directory}")
+    return manifest
+
+
+def _read_pages(directory, entry, page_size):
+    """Yield an exported document's chunks as pages, with rows of its memory-mapped embeddings"""
+    embeddings = np.load(os.path.join(directory, entry['embeddings']), mmap_mode="r")
+    row = 0
+    with open(os.path.join(directory, entry['chunks']), "rb") as f:
+        while True:
+            records = [json.loads(line) for line in islice(f, page_size)]
+            if not records:
+                return
+            yield {
+                'ids': [record['id'] for record in records],
+                'documents': [record['document'] for record in records],
+                'metadatas': [record['metadata'] for record in records],
+                'embeddings': np.asarray(embeddings[row:row + len(records)], dtype=np.float32)
+            }
+            row += len(records)
+
+
+def import_documents(directory, store=None, replace=False, page_size=EXPORT_PAGE_SIZE, embed_model=None):
+    """
+    Import an export directory into a store, keeping the exported embeddings
+
+    File names already pointing at another document keep pointing at it.
+
+    Parameters:
+    directory (str): Export directory
+    store (VectorStore, optional): Store to write; the configured store if None
+    replace (bool): Overwrite documents that are already stored instead of skipping them
+    page_size (int): Chunks written per page
+    embed_model (str, optional): Refuse documents embedded with another model, as their vectors would not match queries
+
+    Returns:
+    dict: Counts of imported and skipped documents and of imported chunks
+    """
+    store = store or get_vector_store()
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != EXPORT_FORMAT or manifest.get('version') != EXPORT_VERSION:
+        raise ValueError(f"{directory} is not a version {EXPORT_VERSION} export")
+    if embed_model:
+        mismatched = {entry['model'] for entry in manifest['documents'] if entry.get('model')} - {embed_model}
+        if mismatched:
+            raise ValueError(f"Export holds embeddings of {sorted(mismatched)}, but this store uses {embed_model}")
+
+    stats = {'imported': 0, 'skipped': 0, 'chunks': 0}
+    for entry in manifest['documents']:
+        doc_id = entry['doc_id']
+        if store.embeddings_exist(doc_id) and not replace:
+            logger.info(f"Skipping {doc_id}, which is already stored")
+            stats['skipped'] += 1
+        else:
+            store.store_document_pages(
+                doc_id,
+                _read_pages(directory, entry, page_size),
+                entry['chunk_count'],
+                file_name=entry.get('file_name'),
+                content_hash=entry.get('content_hash'),
+                model=entry.get('model'),
+                upload_time=entry.get('upload_time')
+            )
+            stats['imported'] += 1
+            stats['chunks'] += entry['chunk_count']
+
+        for alias in entry.get('aliases', []):
+            current = store.resolve_alias(alias)
+            if current and current != doc_id:
+                logger.warning(f"Not importing file name {alias}: it already refers to {current}")
+                continue
+            store.add_alias(alias, doc_id)
+
+    logger.info(f"Imported {stats['imported']} documents ({stats['chunks']} chunks) from {directory}, "
+                f"skipped {stats['skipped']}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("directory")
+    parser.add_argument("--documents", nargs="+", help="File names or doc_ids to export (default: all)")
+    parser.add_argument("--replace", action="store_true", help="Overwrite documents that are already stored")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        doc_ids = None
+        if args.documents:
+            store = get_vector_store()
+            doc_ids = [store.resolve_alias(name) or name for name in args.documents]
+        manifest = export_documents(args.directory, doc_ids, page_size=args.page_size)
+        print(json.dumps({'documents': len(manifest['documents'])}))
+    else:
+        from utils.pdf_processor import EMBED_MODEL
+        stats = import_documents(args.directory, replace=args.replace, page_size=args.page_size,
+                                 embed_model=EMBED_MODEL)
+        print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
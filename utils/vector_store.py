@@ -0,0 +1,252 @@
+import os
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")  # chroma or numpy
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", 1000))  # Chunks read or written per page
+
+# Fields a page of chunks can include besides their ids
+CHUNK_FIELDS = ("documents", "metadatas", "embeddings")
+
+# Process-wide store, created on first use by get_vector_store
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def chunk_key(chunk):
+    """Content-derived key of a chunk; chunk IDs are the doc_id followed by this key"""
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+
+
+class VectorStore(ABC):
+    """
+    Interface shared by the vector store backends
+
+    Backends keep a DocumentCatalog in self.catalog; catalog-only operations
+    (existence checks, listings and file name aliases) are implemented here.
+    """
+
+    catalog = None
+
+    @abstractmethod
+    def store_pdf_data(self, doc_id, chunks, embeddings, metadata=None, file_name=None, content_hash=None, model=None):
+        """Replace all stored chunks of a document"""
+
+    @abstractmethod
+    def sync_pdf_data(self, doc_id, chunks, embed_fn, file_name=None, content_hash=None, model=None, base_doc_id=None):
+        """Store a document, embedding only chunks not stored for base_doc_id; returns kept/added/removed counts"""
+
+    @abstractmethod
+    def stored_chunk_keys(self, doc_id):
+        """Return the content-derived keys of the chunks stored for a document"""
+
+    @abstractmethod
+    def get_similar_chunks(self, query_embedding, n_results=5, doc_id=None, verify_document=True, doc_ids=None):
+        """
+        Return the chunks nearest to the query embedding, as dicts with id, document, metadata and distance
+
+        The search covers doc_id, or the documents in doc_ids, or all documents if neither is given.
+        """
+
+    @abstractmethod
+    def get_similar_chunks_batch(self, query_embeddings, n_results=5, doc_id=None, verify_document=True, doc_ids=None):
+        """Run several queries in one call; returns one get_similar_chunks result list per query, in order"""
+
+    @abstractmethod
+    def get_file_chunks(self, doc_id):
+        """Return all chunks of a document with their metadata"""
+
+    @abstractmethod
+    def get_file_chunks_page(self, doc_id, limit, offset=0, include=("documents", "metadatas")):
+        """
+        Return up to limit chunks of a document, starting at offset in stored order
+
+        Returns:
+        dict: 'ids' and a list per included field; 'embeddings' is a float32 matrix
+        """
+
+    @abstractmethod
+    def store_document_pages(self, doc_id, pages, chunk_count, file_name=None, content_hash=None, model=None,
+                             upload_time=None):
+        """Replace a document with chunks given as pages of ids, documents, metadatas and embeddings, keeping them as given"""
+
+    @abstractmethod
+    def delete_file_data(self, doc_id):
+        """Delete all data for a document, including its file name aliases"""
+
+    @abstractmethod
+    def get_embeddings(self, doc_id):
+        """Return ids, embeddings, documents and metadatas of a document"""
+
+    def iter_file_chunks(self, doc_id, page_size=EXPORT_PAGE_SIZE, include=("documents", "metadatas")):
+        """
+        Yield the chunks of a document page by page, holding one page in memory at a time
+
+        Parameters:
+        doc_id (str): Identity of the document
+        page_size (int): Chunks per page
+        include (tuple): Fields to read besides the ids, from CHUNK_FIELDS
+
+        Returns:
+        generator: Pages as returned by get_file_chunks_page
+        """
+        unknown = set(include) - set(CHUNK_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown chunk fields: {sorted(unknown)}")
+        offset = 0
+        while True:
+            page = self.get_file_chunks_page(doc_id, page_size, offset, include)
+            if page['ids']:
+                yield page
+            if len(page['ids']) < page_size:
+                return
+            offset += len(page['ids'])
+
+    def iter_embeddings(self, doc_id, page_size=EXPORT_PAGE_SIZE):
+        """Yield pages of a document's ids, embeddings, documents and metadatas"""
+        return self.iter_file_chunks(doc_id, page_size, include=CHUNK_FIELDS)
+
+    def _search_scope(self, doc_id, doc_ids, verify_document):
+        """
+        Resolve the documents a search covers
+
+        Returns:
+        list: doc_ids to search, or None to search all documents
+        """
+        if doc_id:
+            doc_ids = [doc_id]
+        if doc_ids is None:
+            return None
+        doc_ids = list(dict.fromkeys(doc_ids))
+        if verify_document:
+            found = self.catalog.existing(doc_ids)
+            if len(found) < len(doc_ids):
+                logger.warning(f"Requested documents not found in store: {[d for d in doc_ids if d not in found]}")
+            doc_ids = [candidate for candidate in doc_ids if candidate in found]
+        return doc_ids
+
+    @staticmethod
+    def _chunk_ids(doc_id, chunks):
+        """Derive chunk IDs from chunk content, numbering repeated texts within a document"""
+        ids = []
+        seen = {}
+        for chunk in chunks:
+            key = chunk_key(chunk)
+            occurrence = seen.get(key, 0)
+            seen[key] = occurrence + 1
+            ids.append(f"{doc_id}_{key}" if occurrence == 0 else f"{doc_id}_{key}_{occurrence}")
+        return ids
+
+    @staticmethod
+    def _chunk_metadatas(doc_id, file_name, chunks, timestamp):
+        """Build the metadata stored with each chunk"""
+        return [{
+            "doc_id": doc_id,
+            "file_name": file_name,
+            "chunk_index": i,
+            "timestamp": timestamp,  # Same timestamp for all chunks of a file
+            "total_chunks": len(chunks),
+            "chunk_size": len(chunk)
+        } for i, chunk in enumerate(chunks)]
+
+    def list_available_pdfs(self):
+        """
+        List all available PDF documents with their metadata
+
+        Returns:
+        list: List of PDF documents with their metadata
+        """
+        try:
+            # Read one catalog row per file name instead of every chunk
+            pdf_list = [{
+                'file_name': entry['file_name'],
+                'doc_id': entry['doc_id'],
+                'total_chunks': entry['chunk_count'],
+                'upload_time': entry['upload_time'],
+                'chunk_count': entry['chunk_count'],
+                'content_hash': entry['content_hash'],
+                'model': entry['model']
+            } for entry in self.catalog.list()]
+
+            logging.info(f"Found {len(pdf_list)} PDFs in the document catalog")
+            return pdf_list
+
+        except Exception as e:
+            logging.error(f"Error listing available PDFs: {str(e)}")
+            raise
+
+    def embeddings_exist(self, doc_id: str) -> bool:
+        """Check if embeddings exist for a document"""
+        try:
+            return self.catalog.exists(doc_id)
+        except Exception as e:
+            logger.error(f"Error checking embeddings existence: {str(e)}")
+            return False
+
+    def add_alias(self, file_name, doc_id):
+        """
+        Record a file name as an alias of a document
+
+        Returns:
+        str: The doc_id the file name pointed at before, or None
+        """
+        return self.catalog.set_alias(file_name, doc_id)
+
+    def resolve_alias(self, file_name):
+        """Return the doc_id a file name points at, or None"""
+        return self.catalog.resolve_alias(file_name)
+
+    def remove_alias(self, file_name):
+        """
+        Remove a file name alias
+
+        Returns:
+        int: Number of file names still pointing at the document
+        """
+        doc_id = self.catalog.resolve_alias(file_name)
+        self.catalog.remove_alias(file_name)
+        return self.catalog.alias_count(doc_id) if doc_id else 0
+
+
+def create_vector_store(backend=VECTOR_BACKEND):
+    """
+    Create the vector store selected by configuration
+
+    Parameters:
+    backend (str): "chroma" for ChromaDB or "numpy" for in-process exact search
+
+    Returns:
+    VectorStore: The configured backend
+    """
+    if backend == "chroma":
+        from utils.chroma_store import ChromaStore
+        return ChromaStore()
+    if backend == "numpy":
+        from utils.numpy_store import NumpyStore
+        return NumpyStore()
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+def get_vector_store():
+    """
+    Return the vector store shared by the whole process, creating it on first use
+
+    The backend and its client library are only imported here, so importing the
+    app stays cheap and every module ends up with the same store.
+
+    Returns:
+    VectorStore: The configured backend
+    """
+    global _shared_store
+    if _shared_store is None:
+        with _shared_store_lock:
+            if _shared_store is None:
+                _shared_store = create_vector_store()
+                logger.info(f"Created {type(_shared_store).__name__} vector store")
+    return _shared_store